@@ -1,10 +1,14 @@
+import os
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config, pool
 
 from alembic import context
 from app.models.base import Base
+from app.models.refresh_token import RefreshToken  # noqa: F401
+from app.models.revoked_token import RevokedToken  # noqa: F401
 from app.models.user import User  # noqa: F401
+from app.models.user_counter import UserCounter  # noqa: F401
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
@@ -15,6 +19,10 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# A aplicação não cria mais tabelas ao iniciar; as migrações usam o mesmo banco
+if os.getenv("DATABASE_URL"):
+    config.set_main_option("sqlalchemy.url", os.environ["DATABASE_URL"])
+
 # add your model's MetaData object here
 # for 'autogenerate' support
 # from myapp import mymodel
@@ -23,9 +23,10 @@ depends_on: Union[str, Sequence[str], None] = None
 def upgrade() -> None:
     """Upgrade schema."""
     # ### commands auto generated by Alembic - please adjust! ###
-    op.drop_index(op.f("idx_users_email"), table_name="users")
-    op.drop_index(op.f("idx_users_nome"), table_name="users")
-    op.drop_table("users")
+    # Remove a tabela criada por sql/create_tables.sql, se existir
+    op.drop_index(op.f("idx_users_email"), table_name="users", if_exists=True)
+    op.drop_index(op.f("idx_users_nome"), table_name="users", if_exists=True)
+    op.drop_table("users", if_exists=True)
     # ### end Alembic commands ###
 
 
@@ -0,0 +1,27 @@
+"""Add users (nome, id) index for keyset pagination
+
+Revision ID: 7b2e4d1a9c35
+Revises: 5e8d2a4c6f10
+Create Date: 2026-10-18 11:20:05.861347
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "7b2e4d1a9c35"
+down_revision: Union[str, Sequence[str], None] = "5e8d2a4c6f10"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index("ix_users_nome_id", "users", ["nome", "id"], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_users_nome_id", table_name="users")
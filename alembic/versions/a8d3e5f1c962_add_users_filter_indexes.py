@@ -0,0 +1,76 @@
+"""Add users.email_domain and indexes for GET /users filters and sorts
+
+Revision ID: a8d3e5f1c962
+Revises: f5c1d8e6a247
+Create Date: 2026-10-18 17:02:44.518306
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "a8d3e5f1c962"
+down_revision: Union[str, Sequence[str], None] = "f5c1d8e6a247"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {
+    "ix_users_created_at_id": ["created_at", "id"],
+    "ix_users_role_id": ["role", "id"],
+    "ix_users_role_nome_id": ["role", "nome", "id"],
+    "ix_users_role_created_at_id": ["role", "created_at", "id"],
+    "ix_users_email_domain_id": ["email_domain", "id"],
+}
+
+# Triggers da busca FTS5 (c4f7a2d9e813), apagados junto com a tabela users
+# quando o SQLite a recria
+SQLITE_FTS_TRIGGERS = (
+    "CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN "
+    "INSERT INTO users_fts(rowid, nome, email) "
+    "VALUES (new.id, new.nome, new.email); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, nome, email) "
+    "VALUES ('delete', old.id, old.nome, old.email); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, nome, email) "
+    "VALUES ('delete', old.id, old.nome, old.email); "
+    "INSERT INTO users_fts(rowid, nome, email) "
+    "VALUES (new.id, new.nome, new.email); END",
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_bind().dialect.name
+    op.add_column("users", sa.Column("email_domain", sa.String(100), nullable=True))
+    # Tudo depois do último @, como app.models.user.email_domain
+    if dialect == "postgresql":
+        op.execute("UPDATE users SET email_domain = lower(substring(email, '[^@]*$'))")
+    else:
+        # rtrim tira do fim tudo que não é @ e deixa o email até o último @
+        op.execute(
+            "UPDATE users SET email_domain = lower(substr(email, "
+            "length(rtrim(email, replace(email, '@', ''))) + 1))"
+        )
+    # No SQLite o ALTER COLUMN é feito recriando a tabela
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.alter_column(
+            "email_domain", existing_type=sa.String(100), nullable=False
+        )
+    if dialect == "sqlite":
+        for statement in SQLITE_FTS_TRIGGERS:
+            op.execute(statement)
+
+    for name, columns in INDEXES.items():
+        op.create_index(name, "users", columns, unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for name in reversed(list(INDEXES)):
+        op.drop_index(name, table_name="users")
+    op.drop_column("users", "email_domain")
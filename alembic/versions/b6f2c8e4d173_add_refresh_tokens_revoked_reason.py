@@ -0,0 +1,34 @@
+"""Add refresh_tokens.revoked_reason
+
+Revision ID: b6f2c8e4d173
+Revises: a8d3e5f1c962
+Create Date: 2026-10-18 21:14:07.302915
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "b6f2c8e4d173"
+down_revision: Union[str, Sequence[str], None] = "a8d3e5f1c962"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Tokens revogados antes desta coluna ficam sem motivo e, reapresentados,
+    # são apenas recusados
+    op.add_column(
+        "refresh_tokens",
+        sa.Column("revoked_reason", sa.String(20), nullable=True),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("refresh_tokens", "revoked_reason")
@@ -0,0 +1,64 @@
+"""Add users.created_at and user_counters table
+
+Revision ID: e2a9b7c3d481
+Revises: c4f7a2d9e813
+Create Date: 2026-10-18 14:26:52.318840
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "e2a9b7c3d481"
+down_revision: Union[str, Sequence[str], None] = "c4f7a2d9e813"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    dialect = op.get_bind().dialect.name
+    # O SQLite não aceita ADD COLUMN com default não constante; preenche depois.
+    # A data de cadastro dos usuários existentes é desconhecida: recebem
+    # app.models.user.LEGACY_CREATED_AT, que não conta nos cadastros por dia
+    # nem nos filtros por data (no SQLite, no formato gravado pelo SQLAlchemy)
+    op.add_column(
+        "users", sa.Column("created_at", sa.DateTime(timezone=True), nullable=True)
+    )
+    if dialect == "sqlite":
+        op.execute("UPDATE users SET created_at = '1970-01-01 00:00:00.000000'")
+    else:
+        op.execute("UPDATE users SET created_at = '1970-01-01 00:00:00+00'")
+        op.alter_column("users", "created_at", nullable=False)
+
+    op.create_table(
+        "user_counters",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("name", sa.String(length=64), nullable=False),
+        sa.Column("value", sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("name"),
+    )
+    op.create_index(op.f("ix_user_counters_id"), "user_counters", ["id"])
+
+    # Contadores iniciais a partir dos usuários existentes
+    op.execute(
+        "INSERT INTO user_counters (name, value) SELECT 'total', count(*) FROM users"
+    )
+    op.execute(
+        "INSERT INTO user_counters (name, value) "
+        "SELECT 'role:' || role, count(*) FROM users GROUP BY role"
+    )
+    # Sem contadores signups:<dia>: nenhum usuário existente tem data de
+    # cadastro conhecida
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_user_counters_id"), table_name="user_counters")
+    op.drop_table("user_counters")
+    op.drop_column("users", "created_at")
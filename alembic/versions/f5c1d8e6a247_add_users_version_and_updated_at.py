@@ -0,0 +1,39 @@
+"""Add users.version and users.updated_at
+
+Revision ID: f5c1d8e6a247
+Revises: e2a9b7c3d481
+Create Date: 2026-10-18 15:41:08.902615
+
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = "f5c1d8e6a247"
+down_revision: Union[str, Sequence[str], None] = "e2a9b7c3d481"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "users",
+        sa.Column("version", sa.Integer(), server_default="1", nullable=False),
+    )
+    op.add_column(
+        "users", sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True)
+    )
+    op.execute("UPDATE users SET updated_at = created_at")
+    if op.get_bind().dialect.name != "sqlite":
+        op.alter_column("users", "updated_at", nullable=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("users", "updated_at")
+    op.drop_column("users", "version")
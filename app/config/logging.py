@@ -4,10 +4,6 @@ import sys
 from datetime import datetime
 from pathlib import Path
 
-# IMPORTANTE: Definir TESTING antes de qualquer import da aplicação
-os.environ["TESTING"] = "True"
-os.environ["LOG_LEVEL"] = "ERROR"
-
 
 def setup_logging():
     # Se estiver em ambiente de teste, usa configuração simples
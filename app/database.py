@@ -1,26 +1,465 @@
+import itertools
+import logging
 import os
-from typing import Generator
+import threading
+import time
+from collections import OrderedDict
+from typing import AsyncGenerator, Generator, List, Optional
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
+from fastapi import Depends, Request
+from sqlalchemy import Engine, create_engine, event, make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
 from sqlalchemy.orm import Session, sessionmaker
-
-from app.models.base import Base
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Drivers async equivalentes aos drivers síncronos suportados
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def to_async_url(url: str) -> str:
+    """
+    Converte uma URL síncrona (psycopg2/pysqlite) na URL do driver async.
+    """
+    parsed = make_url(url)
+    drivername = ASYNC_DRIVERS.get(parsed.get_backend_name(), parsed.drivername)
+    return parsed.set(drivername=drivername).render_as_string(hide_password=False)
+
+
+# Permite apontar a camada async para outro driver/URL explicitamente
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+# Configuração do pool de conexões (por processo/worker)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_POOL_USE_LIFO = os.getenv("DB_POOL_USE_LIFO", "false").lower() == "true"
+
+# Réplicas de leitura (URLs síncronas separadas por vírgula, como DATABASE_URL)
+DATABASE_REPLICA_URLS = [
+    url.strip()
+    for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+    if url.strip()
+]
+# Por quanto tempo uma réplica que falhou deixa de receber leituras
+DB_REPLICA_RETRY_SECONDS = float(os.getenv("DB_REPLICA_RETRY_SECONDS", "30"))
+# Por quanto tempo, depois de uma escrita, o mesmo cliente lê do primário
+DB_READ_YOUR_WRITES_SECONDS = float(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+# Cabeçalho com que o cliente força a leitura no primário
+READ_CONSISTENCY_HEADER = "X-Read-Consistency"
+
+
+class PoolMetrics:
+    """
+    Métricas de um pool de conexões: tempo de espera no checkout, conexões em
+    uso e uso do overflow.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.peak_checked_out = 0
+        self.peak_overflow = 0
+
+    def record_wait(self, wait: float, timed_out: bool = False):
+        with self._lock:
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if timed_out:
+                self.timeouts += 1
+
+    def record_checkout(self, pool):
+        with self._lock:
+            self.checkouts += 1
+            self.peak_checked_out = max(self.peak_checked_out, pool.checkedout())
+            self.peak_overflow = max(self.peak_overflow, max(pool.overflow(), 0))
+
+    def record_checkin(self):
+        with self._lock:
+            self.checkins += 1
+
+    def snapshot(self, pool) -> dict:
+        with self._lock:
+            waits = (self.checkouts + self.timeouts) or 1
+            stats = {
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "timeouts": self.timeouts,
+                "avg_checkout_wait_ms": self.total_wait / waits * 1000,
+                "max_checkout_wait_ms": self.max_wait * 1000,
+                "peak_checked_out": self.peak_checked_out,
+                "peak_overflow": self.peak_overflow,
+            }
+        if isinstance(pool, QueuePool):
+            stats.update(
+                {
+                    "pool_size": pool.size(),
+                    "checked_in": pool.checkedin(),
+                    "checked_out": pool.checkedout(),
+                    "overflow": max(pool.overflow(), 0),
+                }
+            )
+        return stats
+
+
+class _InstrumentedPoolMixin:
+    """Mede o tempo de espera por uma conexão livre no pool."""
+
+    metrics: PoolMetrics
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record_wait(time.perf_counter() - start, timed_out=True)
+            raise
+        self.metrics.record_wait(time.perf_counter() - start)
+        return connection
+
+    def recreate(self):
+        # engine.dispose() recria o pool; as métricas continuam as mesmas
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class InstrumentedQueuePool(_InstrumentedPoolMixin, QueuePool):
+    pass
+
+
+class InstrumentedAsyncQueuePool(_InstrumentedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+# Engines instrumentados, por nome, para exposição das métricas
+instrumented_engines: dict[str, Engine] = {}
+
+
+def _pool_options(url: str) -> dict:
+    if make_url(url).database in (None, "", ":memory:"):
+        # SQLite em memória usa um pool próprio, sem tamanho configurável
+        return {}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_use_lifo": DB_POOL_USE_LIFO,
+    }
+
+
+def _instrument(name: str, sync_engine: Engine) -> None:
+    if not isinstance(sync_engine.pool, _InstrumentedPoolMixin):
+        return
+    metrics = PoolMetrics()
+    sync_engine.pool.metrics = metrics
+
+    @event.listens_for(sync_engine, "checkout")
+    def on_checkout(*args):
+        metrics.record_checkout(sync_engine.pool)
+
+    @event.listens_for(sync_engine, "checkin")
+    def on_checkin(*args):
+        metrics.record_checkin()
+
+    instrumented_engines[name] = sync_engine
+
+
+def create_instrumented_engine(name: str, url: str, **kwargs) -> Engine:
+    """
+    Cria um engine síncrono com o pool configurado por variáveis de ambiente
+    (DB_POOL_*) e instrumentado. `kwargs` sobrescreve a configuração.
+    """
+    options = {**_pool_options(url), **kwargs}
+    if "pool_size" in options:
+        options.setdefault("poolclass", InstrumentedQueuePool)
+    if url.startswith("sqlite"):
+        # Endpoints async usam a sessão fora da thread que a criou
+        options.setdefault("connect_args", {"check_same_thread": False})
+    sync_engine = create_engine(url, **options)
+    _instrument(name, sync_engine)
+    return sync_engine
+
+
+def create_instrumented_async_engine(name: str, url: str, **kwargs) -> AsyncEngine:
+    """Equivalente async de create_instrumented_engine."""
+    options = {**_pool_options(url), **kwargs}
+    if "pool_size" in options:
+        options.setdefault("poolclass", InstrumentedAsyncQueuePool)
+    async_engine_ = create_async_engine(url, **options)
+    _instrument(name, async_engine_.sync_engine)
+    return async_engine_
+
+
+def get_pool_stats() -> dict:
+    return {
+        name: sync_engine.pool.metrics.snapshot(sync_engine.pool)
+        for name, sync_engine in instrumented_engines.items()
+    }
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+
+# Engines e sessionmakers são criados no primeiro uso: importar a aplicação
+# não abre conexões nem carrega drivers. O schema é gerenciado pelo Alembic.
+_engine: Optional[Engine] = None
+_async_engine: Optional[AsyncEngine] = None
+_session_factory: Optional[sessionmaker] = None
+_async_session_factory: Optional[async_sessionmaker] = None
+_lock = threading.Lock()
+
+
+def get_engine() -> Engine:
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                _engine = create_instrumented_engine("primary", DATABASE_URL)
+    return _engine
+
+
+def get_async_engine() -> AsyncEngine:
+    global _async_engine
+    if _async_engine is None:
+        with _lock:
+            if _async_engine is None:
+                _async_engine = create_instrumented_async_engine(
+                    "primary_async", ASYNC_DATABASE_URL
+                )
+    return _async_engine
+
+
+def get_sessionmaker() -> sessionmaker:
+    global _session_factory
+    if _session_factory is None:
+        _session_factory = sessionmaker(
+            autocommit=False, autoflush=False, bind=get_engine()
+        )
+    return _session_factory
+
+
+def get_async_sessionmaker() -> async_sessionmaker:
+    global _async_session_factory
+    if _async_session_factory is None:
+        _async_session_factory = async_sessionmaker(
+            get_async_engine(), autoflush=False, expire_on_commit=False
+        )
+    return _async_session_factory
+
+
+class ReplicaSet:
+    """
+    Réplicas de leitura usadas em round-robin.
+
+    Uma réplica que falha ao conectar fica fora do rodízio por `retry_after`
+    segundos e a leitura passa para a próxima; sem nenhuma disponível, a
+    leitura volta para o primário. Os engines são criados no primeiro uso.
+
+    Também registra, por cliente, as escritas recentes: durante
+    `read_your_writes` segundos depois de uma escrita o cliente lê do primário,
+    que já tem os dados que a réplica talvez ainda não recebeu. O registro é
+    local ao worker; o cabeçalho `X-Read-Consistency: strong` força a leitura
+    no primário em qualquer worker.
+    """
+
+    def __init__(
+        self,
+        urls: List[str],
+        retry_after: float = DB_REPLICA_RETRY_SECONDS,
+        read_your_writes: float = DB_READ_YOUR_WRITES_SECONDS,
+    ):
+        self.urls = list(urls)
+        self.retry_after = retry_after
+        self.read_your_writes = read_your_writes
+        self.reads = [0] * len(self.urls)
+        self.failures = [0] * len(self.urls)
+        self.primary_reads = 0
+        self._sessionmakers: List[Optional[async_sessionmaker]] = [None] * len(urls)
+        self._down_until = [0.0] * len(self.urls)
+        self._next = itertools.count()
+        self._recent_writes: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _sessionmaker(self, index: int) -> async_sessionmaker:
+        if self._sessionmakers[index] is None:
+            with self._lock:
+                if self._sessionmakers[index] is None:
+                    replica_engine = create_instrumented_async_engine(
+                        f"replica_{index}", to_async_url(self.urls[index])
+                    )
+                    self._sessionmakers[index] = async_sessionmaker(
+                        replica_engine, autoflush=False, expire_on_commit=False
+                    )
+        return self._sessionmakers[index]
+
+    def _candidates(self) -> List[int]:
+        # Começa na próxima réplica do rodízio e pula as que estão fora dele
+        start = next(self._next)
+        now = time.monotonic()
+        order = [(start + offset) % len(self.urls) for offset in range(len(self.urls))]
+        return [index for index in order if self._down_until[index] <= now]
+
+    async def open_session(self) -> Optional[AsyncSession]:
+        """
+        Abre uma sessão já conectada na próxima réplica disponível, ou retorna
+        None se nenhuma conseguir conectar.
+        """
+        for index in self._candidates():
+            db = self._sessionmaker(index)()
+            try:
+                await db.connection()
+            except (DBAPIError, OSError) as e:
+                await db.close()
+                self.failures[index] += 1
+                self._down_until[index] = time.monotonic() + self.retry_after
+                logger.warning(f"Réplica {index} indisponível, usando a próxima: {e}")
+                continue
+            self.reads[index] += 1
+            db.info["replica"] = index
+            return db
+        return None
+
+    def record_write(self, client: str) -> None:
+        if self.read_your_writes <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._recent_writes[client] = now + self.read_your_writes
+            self._recent_writes.move_to_end(client)
+            # A janela é a mesma para todos, então as entradas vencidas são
+            # sempre as mais antigas
+            while next(iter(self._recent_writes.values())) <= now:
+                self._recent_writes.popitem(last=False)
+
+    def recently_wrote(self, client: str) -> bool:
+        expires_at = self._recent_writes.get(client)
+        return expires_at is not None and expires_at > time.monotonic()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "primary_reads": self.primary_reads,
+            "replicas": [
+                {
+                    "replica": index,
+                    "available": self._down_until[index] <= now,
+                    "reads": self.reads[index],
+                    "failures": self.failures[index],
+                }
+                for index in range(len(self.urls))
+            ],
+            "recent_writers": len(self._recent_writes),
+        }
+
+    async def dispose(self) -> None:
+        for factory in self._sessionmakers:
+            if factory is not None:
+                await factory.kw["bind"].dispose()
+
+
+# Sem DATABASE_REPLICA_URLS, todas as leituras vão para o primário
+replica_set: Optional[ReplicaSet] = (
+    ReplicaSet(DATABASE_REPLICA_URLS) if DATABASE_REPLICA_URLS else None
+)
+
+
+def is_replica_session(db: AsyncSession) -> bool:
+    """Se a sessão foi aberta em uma réplica por `get_read_db`."""
+    return "replica" in db.info
+
+
+def read_client_key(request) -> str:
+    """
+    Identifica o cliente para a leitura das próprias escritas: o token de
+    acesso, ou o endereço de origem em requisições anônimas.
+    """
+    authorization = request.headers.get("authorization")
+    if authorization:
+        return authorization
+    return request.client.host if request.client else ""
+
+
+async def dispose_engines() -> None:
+    """Fecha as conexões abertas pelos engines já criados."""
+    if replica_set is not None:
+        await replica_set.dispose()
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    if _engine is not None:
+        _engine.dispose()
+
+
+def __getattr__(name: str):
+    # Compatibilidade com `from app.database import engine, SessionLocal`
+    lazy_attributes = {
+        "engine": get_engine,
+        "async_engine": get_async_engine,
+        "SessionLocal": get_sessionmaker,
+        "AsyncSessionLocal": get_async_sessionmaker,
+    }
+    if name in lazy_attributes:
+        return lazy_attributes[name]()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def get_db() -> Generator[Session, None, None]:
-    db = SessionLocal()
+    db = get_sessionmaker()()
     try:
         yield db
     finally:
         db.close()
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+
+async def get_read_db(
+    request: Request, primary: AsyncSession = Depends(get_async_db)
+) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Sessão para endpoints somente leitura: uma réplica, quando configuradas,
+    ou o primário.
+
+    Lê do primário quando o cliente pede `X-Read-Consistency: strong`, quando
+    escreveu há pouco ou quando nenhuma réplica está disponível. A sessão do
+    primário só abre conexão se for usada.
+    """
+    replicas = replica_set
+    if (
+        replicas is None
+        or request.headers.get(READ_CONSISTENCY_HEADER, "").lower() == "strong"
+        or replicas.recently_wrote(read_client_key(request))
+    ):
+        if replicas is not None:
+            replicas.primary_reads += 1
+        yield primary
+        return
+
+    db = await replicas.open_session()
+    if db is None:
+        replicas.primary_reads += 1
+        yield primary
+        return
+    async with db:
+        yield db
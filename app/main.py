@@ -1,61 +1,78 @@
-import os
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 
 from dotenv import load_dotenv
-from fastapi import Depends, FastAPI
+from fastapi import APIRouter, Depends, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
+from fastapi.responses import JSONResponse
 from slowapi.errors import RateLimitExceeded
 from sqlalchemy import text
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config.logging import setup_logging
-from app.database import get_db
-from app.routers import auth, users
+from app.database import dispose_engines, get_async_sessionmaker, get_read_db
+from app.routers import auth, metrics, users
+from app.services.password_hasher import HashingPoolSaturated, password_hasher
+from app.services.user_search_index import (
+    USER_SEARCH_INDEX_REFRESH_SECONDS,
+    user_search_index,
+)
+from app.services.user_service import UserService, run_index_refresh
+from app.services.user_stats import USER_STATS_RECONCILE_SECONDS, run_reconciliation
 
 from .middleware.rate_limit import _rate_limit_exceeded_handler, limiter
-
-# Ativa o sistema de logging antes de qualquer outra coisa
-logger = setup_logging()
+from .middleware.read_your_writes import ReadYourWritesMiddleware
 
 load_dotenv()
 
-DATABASE_URL = os.getenv("DATABASE_URL")
-
-app = FastAPI(
-    title="CRUD OAuth API",
-    description="API para templates de CRUD com autenticação OAuth2",
-    version="1.0.0",
-    docs_url="/docs",
-    redoc_url="/redoc",
-    openapi_tags=[
-        {"name": "Auth", "description": "Operações de autenticação"},
-        {"name": "Users", "description": "Gerenciamento de usuários"},
-        {"name": "Home", "description": "Página inicial da API"},
-        {"name": "Health Check", "description": "Verificação de saúde da API"},
-    ],
-)
-
-# Incluir routers
-app.include_router(users.router)
-app.include_router(auth.router)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:3000"],  # Frontend URLs
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-app.add_middleware(
-    TrustedHostMiddleware, allowed_hosts=["localhost", "127.0.0.1", "testserver", "*"]
-)
-
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-
-
-@app.get("/", tags=["Home"])
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Ajusta o custo do bcrypt ao hardware antes de atender requisições
+    password_hasher.calibrate()
+    if user_search_index.enabled:
+        async with get_async_sessionmaker()() as db:
+            await user_search_index.build(UserService(db).stream_users())
+    # Reconstrói o índice para trazer as escritas feitas em outros workers
+    index_refresh = None
+    if user_search_index.enabled and USER_SEARCH_INDEX_REFRESH_SECONDS > 0:
+        index_refresh = asyncio.create_task(
+            run_index_refresh(
+                get_async_sessionmaker(), USER_SEARCH_INDEX_REFRESH_SECONDS
+            )
+        )
+    # Corrige periodicamente desvios nos contadores de usuários
+    reconciliation = None
+    if USER_STATS_RECONCILE_SECONDS > 0:
+        reconciliation = asyncio.create_task(
+            run_reconciliation(get_async_sessionmaker(), USER_STATS_RECONCILE_SECONDS)
+        )
+    yield
+    if reconciliation is not None:
+        reconciliation.cancel()
+    if index_refresh is not None:
+        index_refresh.cancel()
+    # Encerra os processos do pool de hashing junto com o worker
+    password_hasher.shutdown()
+    await dispose_engines()
+
+
+async def hashing_pool_saturated_handler(request: Request, exc: HashingPoolSaturated):
+    logger.warning(f"Pool de hashing saturado: {request.url.path}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Serviço temporariamente sobrecarregado"},
+        headers={"Retry-After": "1"},
+    )
+
+
+@router.get("/", tags=["Home"])
 def home():
     """
     Rota de boas-vindas da API.
@@ -66,13 +83,16 @@ def home():
     return {"message": "API rodando com sucesso!"}
 
 
-@app.get("/health", tags=["Health Check"])
-def health_check(db: Session = Depends(get_db)):
+@router.get("/health", tags=["Health Check"])
+async def health_check(db: AsyncSession = Depends(get_read_db)):
     """
     Verifica o status de saúde da aplicação e conexão com o banco de dados.
 
+    Com réplicas de leitura configuradas, a verificação usa a mesma rota das
+    leituras: uma réplica disponível ou, sem nenhuma, o primário.
+
     Args:
-        db (Session): Sessão do banco de dados injetada via dependency injection
+        db (AsyncSession): Sessão do banco de dados injetada via dependency injection
 
     Returns:
         dict: Status da aplicação - "healthy" se tudo estiver funcionando,
@@ -82,7 +102,71 @@ def health_check(db: Session = Depends(get_db)):
         Não levanta exceções, retorna status de erro no JSON
     """
     try:
-        db.execute(text("SELECT 1"))
+        await db.execute(text("SELECT 1"))
         return {"status": "healthy", "health": True}
     except Exception as e:
         return {"status": "unhealthy", "error": str(e)}
+
+
+def create_app() -> FastAPI:
+    """
+    Monta a aplicação FastAPI.
+
+    Nenhuma conexão com o banco é aberta aqui: os engines são criados no
+    primeiro uso e o schema é gerenciado pelo Alembic (`alembic upgrade head`).
+    """
+    # Ativa o sistema de logging antes de qualquer outra coisa
+    setup_logging()
+
+    app = FastAPI(
+        lifespan=lifespan,
+        title="CRUD OAuth API",
+        description="API para templates de CRUD com autenticação OAuth2",
+        version="1.0.0",
+        docs_url="/docs",
+        redoc_url="/redoc",
+        openapi_tags=[
+            {"name": "Auth", "description": "Operações de autenticação"},
+            {"name": "Users", "description": "Gerenciamento de usuários"},
+            {"name": "Home", "description": "Página inicial da API"},
+            {"name": "Health Check", "description": "Verificação de saúde da API"},
+            {"name": "Metrics", "description": "Métricas internas da aplicação"},
+        ],
+    )
+
+    # Incluir routers
+    app.include_router(router)
+    app.include_router(users.router)
+    app.include_router(auth.router)
+    app.include_router(metrics.router)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["http://localhost:3000"],  # Frontend URLs
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    app.add_middleware(ReadYourWritesMiddleware)
+
+    app.add_middleware(
+        TrustedHostMiddleware,
+        allowed_hosts=["localhost", "127.0.0.1", "testserver", "*"],
+    )
+
+    app.state.limiter = limiter
+    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+    app.add_exception_handler(HashingPoolSaturated, hashing_pool_saturated_handler)
+
+    return app
+
+
+def __getattr__(name: str):
+    # `uvicorn app.main:app` e `from app.main import app` continuam funcionando;
+    # a aplicação só é montada quando alguém a pede.
+    if name == "app":
+        app = create_app()
+        globals()["app"] = app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,40 +1,153 @@
+import asyncio
+import functools
 import os
+import threading
+import time
+from collections import OrderedDict
 
+import jwt
+from limits import RateLimitItem
 from slowapi import Limiter, _rate_limit_exceeded_handler
+from slowapi.errors import RateLimitExceeded
 from slowapi.util import get_remote_address
+from slowapi.wrappers import LimitGroup
 
+from app.services.auth_service import ALGORITHM, SECRET_KEY
+from app.services.token_cache import token_cache
 
-def get_identifier(request):
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Armazenamento compartilhado entre workers, ex.: redis://localhost:6379/1. Com
+# memory:// cada worker conta sozinho e o limite efetivo é multiplicado.
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI", "memory://")
+# sliding-window-counter roda como script Lua atômico no Redis
+RATE_LIMIT_STRATEGY = os.getenv("RATE_LIMIT_STRATEGY", "sliding-window-counter")
+# Quantidade máxima de token buckets locais por worker
+RATE_LIMIT_LOCAL_BUCKETS = int(os.getenv("RATE_LIMIT_LOCAL_BUCKETS", "10000"))
+
+
+def rate_limit_key(request) -> str:
     """
-    Função para identificar requests únicos.
-    Em ambiente de teste, usa um identificador que permite mais requests.
+    Identifica o cliente de uma requisição: o `sub` do JWT em rotas
+    autenticadas, ou o endereço de origem quando não há um token válido.
+
+    O token é procurado primeiro no token_cache; um token decodificado aqui
+    entra no cache e não é decodificado de novo por `AuthService.verify_token`.
     """
-    if os.getenv("TESTING", False):
-        return "test-unlimited"  # Identificador especial para testes
+    authorization = request.headers.get("authorization", "")
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() == "bearer" and token:
+        payload = token_cache.get(token)
+        if payload is None:
+            try:
+                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            except jwt.PyJWTError:
+                payload = {}
+            if payload.get("sub"):
+                token_cache.put(token, payload)
+        if payload.get("sub"):
+            return f"user:{payload['sub']}"
     return get_remote_address(request)
 
 
-# Configuração diferente para teste vs produção
-if os.getenv("TESTING", False):
-    # Em testes: limites muito altos
-    limiter = Limiter(key_func=get_identifier, default_limits=["10000/minute"])
-else:
-    # Em produção: limites normais
-    limiter = Limiter(key_func=get_identifier)
+class LocalTokenBuckets:
+    """
+    Token buckets por worker, consultados antes do armazenamento compartilhado.
+
+    Cada bucket tem a capacidade e a taxa de reposição do próprio limite, então
+    um cliente que o esvaziou já passou do limite global e é recusado sem ir ao
+    Redis. Buckets removidos por falta de espaço voltam cheios, o que só deixa
+    a decisão para o armazenamento compartilhado.
+    """
+
+    def __init__(self, max_size: int = RATE_LIMIT_LOCAL_BUCKETS):
+        self.max_size = max_size
+        self.rejected = 0
+        self._buckets: OrderedDict[tuple, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key: tuple, limit: RateLimitItem) -> bool:
+        capacity = float(limit.amount)
+        refill_per_second = capacity / limit.get_expiry()
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * refill_per_second)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            else:
+                self.rejected += 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_size:
+                self._buckets.popitem(last=False)
+            return allowed
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+limiter = Limiter(
+    key_func=rate_limit_key,
+    storage_uri=RATE_LIMIT_STORAGE_URI,
+    strategy=RATE_LIMIT_STRATEGY,
+    enabled=RATE_LIMIT_ENABLED,
+    # Com o armazenamento fora do ar a requisição segue, limitada só pelo
+    # token bucket local
+    swallow_errors=True,
+)
+local_buckets = LocalTokenBuckets()
 
 
 def conditional_limit(rate: str):
     """
-    Aplica rate limiting apenas se não estiver em ambiente de teste.
+    Aplica o limite `rate` à rota, contado no armazenamento compartilhado e
+    precedido pelo token bucket local. Não limita com RATE_LIMIT_ENABLED=false.
     """
+    limits = list(
+        LimitGroup(
+            limit_provider=rate,
+            key_function=rate_limit_key,
+            scope=None,
+            per_method=False,
+            methods=None,
+            error_message=None,
+            exempt_when=None,
+            cost=1,
+            override_defaults=False,
+        )
+    )
+
+    def precheck(name: str, request) -> None:
+        if not limiter.enabled:
+            return
+        for limit in limits:
+            key = (name, limit.key_func(request), str(limit.limit))
+            if not local_buckets.consume(key, limit.limit):
+                # Lido pelo handler de 429 para montar os cabeçalhos
+                request.state.view_rate_limit = None
+                raise RateLimitExceeded(limit)
 
     def decorator(func):
-        if os.getenv("TESTING", False):
-            # Em testes, retorna a função original sem decorar
-            return func
-        else:
-            # Em produção, aplica o rate limiting
-            return limiter.limit(rate)(func)
+        name = f"{func.__module__}.{func.__name__}"
+        limited = limiter.limit(rate)(func)
+
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                precheck(name, kwargs["request"])
+                return await limited(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def sync_wrapper(*args, **kwargs):
+            precheck(name, kwargs["request"])
+            return limited(*args, **kwargs)
+
+        return sync_wrapper
 
     return decorator
 
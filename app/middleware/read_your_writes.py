@@ -0,0 +1,38 @@
+from starlette.requests import Request
+
+from app import database
+
+# Métodos que não alteram dados e não contam como escrita
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class ReadYourWritesMiddleware:
+    """
+    Registra as escritas bem-sucedidas de cada cliente para que, logo em
+    seguida, as leituras dele vão para o primário e não para uma réplica que
+    ainda não recebeu a alteração.
+
+    Sem réplicas configuradas, não faz nada.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        replicas = database.replica_set
+        if (
+            scope["type"] != "http"
+            or replicas is None
+            or scope["method"] in READ_METHODS
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        client = database.read_client_key(Request(scope))
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                replicas.record_write(client)
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
@@ -0,0 +1,30 @@
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import DateTime, ForeignKey, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+# Motivos de revogação de um refresh token
+ROTATED = "rotated"  # trocado por um novo par em /token/refresh
+REVOKED = "revoked"  # logout ou /token/revoke
+REUSED = "reused"  # revogado porque um token já rotacionado foi reapresentado
+
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), index=True
+    )
+    # SHA-256 do token; o valor original só existe no cliente
+    token_hash: Mapped[str] = mapped_column(String(64), unique=True, index=True)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    revoked_at: Mapped[Optional[datetime]] = mapped_column(
+        DateTime(timezone=True), nullable=True
+    )
+    revoked_reason: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
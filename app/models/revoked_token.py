@@ -0,0 +1,14 @@
+from datetime import datetime
+
+from sqlalchemy import DateTime, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    jti: Mapped[str] = mapped_column(String(64), unique=True, index=True)
+    # Momento a partir do qual a entrada pode ser descartada (o `exp` do token)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
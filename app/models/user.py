@@ -1,13 +1,112 @@
-from sqlalchemy import String
-from sqlalchemy.orm import Mapped, mapped_column
+from datetime import datetime, timezone
+
+from sqlalchemy import DDL, DateTime, Index, Integer, String, event
+from sqlalchemy.orm import Mapped, mapped_column, validates
 
 from .base import Base
 
+# created_at dos usuários que já existiam quando a coluna foi criada, cuja data
+# de cadastro é desconhecida; não contam nos cadastros por dia nem nos filtros
+# por data
+LEGACY_CREATED_AT = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def email_domain(email: str) -> str:
+    """Domínio do email, em minúsculas, usado no filtro de GET /users."""
+    return email.rpartition("@")[2].lower()
+
+
+def _email_domain_default(context) -> str:
+    return email_domain(context.get_current_parameters()["email"])
+
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Paginação por keyset ordenada por nome e por data de cadastro
+        Index("ix_users_nome_id", "nome", "id"),
+        Index("ix_users_created_at_id", "created_at", "id"),
+        # Filtro por role em cada ordenação aceita por GET /users
+        Index("ix_users_role_id", "role", "id"),
+        Index("ix_users_role_nome_id", "role", "nome", "id"),
+        Index("ix_users_role_created_at_id", "role", "created_at", "id"),
+        # Filtro por domínio; o resultado costuma ser pequeno o bastante para
+        # ser ordenado sem índice próprio em cada ordenação
+        Index("ix_users_email_domain_id", "email_domain", "id"),
+        # Busca por substring no Postgres (ILIKE '%q%' e similarity())
+        Index(
+            "ix_users_nome_trgm",
+            "nome",
+            postgresql_using="gin",
+            postgresql_ops={"nome": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_users_email_trgm",
+            "email",
+            postgresql_using="gin",
+            postgresql_ops={"email": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
 
     nome: Mapped[str] = mapped_column(String(100))
     email: Mapped[str] = mapped_column(String(100), unique=True, index=True)
+    # Derivado do email: o default cobre INSERTs em lote (Core) e o validador
+    # abaixo cobre alterações feitas pelo ORM
+    email_domain: Mapped[str] = mapped_column(
+        String(100),
+        default=_email_domain_default,
+    )
     hashed_password: Mapped[str] = mapped_column(String(255))
     role: Mapped[str] = mapped_column(String(50), default="user")
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), default=lambda: datetime.now(timezone.utc)
+    )
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=lambda: datetime.now(timezone.utc),
+        onupdate=lambda: datetime.now(timezone.utc),
+    )
+    # Incrementada pelo ORM a cada UPDATE; base das ETags e do If-Match
+    version: Mapped[int] = mapped_column(Integer, server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}
+
+    @validates("email")
+    def _set_email_domain(self, key: str, email: str) -> str:
+        self.email_domain = email_domain(email)
+        return email
+
+
+# Objetos de busca fora do modelo declarativo; as migrações criam os mesmos
+# objetos em bancos existentes (revisão c4f7a2d9e813).
+USERS_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+    "nome, email, content='users', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_ai AFTER INSERT ON users BEGIN "
+    "INSERT INTO users_fts(rowid, nome, email) "
+    "VALUES (new.id, new.nome, new.email); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_ad AFTER DELETE ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, nome, email) "
+    "VALUES ('delete', old.id, old.nome, old.email); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, nome, email) "
+    "VALUES ('delete', old.id, old.nome, old.email); "
+    "INSERT INTO users_fts(rowid, nome, email) "
+    "VALUES (new.id, new.nome, new.email); END",
+    "INSERT INTO users_fts(users_fts) VALUES ('rebuild')",
+)
+
+event.listen(
+    User.__table__,
+    "before_create",
+    DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect="postgresql"),
+)
+for statement in USERS_FTS_DDL:
+    event.listen(
+        User.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite")
+    )
+event.listen(
+    User.__table__,
+    "after_drop",
+    DDL("DROP TABLE IF EXISTS users_fts").execute_if(dialect="sqlite"),
+)
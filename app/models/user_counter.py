@@ -0,0 +1,12 @@
+from sqlalchemy import BigInteger, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from .base import Base
+
+
+class UserCounter(Base):
+    __tablename__ = "user_counters"
+
+    # "total", "role:<role>" ou "signups:<AAAA-MM-DD>"
+    name: Mapped[str] = mapped_column(String(64), unique=True)
+    value: Mapped[int] = mapped_column(BigInteger, default=0)
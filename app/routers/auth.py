@@ -1,13 +1,15 @@
 import logging
 
 from fastapi import APIRouter, Depends, HTTPException, Request, status
-from sqlalchemy.orm import Session
+from fastapi.security import HTTPAuthorizationCredentials
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 
-from app.database import get_db
+from app.database import get_async_db
 from app.middleware.rate_limit import conditional_limit
-from app.schemas.auth import LoginRequest, Token
+from app.schemas.auth import LoginRequest, RefreshRequest, Token
 from app.schemas.user import User
-from app.services.auth_service import AuthService
+from app.services.auth_service import AuthService, security
 
 logger = logging.getLogger(__name__)
 router = APIRouter(tags=["Auth"])
@@ -15,28 +17,85 @@ router = APIRouter(tags=["Auth"])
 
 @router.post("/login", response_model=Token, summary="Realizar login")
 @conditional_limit("5/minute")  # Usa rate limiting condicional
-def login(request: Request, credentials: LoginRequest, db: Session = Depends(get_db)):
+async def login(
+    request: Request,
+    credentials: LoginRequest,
+    db: AsyncSession = Depends(get_async_db),
+):
     logger.info(f"Tentativa de login para: {credentials.email}")
 
     auth_service = AuthService(db)
-    token = auth_service.authenticate_user(credentials.email, credentials.password)
+    tokens = await auth_service.authenticate_user(
+        credentials.email, credentials.password
+    )
 
-    if not token:
+    if not tokens:
         logger.warning(f"Login falhou para: {credentials.email}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Credenciais inválidas"
         )
 
     logger.info(f"Login bem-sucedido para: {credentials.email}")
-    return {"access_token": token, "token_type": "bearer"}
+    return tokens
+
+
+@router.post("/token/refresh", response_model=Token, summary="Renovar access token")
+@conditional_limit("30/minute")
+async def refresh_token(
+    request: Request, payload: RefreshRequest, db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Emite um novo access token a partir de um refresh token válido.
+
+    O refresh token enviado é revogado e substituído por um novo, que deve ser
+    usado na próxima renovação.
+
+    Raises:
+        HTTPException: 401 - Se o refresh token for inválido, expirado ou revogado
+    """
+    tokens = await AuthService(db).refresh_access_token(payload.refresh_token)
+    if not tokens:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Refresh token inválido",
+        )
+    return tokens
+
+
+@router.post("/token/revoke", summary="Revogar refresh token")
+@conditional_limit("30/minute")
+async def revoke_token(
+    request: Request, payload: RefreshRequest, db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Revoga um refresh token, impedindo novas renovações com ele.
+    """
+    await AuthService(db).revoke_refresh_token(payload.refresh_token)
+    return {"message": "Refresh token revogado."}
 
 
 @router.post("/logout", summary="Realizar logout do usuário")
 @conditional_limit("10/minute")  # Usa rate limiting condicional
-def logout(
-    request: Request, current_user: User = Depends(AuthService.get_current_user)
+async def logout(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: dict = Depends(AuthService.get_current_user),
+    db: AsyncSession = Depends(get_async_db),
 ):
-    logger.info(f"Logout realizado para usuário: {current_user.email}")
+    """
+    Encerra a sessão: revoga o access token usado na requisição e o refresh
+    token emitido junto com ele.
+
+    O access token passa a ser recusado por todos os workers até expirar e o
+    refresh token não renova mais a sessão.
+    """
+    # A lista de revogados grava no armazenamento de forma síncrona
+    await run_in_threadpool(
+        AuthService.revoke_access_token, credentials.credentials, current_user
+    )
+    if current_user.get("sid"):
+        await AuthService(db).revoke_session(current_user["sid"])
+    logger.info(f"Logout realizado para usuário: {current_user['email']}")
     return {"message": "Logout realizado com sucesso."}
 
 
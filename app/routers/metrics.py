@@ -0,0 +1,118 @@
+from fastapi import APIRouter, Depends
+
+from app import database
+from app.database import get_pool_stats
+from app.services.auth_service import AuthService
+from app.services.password_hasher import password_hasher
+from app.services.token_cache import token_cache
+from app.services.token_denylist import token_denylist
+from app.services.user_cache import user_cache
+from app.services.user_search_index import user_search_index
+
+router = APIRouter(prefix="/metrics", tags=["Metrics"])
+
+
+@router.get("/hashing", summary="Métricas do pool de hashing de senhas")
+def hashing_metrics(current_user: dict = Depends(AuthService.verify_admin)):
+    """
+    Retorna o estado do pool de hashing de senhas.
+
+    Args:
+        current_user (dict): Dados do usuário atual (injetado automaticamente)
+
+    Returns:
+        dict: Tamanho do pool, profundidade da fila, tarefas em andamento e
+              latências médias/máximas (total e espera em fila) em milissegundos
+    """
+    return password_hasher.stats()
+
+
+@router.get("/token-cache", summary="Métricas do cache de tokens verificados")
+def token_cache_metrics(current_user: dict = Depends(AuthService.verify_admin)):
+    """
+    Retorna o estado do cache de tokens JWT já verificados.
+
+    Args:
+        current_user (dict): Dados do usuário atual (injetado automaticamente)
+
+    Returns:
+        dict: Tamanho atual e máximo, acertos, falhas, remoções e taxa de acerto
+    """
+    return token_cache.stats()
+
+
+@router.get("/token-denylist", summary="Métricas da lista de tokens revogados")
+def token_denylist_metrics(current_user: dict = Depends(AuthService.verify_admin)):
+    """
+    Retorna o estado do filtro de Bloom e do armazenamento de tokens revogados.
+
+    Args:
+        current_user (dict): Dados do usuário atual (injetado automaticamente)
+
+    Returns:
+        dict: Backend em uso, dimensões do filtro, verificações feitas e quantas
+              delas precisaram consultar o armazenamento
+    """
+    return token_denylist.stats()
+
+
+@router.get("/db-pool", summary="Métricas dos pools de conexão do banco")
+def db_pool_metrics(current_user: dict = Depends(AuthService.verify_admin)):
+    """
+    Retorna, para cada engine, o estado do pool de conexões deste worker.
+
+    Args:
+        current_user (dict): Dados do usuário atual (injetado automaticamente)
+
+    Returns:
+        dict: Por engine, tamanho do pool, conexões em uso, overflow atual e de
+              pico, timeouts e tempo de espera no checkout em milissegundos
+    """
+    return get_pool_stats()
+
+
+@router.get("/db-replicas", summary="Métricas das réplicas de leitura")
+def db_replica_metrics(current_user: dict = Depends(AuthService.verify_admin)):
+    """
+    Retorna o estado das réplicas de leitura neste worker.
+
+    Args:
+        current_user (dict): Dados do usuário atual (injetado automaticamente)
+
+    Returns:
+        dict: Leituras feitas no primário e, por réplica, se está no rodízio,
+              leituras atendidas e falhas de conexão; vazio sem réplicas
+    """
+    if database.replica_set is None:
+        return {}
+    return database.replica_set.stats()
+
+
+@router.get("/user-search-index", summary="Métricas do índice de busca em memória")
+def user_search_index_metrics(current_user: dict = Depends(AuthService.verify_admin)):
+    """
+    Retorna o estado do índice de busca de usuários em memória deste worker.
+
+    Args:
+        current_user (dict): Dados do usuário atual (injetado automaticamente)
+
+    Returns:
+        dict: Documentos e chaves indexados, slots ocupados (e obsoletos),
+              memória das postings, compactações e tempo médio de busca
+    """
+    return user_search_index.stats()
+
+
+@router.get("/user-cache", summary="Métricas do cache de usuários")
+def user_cache_metrics(current_user: dict = Depends(AuthService.verify_admin)):
+    """
+    Retorna o estado do cache de usuários (L1 local e L2 compartilhado).
+
+    Args:
+        current_user (dict): Dados do usuário atual (injetado automaticamente)
+
+    Returns:
+        dict: Backend do L2, tamanho do L1, acertos por nível, falhas, cargas
+              compartilhadas entre requisições, invalidações e taxa de acerto
+    """
+    return user_cache.stats()
@@ -1,46 +1,146 @@
-from typing import List
-
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-
-from app.database import get_db
-from app.schemas.user import User, UserCreate, UserUpdate
+import json
+from datetime import datetime
+from typing import List, Literal, Optional, Tuple
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_async_db, get_read_db
+from app.schemas.user import (
+    BulkUserIds,
+    BulkUserResponse,
+    BulkUserUpdate,
+    User,
+    UserCreate,
+    UserFilters,
+    UserUpdate,
+)
 from app.services.auth_service import AuthService
-from app.services.user_service import UserService
+from app.services.etag import etag_matches_none, list_etag, user_etag
+from app.services.password_hasher import HashingPoolSaturated
+from app.services.user_export import EXPORT_FORMATTERS, EXPORT_MEDIA_TYPES
+from app.services.user_serializer import UserListResponse, parse_fields
+from app.services.user_service import (
+    USERS_BULK_MAX_BYTES,
+    USERS_BULK_MAX_ITEMS,
+    UserService,
+    UserVersionConflict,
+)
 
 router = APIRouter(prefix="/users", tags=["Users"])
 
+USERS_PAGE_SIZE = 50
+USERS_MAX_PAGE_SIZE = 200
+
 
-@router.get("/", response_model=List[User], summary="Listar Usuários")
-def get_users(
-    db: Session = Depends(get_db),
+def requested_fields(
+    fields: Optional[str] = Query(
+        None,
+        description="Campos a retornar, separados por vírgula (ex.: id,nome)",
+    ),
+) -> Tuple[str, ...]:
+    """Valida o parâmetro `fields` contra os campos do schema de usuário."""
+    try:
+        return parse_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def user_filters(
+    role: Optional[Literal["user", "admin"]] = None,
+    email_domain: Optional[str] = Query(None, min_length=1, max_length=100),
+    created_after: Optional[datetime] = None,
+) -> UserFilters:
+    """Filtros de GET /users, cada um servido por um índice de users."""
+    return UserFilters(
+        role=role, email_domain=email_domain, created_after=created_after
+    )
+
+
+@router.get(
+    "/",
+    response_model=List[User],
+    response_class=UserListResponse,
+    summary="Listar Usuários",
+)
+async def get_users(
+    request: Request,
+    limit: int = Query(USERS_PAGE_SIZE, ge=1, le=USERS_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: Literal["id", "-id", "nome", "-nome", "created_at", "-created_at"] = "id",
+    filters: UserFilters = Depends(user_filters),
+    fields: Tuple[str, ...] = Depends(requested_fields),
+    db: AsyncSession = Depends(get_read_db),
     current_user: dict = Depends(AuthService.verify_admin),
 ):
     """
-    Retorna a lista de todos os usuários cadastrados.
+    Retorna uma página de usuários cadastrados.
+
+    A próxima página é indicada nos cabeçalhos `X-Next-Cursor` e `Link`
+    (rel="next"); a ausência deles indica a última página. A resposta traz uma
+    ETag da página; com `If-None-Match` igual a ela, retorna 304 sem corpo.
 
     Args:
-        db (Session): Sessão do banco de dados injetada via dependency injection
+        limit (int): Quantidade máxima de usuários na página
+        cursor (str): Cursor opaco recebido na página anterior
+        sort (str): Ordenação - "id", "nome" ou "created_at"; com "-" na
+            frente, decrescente
+        filters (UserFilters): Filtros opcionais - role, email_domain e
+            created_after (cadastrados depois da data)
+        fields (Tuple[str, ...]): Campos de cada usuário na resposta; só eles
+            são lidos do banco
+        db (AsyncSession): Sessão do banco de dados injetada via dependency injection
         current_user (dict): Dados do usuário atual (injetado automaticamente)
 
     Returns:
-        List[User]: Lista com todos os usuários encontrados no banco de dados
+        List[User]: Usuários da página solicitada
 
     Raises:
-        HTTPException: Em caso de erro interno do servidor
+        HTTPException: 400 - Se o cursor ou os campos forem inválidos
     """
     user_service = UserService(db)
-    return user_service.get_users()
+    try:
+        users, next_cursor = await user_service.get_users(
+            limit, cursor, sort, fields, filters
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # A query string distingue páginas com os mesmos usuários e campos ou
+    # filtros diferentes
+    etag = list_etag(
+        ((user.id, user.version) for user in users),
+        f"{request.url.query}|{next_cursor or ''}",
+    )
+    if etag_matches_none(request.headers.get("If-None-Match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    headers = {"ETag": etag}
+    if next_cursor:
+        next_url = request.url.include_query_params(cursor=next_cursor)
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    return UserListResponse(users, fields, headers=headers)
 
 
 @router.post("/", response_model=User, status_code=201, summary="Criar Usuário")
-def create_user(user_data: UserCreate, db: Session = Depends(get_db)):
+async def create_user(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Cria um novo usuário no sistema.
 
     Args:
         user_data (UserCreate): Dados do usuário a ser criado (nome, email, etc.)
-        db (Session): Sessão do banco de dados injetada via dependency injection
+        db (AsyncSession): Sessão do banco de dados injetada via dependency injection
 
     Returns:
         User: Dados do usuário criado, incluindo o ID gerado
@@ -48,50 +148,227 @@ def create_user(user_data: UserCreate, db: Session = Depends(get_db)):
     Raises:
         HTTPException: 400 - Se houver erro na validação dos dados ou
                             se o email já estiver em uso
+                       503 - Se o pool de hashing de senhas estiver saturado
     """
     user_service = UserService(db)
     try:
-        return user_service.create_user(user_data)
+        return await user_service.create_user(user_data)
+    except HashingPoolSaturated:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+async def _read_bulk_items(request: Request) -> list:
+    """
+    Lê o corpo como array JSON ou NDJSON (um objeto por linha), recusando com
+    413 assim que ele passa de USERS_BULK_MAX_BYTES ou de USERS_BULK_MAX_ITEMS.
+    """
+    ndjson = request.headers.get("content-type", "").startswith("application/x-ndjson")
+    items = []
+    buffer = b""
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        _check_bulk_bytes(size)
+        buffer += chunk
+        if ndjson:
+            *lines, buffer = buffer.split(b"\n")
+            items.extend(json.loads(line) for line in lines if line.strip())
+            _check_bulk_size(items)
+
+    if not ndjson:
+        items = json.loads(buffer)
+        if not isinstance(items, list):
+            raise ValueError("O corpo deve ser um array JSON")
+    elif buffer.strip():
+        items.append(json.loads(buffer))
+    return items
+
+
+def _check_bulk_bytes(size: int) -> None:
+    if size > USERS_BULK_MAX_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"O lote pode ter no máximo {USERS_BULK_MAX_BYTES} bytes",
+        )
+
+
+def _check_bulk_size(items: list) -> None:
+    if len(items) > USERS_BULK_MAX_ITEMS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"O lote pode ter no máximo {USERS_BULK_MAX_ITEMS} itens",
+        )
+
+
+def _bulk_response(results: List[dict]) -> dict:
+    failed = sum(1 for result in results if result["status"] == "error")
+    return {
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "results": results,
+    }
+
+
+@router.post("/bulk", response_model=BulkUserResponse, summary="Criar Usuários em Lote")
+async def bulk_create_users(
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(AuthService.verify_admin),
+):
+    """
+    Cria vários usuários em uma única requisição.
+
+    O corpo é um array JSON de usuários ou, com `Content-Type:
+    application/x-ndjson`, um usuário por linha. Itens inválidos ou com email
+    já em uso são reportados sem impedir a criação dos demais.
+
+    Args:
+        request (Request): Requisição com os usuários a criar (até 1000)
+        db (AsyncSession): Sessão do banco de dados injetada via dependency injection
+        current_user (dict): Dados do usuário atual (injetado automaticamente)
+
+    Returns:
+        BulkUserResponse: Quantidade de itens criados e com erro, e o resultado
+                          de cada item na ordem recebida
+
+    Raises:
+        HTTPException: 400 - Se o corpo não for JSON/NDJSON válido
+                       413 - Se o lote tiver mais de 1000 itens ou 2 MiB
+                       503 - Se o pool de hashing de senhas estiver saturado
+    """
+    try:
+        raw_items = await _read_bulk_items(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Corpo inválido: {e}")
+    _check_bulk_size(raw_items)
+
+    results = [None] * len(raw_items)
+    valid_items, positions = [], []
+    for index, raw_item in enumerate(raw_items):
+        try:
+            valid_items.append(UserCreate.model_validate(raw_item))
+            positions.append(index)
+        except ValidationError as e:
+            error = e.errors()[0]
+            location = ".".join(str(part) for part in error["loc"])
+            results[index] = {
+                "index": index,
+                "status": "error",
+                "detail": f"{location}: {error['msg']}" if location else error["msg"],
+            }
+
+    user_service = UserService(db)
+    for result in await user_service.bulk_create_users(valid_items):
+        result["index"] = positions[result["index"]]
+        results[result["index"]] = result
+
+    return _bulk_response(results)
+
+
+@router.patch(
+    "/bulk", response_model=BulkUserResponse, summary="Atualizar Usuários em Lote"
+)
+async def bulk_update_users(
+    data: BulkUserUpdate,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(AuthService.verify_admin),
+):
+    """
+    Altera a role de vários usuários em uma única transação.
+
+    Args:
+        data (BulkUserUpdate): Ids dos usuários (até 1000) e a nova role
+        db (AsyncSession): Sessão do banco de dados injetada via dependency injection
+        current_user (dict): Dados do usuário atual (injetado automaticamente)
+
+    Returns:
+        BulkUserResponse: Quantidade de ids processados e com erro, e o resultado
+                          de cada id ("updated", "unchanged" ou "error")
+
+    Raises:
+        HTTPException: 413 - Se o lote tiver mais de 1000 ids
+    """
+    _check_bulk_size(data.ids)
+    user_service = UserService(db)
+    return _bulk_response(await user_service.bulk_update_users(data.ids, data.role))
+
+
+@router.delete(
+    "/bulk", response_model=BulkUserResponse, summary="Remover Usuários em Lote"
+)
+async def bulk_delete_users(
+    data: BulkUserIds,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(AuthService.verify_admin),
+):
+    """
+    Remove vários usuários em uma única transação.
+
+    Args:
+        data (BulkUserIds): Ids dos usuários a remover (até 1000)
+        db (AsyncSession): Sessão do banco de dados injetada via dependency injection
+        current_user (dict): Dados do usuário atual (injetado automaticamente)
+
+    Returns:
+        BulkUserResponse: Quantidade de ids removidos e com erro, e o resultado
+                          de cada id ("deleted" ou "error")
+
+    Raises:
+        HTTPException: 413 - Se o lote tiver mais de 1000 ids
+    """
+    _check_bulk_size(data.ids)
+    user_service = UserService(db)
+    return _bulk_response(await user_service.bulk_delete_users(data.ids))
+
+
 @router.get(
-    "/search", response_model=List[User], summary="Buscar Usuários por Nome ou Email"
+    "/search",
+    response_model=List[User],
+    response_class=UserListResponse,
+    summary="Buscar Usuários por Nome ou Email",
 )
-def search_users(
+async def search_users(
     query: str,
-    db: Session = Depends(get_db),
+    limit: int = Query(20, ge=1, le=USERS_MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    fields: Tuple[str, ...] = Depends(requested_fields),
+    db: AsyncSession = Depends(get_read_db),
     current_user: dict = Depends(AuthService.verify_admin),
 ):
     """
-    Busca usuários pelo nome ou email.
+    Busca usuários pelo nome ou email, ordenados por relevância.
 
     Args:
         query (str): Termo de busca (nome ou email)
-        db (Session): Sessão do banco de dados injetada via dependency injection
+        limit (int): Quantidade máxima de resultados (padrão 20, máximo 200)
+        offset (int): Quantidade de resultados a pular
+        fields (Tuple[str, ...]): Campos de cada usuário na resposta
+        db (AsyncSession): Sessão do banco de dados injetada via dependency injection
         current_user (dict): Dados do usuário atual (injetado automaticamente)
 
     Returns:
         List[User]: Lista de usuários que correspondem ao termo de busca
 
     Raises:
-        HTTPException: 400 - Se o termo de busca for inválido
+        HTTPException: 400 - Se os campos pedidos forem inválidos
     """
     user_service = UserService(db)
-    return user_service.search_users(query)
+    users = await user_service.search_users(query, limit, offset, fields)
+    return UserListResponse(users, fields)
 
 
 @router.get("/count", summary="Contar Usuários")
-def count_users(
-    db: Session = Depends(get_db),
+async def count_users(
+    db: AsyncSession = Depends(get_read_db),
     current_user: dict = Depends(AuthService.verify_admin),
 ):
     """
     Conta o número total de usuários cadastrados.
 
     Args:
-        db (Session): Sessão do banco de dados injetada via dependency injection
+        db (AsyncSession): Sessão do banco de dados injetada via dependency injection
         current_user (dict): Dados do usuário atual (injetado automaticamente)
 
     Returns:
@@ -101,17 +378,66 @@ def count_users(
         HTTPException: 500 - Se ocorrer um erro interno ao contar os usuários
     """
     user_service = UserService(db)
-    return user_service.count_users()
+    return await user_service.count_users()
+
+
+@router.get("/stats", summary="Estatísticas de Usuários")
+async def user_stats(
+    days: int = Query(7, ge=1, le=365),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(AuthService.verify_admin),
+):
+    """
+    Retorna estatísticas dos usuários a partir de contadores pré-calculados.
+
+    Args:
+        days (int): Quantos dias (incluindo hoje, em UTC) considerar nos cadastros
+        db (AsyncSession): Sessão do banco de dados injetada via dependency injection
+        current_user (dict): Dados do usuário atual (injetado automaticamente)
+
+    Returns:
+        dict: Total de usuários, total por role e cadastros por dia no período
+    """
+    user_service = UserService(db)
+    return await user_service.get_stats(days)
+
+
+@router.get("/export", summary="Exportar Usuários")
+async def export_users(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    db: AsyncSession = Depends(get_async_db),
+    current_user: dict = Depends(AuthService.verify_admin),
+):
+    """
+    Exporta todos os usuários em NDJSON ou CSV.
+
+    As linhas são lidas do banco em lotes e enviadas à medida que chegam, então
+    o consumo de memória não depende do tamanho da tabela.
+
+    Args:
+        format (str): Formato da exportação - "ndjson" ou "csv"
+        db (AsyncSession): Sessão do banco de dados injetada via dependency injection
+        current_user (dict): Dados do usuário atual (injetado automaticamente)
+
+    Returns:
+        StreamingResponse: Usuários (id, nome, email, role) no formato pedido
+    """
+    user_service = UserService(db)
+    return StreamingResponse(
+        EXPORT_FORMATTERS[format](user_service.stream_users()),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="users.{format}"'},
+    )
 
 
 @router.delete("/{user_id}")
-def delete_user(user_id: int, db: Session = Depends(get_db)):
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Remove um usuário do sistema pelo ID.
 
     Args:
         user_id (int): ID único do usuário a ser removido
-        db (Session): Sessão do banco de dados injetada via dependency injection
+        db (AsyncSession): Sessão do banco de dados injetada via dependency injection
 
     Returns:
         dict: Mensagem de confirmação se o usuário foi removido com sucesso
@@ -120,17 +446,19 @@ def delete_user(user_id: int, db: Session = Depends(get_db)):
         HTTPException: 404 - Se o usuário com o ID fornecido não for encontrado
     """
     user_service = UserService(db)
-    if user_service.delete_user(user_id):
+    if await user_service.delete_user(user_id):
         return {"detail": "Usuário removido com sucesso"}
     else:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
 
 
 @router.put("/{user_id}", response_model=User, summary="Atualizar Usuário")
-def update_user(
+async def update_user(
     user_id: int,
     user_data: UserUpdate,
-    db: Session = Depends(get_db),
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(AuthService.get_current_user),
 ):
     """
@@ -139,42 +467,68 @@ def update_user(
     Args:
         user_id (int): ID único do usuário a ser atualizado
         user_data (UserUpdate): Dados atualizados do usuário
-        db (Session): Sessão do banco de dados injetada via dependency injection
+        if_match (str): ETag esperada; se a versão atual for outra, nada é alterado
+        db (AsyncSession): Sessão do banco de dados injetada via dependency injection
 
     Returns:
-        User: Dados do usuário atualizado
+        User: Dados do usuário atualizado, com a nova ETag no cabeçalho
 
     Raises:
         HTTPException: 404 - Se o usuário não for encontrado
                        400 - Se houver erro na validação dos dados
                        403 - Se o usuário atual não tiver permissão para atualizar
+                       412 - Se o If-Match não corresponder à versão atual
     """
     user_service = UserService(db)
     if current_user["id"] != user_id:
         raise HTTPException(status_code=403, detail="Acesso negado")
-    updated_user = user_service.update_user(user_id, user_data)
+    try:
+        updated_user = await user_service.update_user(user_id, user_data, if_match)
+    except UserVersionConflict as e:
+        raise HTTPException(status_code=412, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not updated_user:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
+    response.headers["ETag"] = user_etag(updated_user.id, updated_user.version)
     return updated_user
 
 
 @router.get("/{user_id}", response_model=User, summary="Buscar Usuário por ID")
-def get_user(user_id: int, db: Session = Depends(get_db)):
+async def get_user(
+    user_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_read_db),
+):
     """
     Busca um usuário específico pelo ID.
 
+    Com `If-None-Match`, a versão é consultada antes de carregar o usuário e,
+    se a ETag ainda for a atual, a resposta é 304 sem corpo.
+
     Args:
         user_id (int): ID único do usuário
-        db (Session): Sessão do banco de dados injetada via dependency injection
+        if_none_match (str): ETags que o cliente já possui
+        db (AsyncSession): Sessão do banco de dados injetada via dependency injection
 
     Returns:
-        User: Dados do usuário encontrado
+        User: Dados do usuário encontrado, com a ETag no cabeçalho
 
     Raises:
         HTTPException: 404 - Se o usuário não for encontrado
     """
     user_service = UserService(db)
-    user = user_service.get_user_by_id(user_id)
+    if if_none_match:
+        version = await user_service.get_user_version(user_id)
+        if version is None:
+            raise HTTPException(status_code=404, detail="Usuário não encontrado")
+        etag = user_etag(user_id, version)
+        if etag_matches_none(if_none_match, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+
+    user = await user_service.get_cached_user(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
+    response.headers["ETag"] = user_etag(user_id, user["version"])
     return user
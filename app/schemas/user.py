@@ -1,4 +1,5 @@
-from typing import Optional
+from datetime import datetime
+from typing import List, Literal, Optional
 
 from pydantic import BaseModel, ConfigDict, Field, field_validator
 
@@ -37,3 +38,37 @@ class User(UserBase):
 
     id: int
     role: str = "user"
+
+
+class UserFilters(BaseModel):
+    role: Optional[Literal["user", "admin"]] = None
+    email_domain: Optional[str] = Field(None, min_length=1, max_length=100)
+    created_after: Optional[datetime] = None
+
+    @field_validator("email_domain")
+    def email_domain_lowercase(cls, v):
+        return v.lower().lstrip("@") if v else v
+
+
+class BulkUserIds(BaseModel):
+    ids: List[int] = Field(..., min_length=1)
+
+
+class BulkUserUpdate(BulkUserIds):
+    # Só campos que fazem sentido aplicar a vários usuários de uma vez
+    role: str = Field(..., pattern=r"^(user|admin)$")
+
+
+class BulkUserResult(BaseModel):
+    # Posição do item no lote
+    index: Optional[int] = None
+    id: Optional[int] = None
+    email: Optional[str] = None
+    status: str
+    detail: Optional[str] = None
+
+
+class BulkUserResponse(BaseModel):
+    succeeded: int
+    failed: int
+    results: List[BulkUserResult]
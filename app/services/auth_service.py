@@ -1,53 +1,212 @@
+import hashlib
+import logging
 import os
+import secrets
+import uuid
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 
-import bcrypt
 import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import Row, bindparam, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.models.refresh_token import REUSED, REVOKED, ROTATED, RefreshToken
 from app.models.user import User
+from app.services.password_hasher import HashingPoolSaturated, password_hasher
+from app.services.token_cache import token_cache
+from app.services.token_denylist import token_denylist
+
+logger = logging.getLogger(__name__)
 
 security = HTTPBearer()
 
 SECRET_KEY = os.getenv("SECRET_KEY", "secret")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
-ACCESS_TOKEN_EXPIRE_MINUTES = 60
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+
+# Projeção mínima usada no login. Como o statement é um objeto único com
+# bindparam, o SQLAlchemy reaproveita a compilação cacheada a cada chamada.
+CREDENTIALS_QUERY = select(
+    User.id, User.email, User.nome, User.role, User.hashed_password
+).where(User.email == bindparam("email"))
+
+
+def _hash_refresh_token(token: str) -> str:
+    # O token tem 256 bits aleatórios, então um hash rápido é suficiente
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite devolve datetimes sem fuso; todos são gravados em UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
 
 
 class AuthService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
 
-    def verify_password(self, plain_password: str, hashed_password: str) -> bool:
-        return bcrypt.checkpw(
-            plain_password.encode("utf-8"), hashed_password.encode("utf-8")
-        )
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+        return await password_hasher.verify(plain_password, hashed_password)
+
+    async def get_password_hash(self, password: str) -> str:
+        return await password_hasher.hash(password)
 
-    def get_password_hash(self, password: str) -> str:
-        hashed_bytes = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt())
-        return hashed_bytes.decode("utf-8")
+    async def get_credentials(self, email: str) -> Optional[Row]:
+        """
+        Busca apenas as colunas necessárias para autenticar, sem hidratar um
+        objeto User do ORM.
+        """
+        result = await self.db.execute(CREDENTIALS_QUERY, {"email": email})
+        return result.first()
 
-    def authenticate_user(self, email: str, password: str) -> Optional[str]:
-        user = self.db.query(User).filter(User.email == email).first()
+    async def authenticate_user(self, email: str, password: str) -> Optional[dict]:
+        user = await self.get_credentials(email)
 
         if not user:
             return None
 
-        if not self.verify_password(password, user.hashed_password):
+        if not await self.verify_password(password, user.hashed_password):
             return None
 
-        return self.create_access_token(
+        if password_hasher.needs_rehash(user.hashed_password):
+            await self._rehash_password(user.id, user.hashed_password, password)
+
+        return await self._issue_tokens(user)
+
+    async def _issue_tokens(self, user: User | Row) -> dict:
+        refresh_token = await self.create_refresh_token(user.id)
+        access_token = self.create_access_token(
             {
                 "sub": str(user.id),
                 "id": user.id,
                 "email": user.email,
                 "nome": user.nome,
                 "role": user.role,
+                # Liga o access token ao refresh token emitido junto, para que
+                # o logout encerre a sessão inteira
+                "sid": _hash_refresh_token(refresh_token),
             }
         )
+        return {
+            "access_token": access_token,
+            "refresh_token": refresh_token,
+            "token_type": "bearer",
+        }
+
+    async def create_refresh_token(self, user_id: int) -> str:
+        """
+        Gera um refresh token opaco e grava apenas o seu hash.
+        """
+        token = secrets.token_urlsafe(32)
+        self.db.add(
+            RefreshToken(
+                user_id=user_id,
+                token_hash=_hash_refresh_token(token),
+                expires_at=datetime.now(timezone.utc)
+                + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+            )
+        )
+        await self.db.commit()
+        return token
+
+    async def refresh_access_token(self, refresh_token: str) -> Optional[dict]:
+        """
+        Troca um refresh token válido por um novo par de tokens.
+
+        O refresh token usado é revogado (rotação). Se um token já rotacionado
+        for apresentado novamente, todos os refresh tokens do usuário são
+        revogados, pois isso indica que o token vazou. Um token revogado por
+        logout ou /token/revoke é apenas recusado.
+        """
+        result = await self.db.execute(
+            select(RefreshToken, User)
+            .join(User, User.id == RefreshToken.user_id)
+            .where(RefreshToken.token_hash == _hash_refresh_token(refresh_token))
+        )
+        row = result.first()
+        if not row:
+            return None
+
+        stored, user = row
+        now = datetime.now(timezone.utc)
+
+        if stored.revoked_at is not None:
+            if stored.revoked_reason == ROTATED:
+                logger.warning(
+                    f"Reuso de refresh token rotacionado: usuário ID={user.id}"
+                )
+                await self.revoke_user_refresh_tokens(user.id, REUSED)
+            return None
+
+        if _as_utc(stored.expires_at) <= now:
+            return None
+
+        # Só uma requisição concorrente consegue rotacionar o mesmo token
+        result = await self.db.execute(
+            update(RefreshToken)
+            .where(RefreshToken.id == stored.id, RefreshToken.revoked_at.is_(None))
+            .values(revoked_at=now, revoked_reason=ROTATED)
+        )
+        if result.rowcount != 1:
+            await self.db.rollback()
+            return None
+
+        return await self._issue_tokens(user)
+
+    async def revoke_refresh_token(self, refresh_token: str) -> bool:
+        return await self.revoke_session(_hash_refresh_token(refresh_token))
+
+    async def revoke_session(self, session_id: str) -> bool:
+        """
+        Revoga o refresh token da sessão, identificado pelo claim `sid` do
+        access token (o hash do refresh token).
+        """
+        result = await self.db.execute(
+            update(RefreshToken)
+            .where(
+                RefreshToken.token_hash == session_id,
+                RefreshToken.revoked_at.is_(None),
+            )
+            .values(revoked_at=datetime.now(timezone.utc), revoked_reason=REVOKED)
+        )
+        await self.db.commit()
+        return result.rowcount == 1
+
+    async def revoke_user_refresh_tokens(
+        self, user_id: int, reason: str = REVOKED
+    ) -> None:
+        await self.db.execute(
+            update(RefreshToken)
+            .where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+            .values(revoked_at=datetime.now(timezone.utc), revoked_reason=reason)
+        )
+        await self.db.commit()
+
+    async def _rehash_password(
+        self, user_id: int, current_hash: str, password: str
+    ) -> None:
+        """
+        Regrava o hash com o custo atual após um login bem-sucedido.
+
+        O UPDATE só é aplicado se o hash não mudou desde a leitura, para não
+        sobrescrever uma troca de senha concorrente.
+        """
+        try:
+            new_hash = await self.get_password_hash(password)
+        except HashingPoolSaturated:
+            logger.warning(f"Rehash adiado para usuário ID={user_id}: pool saturado")
+            return
+
+        await self.db.execute(
+            update(User)
+            .where(User.id == user_id, User.hashed_password == current_hash)
+            .values(hashed_password=new_hash)
+        )
+        await self.db.commit()
+        logger.info(f"Hash de senha atualizado para o custo atual: ID={user_id}")
 
     def create_access_token(
         self, data: dict, expires_delta: timedelta | None = None
@@ -59,32 +218,56 @@ class AuthService:
         iat = datetime.now(timezone.utc)
         to_encode.update({"exp": expire})
         to_encode.update({"iat": iat})
+        # Identificador único usado para revogar o token no logout
+        to_encode.update({"jti": uuid.uuid4().hex})
 
         return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
     def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
         """
-        Verifica e decodifica o JWT token
+        Verifica e decodifica o JWT token.
+
+        Tokens já verificados são servidos do token_cache até o seu `exp`; em
+        ambos os casos o `jti` é conferido na lista de tokens revogados.
         """
-        try:
-            # O token já vem sem "Bearer " quando usa HTTPBearer
-            payload = jwt.decode(
-                credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM]
-            )
-            user_id = payload.get("sub")
-            if user_id is None:
+        # O token já vem sem "Bearer " quando usa HTTPBearer
+        token = credentials.credentials
+        payload = token_cache.get(token)
+        if payload is None:
+            try:
+                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            except jwt.PyJWTError:
                 raise HTTPException(
                     status_code=status.HTTP_401_UNAUTHORIZED,
                     detail="Token inválido",
                     headers={"WWW-Authenticate": "Bearer"},
                 )
-            return payload
-        except jwt.PyJWTError:
+
+            if payload.get("sub") is None:
+                raise HTTPException(
+                    status_code=status.HTTP_401_UNAUTHORIZED,
+                    detail="Token inválido",
+                    headers={"WWW-Authenticate": "Bearer"},
+                )
+
+            token_cache.put(token, payload)
+
+        jti = payload.get("jti")
+        if jti and token_denylist.is_revoked(jti):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token inválido",
+                detail="Token revogado",
                 headers={"WWW-Authenticate": "Bearer"},
             )
+        return payload
+
+    def revoke_access_token(token: str, token_data: dict) -> None:
+        """
+        Revoga um access token até o seu `exp`.
+        """
+        token_cache.discard(token)
+        if token_data.get("jti"):
+            token_denylist.revoke(token_data["jti"], token_data["exp"])
 
     def get_current_user(token_data: dict = Depends(verify_token)):
         """
@@ -0,0 +1,53 @@
+import hashlib
+import re
+from typing import Iterable, List, Optional, Tuple
+
+
+def user_etag(user_id: int, version: int) -> str:
+    """ETag forte de um usuário, derivado da versão da linha."""
+    return f'"u{user_id}v{version}"'
+
+
+def list_etag(versions: Iterable[Tuple[int, int]], extra: str = "") -> str:
+    """ETag de uma página de usuários a partir dos pares (id, versão)."""
+    digest = hashlib.sha256(extra.encode("utf-8"))
+    for user_id, version in versions:
+        digest.update(f"{user_id}:{version};".encode("ascii"))
+    return f'"l{digest.hexdigest()[:32]}"'
+
+
+def _tags(header: str):
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag:
+            yield tag
+
+
+def etag_matches_none(header: Optional[str], etag: str) -> bool:
+    """
+    Verifica If-None-Match: comparação fraca, então W/"x" casa com "x".
+    """
+    if not header:
+        return False
+    return any(tag == "*" or tag.removeprefix("W/") == etag for tag in _tags(header))
+
+
+def if_match_versions(header: Optional[str], user_id: int) -> Optional[List[int]]:
+    """
+    Converte o If-Match nas versões do usuário que ele aceita, para filtrar o
+    UPDATE. Retorna None quando qualquer versão serve (sem cabeçalho ou "*").
+
+    A comparação é forte: ETags fracas ou de outro usuário não aceitam nenhuma
+    versão.
+    """
+    if header is None:
+        return None
+    pattern = re.compile(rf'"u{user_id}v(\d+)"')
+    versions = []
+    for tag in _tags(header):
+        if tag == "*":
+            return None
+        match = pattern.fullmatch(tag)
+        if match:
+            versions.append(int(match.group(1)))
+    return versions
@@ -0,0 +1,32 @@
+import base64
+import binascii
+import json
+from typing import Any, List
+
+
+def encode_cursor(sort: str, values: List[Any]) -> str:
+    """
+    Gera um cursor opaco com a ordenação e a chave do último item da página.
+    """
+    payload = json.dumps({"s": sort, "k": values}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, sort: str) -> List[Any]:
+    """
+    Retorna a chave contida no cursor.
+
+    Raises:
+        ValueError: Se o cursor for malformado ou de outra ordenação
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (UnicodeEncodeError, binascii.Error, ValueError):
+        raise ValueError("Cursor inválido")
+
+    if not isinstance(payload, dict) or payload.get("s") != sort:
+        raise ValueError("Cursor inválido")
+    values = payload.get("k")
+    if not isinstance(values, list):
+        raise ValueError("Cursor inválido")
+    return values
@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import math
+import multiprocessing
+import os
+import statistics
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+HASH_POOL_SIZE = int(os.getenv("HASH_POOL_SIZE", str(os.cpu_count() or 1)))
+HASH_QUEUE_DEPTH = int(os.getenv("HASH_QUEUE_DEPTH", "64"))
+# Custo fixo do bcrypt; se ausente, o custo é calibrado para BCRYPT_TARGET_MS
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS")) if os.getenv("BCRYPT_ROUNDS") else None
+BCRYPT_TARGET_MS = float(os.getenv("BCRYPT_TARGET_MS", "250"))
+# Medições na calibração; a mediana descarta amostras atrasadas por ruído
+BCRYPT_CALIBRATION_SAMPLES = int(os.getenv("BCRYPT_CALIBRATION_SAMPLES", "5"))
+# Hashes com custo acima do alvo até esta diferença não são regravados, para
+# que workers calibrados com custos vizinhos não regravem a mesma senha
+# alternadamente
+BCRYPT_REHASH_TOLERANCE = int(os.getenv("BCRYPT_REHASH_TOLERANCE", "1"))
+BCRYPT_MIN_ROUNDS = 4
+BCRYPT_MAX_ROUNDS = 31
+_CALIBRATION_ROUNDS = 8
+
+
+class HashingPoolSaturated(Exception):
+    """Levantada quando o pool de hashing não aceita mais tarefas."""
+
+
+def _hash_password(password: bytes, rounds: int) -> tuple[bytes, float]:
+    start = time.perf_counter()
+    hashed = bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+    return hashed, time.perf_counter() - start
+
+
+def _check_password(password: bytes, hashed: bytes) -> tuple[bool, float]:
+    start = time.perf_counter()
+    valid = bcrypt.checkpw(password, hashed)
+    return valid, time.perf_counter() - start
+
+
+def calibrate_rounds(
+    target_ms: float = BCRYPT_TARGET_MS, samples: int = BCRYPT_CALIBRATION_SAMPLES
+) -> int:
+    """
+    Retorna o maior custo do bcrypt cujo hash cabe em `target_ms` nesta máquina.
+
+    Cada incremento de custo dobra o tempo de hash, então basta medir um custo
+    baixo e extrapolar, pela mediana de `samples` medições.
+    """
+    elapsed = statistics.median(
+        _hash_password(b"calibration", _CALIBRATION_ROUNDS)[1]
+        for _ in range(max(samples, 1))
+    )
+    elapsed_ms = max(elapsed * 1000, 1e-3)
+    rounds = _CALIBRATION_ROUNDS + math.floor(math.log2(target_ms / elapsed_ms))
+    return min(max(rounds, BCRYPT_MIN_ROUNDS), BCRYPT_MAX_ROUNDS)
+
+
+def get_rounds(hashed_password: str) -> Optional[int]:
+    """Extrai o custo de um hash no formato $2b$12$..."""
+    parts = hashed_password.split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+class HashingMetrics:
+    """
+    Contadores de latência e espera em fila das operações de hashing.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_latency = 0.0
+        self.total_queue_wait = 0.0
+        self.max_latency = 0.0
+        self.max_queue_wait = 0.0
+
+    def record_submit(self):
+        with self._lock:
+            self.submitted += 1
+
+    def record_rejection(self):
+        with self._lock:
+            self.rejected += 1
+
+    def record_failure(self):
+        with self._lock:
+            self.failed += 1
+
+    def record(self, latency: float, queue_wait: float):
+        with self._lock:
+            self.completed += 1
+            self.total_latency += latency
+            self.total_queue_wait += queue_wait
+            self.max_latency = max(self.max_latency, latency)
+            self.max_queue_wait = max(self.max_queue_wait, queue_wait)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            completed = self.completed or 1
+            return {
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_latency_ms": self.total_latency / completed * 1000,
+                "avg_queue_wait_ms": self.total_queue_wait / completed * 1000,
+                "max_latency_ms": self.max_latency * 1000,
+                "max_queue_wait_ms": self.max_queue_wait * 1000,
+            }
+
+
+class PasswordHasher:
+    """
+    Executa bcrypt em um pool de processos limitado.
+
+    O pool aceita até `pool_size + queue_depth` tarefas simultâneas; acima disso
+    as novas requisições são rejeitadas com HashingPoolSaturated em vez de
+    enfileirar indefinidamente.
+    """
+
+    def __init__(
+        self,
+        pool_size: int = HASH_POOL_SIZE,
+        queue_depth: int = HASH_QUEUE_DEPTH,
+        rounds: Optional[int] = BCRYPT_ROUNDS,
+    ):
+        self.pool_size = max(pool_size, 1)
+        self.queue_depth = max(queue_depth, 0)
+        # Custo fixado pelo construtor (ou BCRYPT_ROUNDS); None calibra
+        self._pinned_rounds = rounds
+        self._rounds = rounds
+        self.metrics = HashingMetrics()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def rounds(self) -> int:
+        if self._rounds is None:
+            self.calibrate()
+        return self._rounds
+
+    def calibrate(self, target_ms: float = BCRYPT_TARGET_MS) -> int:
+        """
+        Define o custo do bcrypt pelo tempo medido, exceto quando foi fixado
+        (BCRYPT_ROUNDS ou o argumento `rounds`).
+
+        A medição varia entre hosts e workers; em produção, fixe BCRYPT_ROUNDS
+        para que toda a implantação use o mesmo custo.
+        """
+        if self._pinned_rounds is not None:
+            self._rounds = self._pinned_rounds
+        else:
+            self._rounds = calibrate_rounds(target_ms)
+            logger.info(f"Custo do bcrypt calibrado para {self._rounds}")
+        return self._rounds
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """
+        Indica se o hash deve ser regravado: custo abaixo do atual, ou acima dele
+        por mais de BCRYPT_REHASH_TOLERANCE.
+        """
+        current = get_rounds(hashed_password)
+        if current is None:
+            return False
+        return current < self.rounds or current > self.rounds + BCRYPT_REHASH_TOLERANCE
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.pool_size,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                logger.info(f"Pool de hashing iniciado com {self.pool_size} processos")
+            return self._executor
+
+    def _acquire(self):
+        with self._lock:
+            if self._in_flight >= self.pool_size + self.queue_depth:
+                self.metrics.record_rejection()
+                raise HashingPoolSaturated("Pool de hashing saturado")
+            self._in_flight += 1
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._in_flight -= 1
+
+    async def _submit(self, fn, *args):
+        executor = self._get_executor()
+        self._acquire()
+        self.metrics.record_submit()
+        submitted_at = time.perf_counter()
+        try:
+            future = executor.submit(fn, *args)
+        except Exception:
+            self._release()
+            self.metrics.record_failure()
+            raise
+        # A vaga só é liberada quando o processo termina, mesmo que a requisição
+        # tenha sido cancelada antes disso.
+        future.add_done_callback(self._release)
+
+        try:
+            result, compute_time = await asyncio.wrap_future(future)
+        except Exception:
+            self.metrics.record_failure()
+            raise
+
+        latency = time.perf_counter() - submitted_at
+        self.metrics.record(latency, max(latency - compute_time, 0.0))
+        return result
+
+    async def hash(self, password: str) -> str:
+        hashed = await self._submit(
+            _hash_password, password.encode("utf-8"), self.rounds
+        )
+        return hashed.decode("utf-8")
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._submit(
+            _check_password, password.encode("utf-8"), hashed_password.encode("utf-8")
+        )
+
+    def stats(self) -> dict:
+        return {
+            "pool_size": self.pool_size,
+            "queue_depth": self.queue_depth,
+            "rounds": self._rounds,
+            "in_flight": self._in_flight,
+            **self.metrics.snapshot(),
+        }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+            logger.info("Pool de hashing finalizado")
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,253 @@
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Iterable
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import IntegrityError
+
+from app.database import get_sessionmaker
+from app.models.revoked_token import RevokedToken
+
+logger = logging.getLogger(__name__)
+
+TOKEN_DENYLIST_BACKEND = os.getenv("TOKEN_DENYLIST_BACKEND", "database")
+TOKEN_DENYLIST_REDIS_URL = os.getenv(
+    "TOKEN_DENYLIST_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0")
+)
+TOKEN_DENYLIST_SYNC_SECONDS = float(os.getenv("TOKEN_DENYLIST_SYNC_SECONDS", "30"))
+TOKEN_DENYLIST_CAPACITY = int(os.getenv("TOKEN_DENYLIST_CAPACITY", "100000"))
+TOKEN_DENYLIST_ERROR_RATE = float(os.getenv("TOKEN_DENYLIST_ERROR_RATE", "0.001"))
+
+
+class BloomFilter:
+    """
+    Filtro de Bloom sobre um bytearray, com double hashing a partir de um
+    único digest BLAKE2b.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate) / (math.log(2) ** 2)), 8)
+        self.hash_count = max(int(round(self.size / capacity * math.log(2))), 1)
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class InMemoryRevocationStore:
+    """Armazenamento local, usado em testes e em instâncias únicas."""
+
+    def __init__(self):
+        self._entries: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def add(self, jti: str, expires_at: float) -> None:
+        with self._lock:
+            self._entries[jti] = expires_at
+
+    def contains(self, jti: str) -> bool:
+        with self._lock:
+            expires_at = self._entries.get(jti)
+        return expires_at is not None and expires_at > time.time()
+
+    def active(self) -> Iterable[str]:
+        now = time.time()
+        with self._lock:
+            return [jti for jti, exp in self._entries.items() if exp > now]
+
+    def purge_expired(self) -> None:
+        now = time.time()
+        with self._lock:
+            for jti in [jti for jti, exp in self._entries.items() if exp <= now]:
+                del self._entries[jti]
+
+
+class DatabaseRevocationStore:
+    """Armazenamento na tabela revoked_tokens."""
+
+    def add(self, jti: str, expires_at: float) -> None:
+        with get_sessionmaker()() as db:
+            db.add(
+                RevokedToken(
+                    jti=jti,
+                    expires_at=datetime.fromtimestamp(expires_at, timezone.utc),
+                )
+            )
+            try:
+                db.commit()
+            except IntegrityError:
+                # Outro worker já revogou o mesmo token (logout repetido)
+                db.rollback()
+
+    def contains(self, jti: str) -> bool:
+        with get_sessionmaker()() as db:
+            return (
+                db.execute(
+                    select(RevokedToken.id).where(
+                        RevokedToken.jti == jti,
+                        RevokedToken.expires_at > datetime.now(timezone.utc),
+                    )
+                ).first()
+                is not None
+            )
+
+    def active(self) -> Iterable[str]:
+        with get_sessionmaker()() as db:
+            return db.scalars(
+                select(RevokedToken.jti).where(
+                    RevokedToken.expires_at > datetime.now(timezone.utc)
+                )
+            ).all()
+
+    def purge_expired(self) -> None:
+        with get_sessionmaker()() as db:
+            db.execute(
+                delete(RevokedToken).where(
+                    RevokedToken.expires_at <= datetime.now(timezone.utc)
+                )
+            )
+            db.commit()
+
+
+class RedisRevocationStore:
+    """Armazenamento no Redis; as chaves expiram sozinhas no `exp` do token."""
+
+    def __init__(self, url: str, prefix: str = "revoked:"):
+        import redis
+
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def add(self, jti: str, expires_at: float) -> None:
+        ttl = max(int(math.ceil(expires_at - time.time())), 1)
+        self._client.set(f"{self.prefix}{jti}", 1, ex=ttl)
+
+    def contains(self, jti: str) -> bool:
+        return bool(self._client.exists(f"{self.prefix}{jti}"))
+
+    def active(self) -> Iterable[str]:
+        offset = len(self.prefix)
+        return [
+            key.decode("utf-8")[offset:]
+            for key in self._client.scan_iter(match=f"{self.prefix}*", count=1000)
+        ]
+
+    def purge_expired(self) -> None:
+        pass
+
+
+class TokenDenylist:
+    """
+    Lista de tokens revogados (por `jti`) com um filtro de Bloom na frente.
+
+    Um token ausente do filtro certamente não foi revogado, então a maioria
+    das verificações não faz I/O. Só os positivos (revogados de fato ou falsos
+    positivos) consultam o armazenamento. O filtro é reconstruído a partir do
+    armazenamento a cada `sync_interval` segundos, o que também descarta as
+    entradas expiradas e propaga revogações feitas por outros workers.
+    """
+
+    def __init__(
+        self,
+        store,
+        sync_interval: float = TOKEN_DENYLIST_SYNC_SECONDS,
+        capacity: int = TOKEN_DENYLIST_CAPACITY,
+        error_rate: float = TOKEN_DENYLIST_ERROR_RATE,
+    ):
+        self.store = store
+        self.sync_interval = sync_interval
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.checks = 0
+        self.store_lookups = 0
+        self.revoked_hits = 0
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._last_sync = 0.0
+        self._lock = threading.Lock()
+
+    def sync(self) -> None:
+        """Reconstrói o filtro com as revogações ainda válidas."""
+        self.store.purge_expired()
+        active = list(self.store.active())
+        bloom = BloomFilter(max(self.capacity, len(active) * 2), self.error_rate)
+        for jti in active:
+            bloom.add(jti)
+        self._bloom = bloom
+        self._last_sync = time.monotonic()
+
+    def _maybe_sync(self) -> None:
+        if time.monotonic() - self._last_sync < self.sync_interval:
+            return
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self.sync()
+        except Exception as e:
+            # Mantém o filtro atual; a próxima verificação tenta de novo
+            logger.error(f"Falha ao sincronizar lista de tokens revogados: {e}")
+            self._last_sync = time.monotonic()
+        finally:
+            self._lock.release()
+
+    def revoke(self, jti: str, expires_at: float) -> None:
+        # Serializado com sync() para a revogação não se perder na troca do filtro
+        with self._lock:
+            self.store.add(jti, expires_at)
+            self._bloom.add(jti)
+
+    def is_revoked(self, jti: str) -> bool:
+        self._maybe_sync()
+        self.checks += 1
+        if jti not in self._bloom:
+            return False
+
+        self.store_lookups += 1
+        revoked = self.store.contains(jti)
+        if revoked:
+            self.revoked_hits += 1
+        return revoked
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.store).__name__,
+            "bloom_bits": self._bloom.size,
+            "bloom_hashes": self._bloom.hash_count,
+            "bloom_entries": self._bloom.count,
+            "checks": self.checks,
+            "store_lookups": self.store_lookups,
+            "revoked_hits": self.revoked_hits,
+            "seconds_since_sync": time.monotonic() - self._last_sync,
+        }
+
+
+def _build_store():
+    if TOKEN_DENYLIST_BACKEND == "memory":
+        return InMemoryRevocationStore()
+    if TOKEN_DENYLIST_BACKEND == "redis":
+        return RedisRevocationStore(TOKEN_DENYLIST_REDIS_URL)
+    return DatabaseRevocationStore()
+
+
+token_denylist = TokenDenylist(_build_store())
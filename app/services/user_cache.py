@@ -0,0 +1,336 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# L2 compartilhado entre workers: none, memory ou redis
+USER_CACHE_BACKEND = os.getenv("USER_CACHE_BACKEND", "none")
+USER_CACHE_REDIS_URL = os.getenv(
+    "USER_CACHE_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0")
+)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+# O L1 é local ao worker e só vê as invalidações feitas por ele, então o TTL
+# limita por quanto tempo os outros workers servem um registro alterado.
+USER_CACHE_L1_TTL = float(os.getenv("USER_CACHE_L1_TTL", "5"))
+USER_CACHE_L2_TTL = float(os.getenv("USER_CACHE_L2_TTL", "60"))
+# Por quanto tempo uma invalidação impede que o L2 seja preenchido; cobre as
+# cargas de outros workers que leram a linha antes da escrita
+USER_CACHE_TOMBSTONE_TTL = float(os.getenv("USER_CACHE_TOMBSTONE_TTL", "5"))
+
+# Valor gravado no L2 no lugar do usuário invalidado
+TOMBSTONE = "-"
+
+
+def _should_fill(current: Optional[str], version: int) -> bool:
+    """
+    Se uma carga com a `version` do usuário pode substituir o valor atual do
+    L2: não sobrescreve uma lápide nem uma versão igual ou mais nova.
+    """
+    if current is None:
+        return True
+    if current == TOMBSTONE:
+        return False
+    return json.loads(current).get("version", -1) < version
+
+
+class LocalTTLCache:
+    """LRU em memória com expiração por entrada."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.evictions = 0
+        self._entries: OrderedDict[int, tuple[dict, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: int) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return dict(value)
+
+    def put(self, key: int, value: dict) -> None:
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (dict(value), time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, key: int) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class InMemoryCacheBackend:
+    """L2 local, usado em testes no lugar do Redis."""
+
+    def __init__(self):
+        self._entries: dict[str, tuple[str, float]] = {}
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        return entry[0]
+
+    async def fill(self, key: str, value: str, version: int, ttl: float) -> None:
+        if _should_fill(await self.get(key), version):
+            self._entries[key] = (value, time.monotonic() + ttl)
+
+    async def invalidate(self, key: str, ttl: float) -> None:
+        self._entries[key] = (TOMBSTONE, time.monotonic() + ttl)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+
+
+class RedisCacheBackend:
+    """L2 no Redis, compartilhado entre workers e instâncias."""
+
+    # Mesma regra de _should_fill, atômica no Redis
+    FILL_SCRIPT = """
+    local current = redis.call('GET', KEYS[1])
+    if current then
+        if current == ARGV[3] then
+            return 0
+        end
+        local ok, decoded = pcall(cjson.decode, current)
+        if ok and tonumber(decoded['version'] or -1) >= tonumber(ARGV[2]) then
+            return 0
+        end
+    end
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[4])
+    return 1
+    """
+
+    def __init__(self, url: str, prefix: str = "user:"):
+        import redis.asyncio
+
+        self.prefix = prefix
+        self._client = redis.asyncio.Redis.from_url(url)
+        self._fill = self._client.register_script(self.FILL_SCRIPT)
+
+    async def get(self, key: str) -> Optional[str]:
+        value = await self._client.get(self.prefix + key)
+        return value.decode("utf-8") if value is not None else None
+
+    async def fill(self, key: str, value: str, version: int, ttl: float) -> None:
+        await self._fill(
+            keys=[self.prefix + key],
+            args=[value, version, TOMBSTONE, int(ttl * 1000)],
+        )
+
+    async def invalidate(self, key: str, ttl: float) -> None:
+        await self._client.set(self.prefix + key, TOMBSTONE, px=int(ttl * 1000))
+
+    async def clear(self) -> None:
+        async for key in self._client.scan_iter(match=f"{self.prefix}*", count=1000):
+            await self._client.delete(key)
+
+
+class _LoadCancelled(Exception):
+    """Entregue a quem esperava uma carga cuja tarefa foi cancelada."""
+
+
+class UserCache:
+    """
+    Cache read-through dos dados públicos de usuários, por id.
+
+    A consulta passa pelo L1 (LRU local com TTL), depois pelo L2 opcional
+    (Redis) e só então pelo banco. Misses simultâneos para o mesmo id
+    compartilham uma única carga (single-flight). Usuários inexistentes não
+    são guardados.
+
+    No L2, a invalidação grava uma lápide por USER_CACHE_TOMBSTONE_TTL e o
+    preenchimento nunca substitui uma lápide nem uma versão igual ou mais nova,
+    para que a carga de um worker que leu a linha antes da escrita de outro não
+    grave o valor antigo.
+    """
+
+    def __init__(
+        self,
+        l2=None,
+        max_size: int = USER_CACHE_SIZE,
+        l1_ttl: float = USER_CACHE_L1_TTL,
+        l2_ttl: float = USER_CACHE_L2_TTL,
+        tombstone_ttl: float = USER_CACHE_TOMBSTONE_TTL,
+    ):
+        self.l1 = LocalTTLCache(max_size, l1_ttl)
+        self.l2 = l2
+        self.l2_ttl = l2_ttl
+        self.tombstone_ttl = tombstone_ttl
+        self.l1_hits = 0
+        self.l2_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.invalidations = 0
+        self.l2_errors = 0
+        self._inflight: dict[int, asyncio.Future] = {}
+        # Geração de cada id com carga em andamento, incrementada quando ele é
+        # invalidado; a carga iniciada antes disso não grava o valor que leu.
+        self._generations: dict[int, int] = {}
+
+    async def _l2_get(self, user_id: int) -> Optional[dict]:
+        try:
+            value = await self.l2.get(str(user_id))
+        except Exception as e:
+            self.l2_errors += 1
+            logger.error(f"Falha ao ler cache de usuários: {e}")
+            return None
+        if value is None or value == TOMBSTONE:
+            return None
+        return json.loads(value)
+
+    async def _l2_call(self, method: str, *args) -> None:
+        try:
+            await getattr(self.l2, method)(*args)
+        except Exception as e:
+            self.l2_errors += 1
+            logger.error(f"Falha ao atualizar cache de usuários: {e}")
+
+    async def get(self, user_id: int) -> Optional[dict]:
+        """Consulta o L1 e o L2 sem carregar do banco nem preencher o cache."""
+        value = self.l1.get(user_id)
+        if value is not None:
+            self.l1_hits += 1
+            return value
+        if self.l2 is not None:
+            value = await self._l2_get(user_id)
+            if value is not None:
+                self.l2_hits += 1
+                return value
+        self.misses += 1
+        return None
+
+    async def get_or_load(
+        self, user_id: int, loader: Callable[[], Awaitable[Optional[dict]]]
+    ) -> Optional[dict]:
+        while True:
+            value = self.l1.get(user_id)
+            if value is not None:
+                self.l1_hits += 1
+                return value
+
+            inflight = self._inflight.get(user_id)
+            if inflight is None:
+                break
+            self.coalesced += 1
+            try:
+                value = await asyncio.shield(inflight)
+            except _LoadCancelled:
+                # Quem carregava foi cancelado; um dos que esperavam assume a
+                # carga e os demais passam a esperar por ele
+                continue
+            return dict(value) if value is not None else None
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[user_id] = future
+        self._generations[user_id] = 0
+        try:
+            value = await self._load(user_id, loader)
+        except asyncio.CancelledError:
+            # Não cancela o future: os que esperavam receberiam CancelledError
+            # sem terem sido cancelados
+            future.set_exception(_LoadCancelled())
+            future.exception()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Evita o aviso de exceção não consultada quando ninguém esperava
+            future.exception()
+            raise
+        else:
+            future.set_result(value)
+        finally:
+            self._inflight.pop(user_id, None)
+            self._generations.pop(user_id, None)
+        return dict(value) if value is not None else None
+
+    async def _load(self, user_id: int, loader) -> Optional[dict]:
+        generation = self._generations.get(user_id)
+        if self.l2 is not None:
+            value = await self._l2_get(user_id)
+            if value is not None:
+                self.l2_hits += 1
+                if generation == self._generations.get(user_id):
+                    self.l1.put(user_id, value)
+                return value
+
+        self.misses += 1
+        value = await loader()
+        if value is not None and generation == self._generations.get(user_id):
+            self.l1.put(user_id, value)
+            if self.l2 is not None:
+                await self._l2_call(
+                    "fill",
+                    str(user_id),
+                    json.dumps(value),
+                    value.get("version", 0),
+                    self.l2_ttl,
+                )
+        return value
+
+    async def invalidate(self, user_id: int) -> None:
+        if user_id in self._generations:
+            self._generations[user_id] += 1
+        self.invalidations += 1
+        self.l1.discard(user_id)
+        if self.l2 is not None:
+            await self._l2_call("invalidate", str(user_id), self.tombstone_ttl)
+
+    async def clear(self) -> None:
+        for user_id in self._generations:
+            self._generations[user_id] += 1
+        self.l1.clear()
+        if self.l2 is not None:
+            await self._l2_call("clear")
+
+    def stats(self) -> dict:
+        lookups = self.l1_hits + self.l2_hits + self.misses
+        return {
+            "backend": type(self.l2).__name__ if self.l2 is not None else None,
+            "l1_size": len(self.l1),
+            "l1_max_size": self.l1.max_size,
+            "l1_evictions": self.l1.evictions,
+            "l1_hits": self.l1_hits,
+            "l2_hits": self.l2_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "invalidations": self.invalidations,
+            "l2_errors": self.l2_errors,
+            "hit_rate": (self.l1_hits + self.l2_hits) / lookups if lookups else 0.0,
+        }
+
+
+def _build_l2():
+    if USER_CACHE_BACKEND == "memory":
+        return InMemoryCacheBackend()
+    if USER_CACHE_BACKEND == "redis":
+        return RedisCacheBackend(USER_CACHE_REDIS_URL)
+    return None
+
+
+user_cache = UserCache(_build_l2())
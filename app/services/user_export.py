@@ -0,0 +1,36 @@
+import csv
+import io
+from typing import AsyncIterator, Sequence
+
+import orjson
+from sqlalchemy import Row
+
+# Colunas exportadas; hashed_password nunca sai do banco
+EXPORT_FIELDS = ("id", "nome", "email", "role")
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+async def iter_ndjson(batches: AsyncIterator[Sequence[Row]]) -> AsyncIterator[bytes]:
+    """Converte cada lote de linhas em um chunk NDJSON (um objeto por linha)."""
+    async for rows in batches:
+        yield b"".join(orjson.dumps(row._asdict()) + b"\n" for row in rows)
+
+
+async def iter_csv(batches: AsyncIterator[Sequence[Row]]) -> AsyncIterator[str]:
+    """Converte cada lote de linhas em um chunk CSV, precedido do cabeçalho."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    yield buffer.getvalue()
+    async for rows in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(rows)
+        yield buffer.getvalue()
+
+
+EXPORT_FORMATTERS = {"ndjson": iter_ndjson, "csv": iter_csv}
@@ -0,0 +1,125 @@
+import logging
+from typing import List, Optional, Sequence
+
+from sqlalchemy import Row, column, func, literal_column, or_, select, table
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Índices de trigramas só servem termos com pelo menos 3 caracteres
+MIN_INDEXED_QUERY_LENGTH = 3
+
+# Colunas retornadas quando a busca não pede uma projeção menor
+SEARCH_COLUMNS = (User.id, User.nome, User.email, User.role)
+
+users_fts = table("users_fts", column("rowid"), column("nome"), column("email"))
+
+
+def _like_pattern(query: str) -> str:
+    escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class LikeSearchBackend:
+    """
+    Busca por substring com ILIKE. Não usa índice; serve termos curtos e
+    bancos sem suporte a trigramas.
+    """
+
+    def _where(self, query: str):
+        pattern = _like_pattern(query)
+        return or_(
+            User.nome.ilike(pattern, escape="\\"),
+            User.email.ilike(pattern, escape="\\"),
+        )
+
+    async def search(
+        self,
+        db: AsyncSession,
+        query: str,
+        limit: int,
+        offset: int = 0,
+        columns: Optional[Sequence] = None,
+    ) -> List[Row]:
+        result = await db.execute(
+            select(*(columns or SEARCH_COLUMNS))
+            .where(self._where(query))
+            .order_by(User.nome, User.id)
+            .limit(limit)
+            .offset(offset)
+        )
+        return list(result.all())
+
+
+class PostgresTrigramSearchBackend(LikeSearchBackend):
+    """
+    Busca no Postgres com pg_trgm: o ILIKE '%q%' é servido pelos índices GIN
+    `ix_users_nome_trgm`/`ix_users_email_trgm` e os resultados são ordenados
+    pela similaridade com o termo.
+    """
+
+    async def search(
+        self,
+        db: AsyncSession,
+        query: str,
+        limit: int,
+        offset: int = 0,
+        columns: Optional[Sequence] = None,
+    ) -> List[Row]:
+        if len(query) < MIN_INDEXED_QUERY_LENGTH:
+            return await super().search(db, query, limit, offset, columns)
+
+        score = func.greatest(
+            func.similarity(User.nome, query), func.similarity(User.email, query)
+        )
+        result = await db.execute(
+            select(*(columns or SEARCH_COLUMNS))
+            .where(self._where(query))
+            .order_by(score.desc(), User.id)
+            .limit(limit)
+            .offset(offset)
+        )
+        return list(result.all())
+
+
+class SQLiteFTSSearchBackend(LikeSearchBackend):
+    """
+    Busca no SQLite pela tabela FTS5 `users_fts` (tokenizador trigram), mantida
+    em sincronia com `users` por triggers e ordenada por bm25.
+    """
+
+    async def search(
+        self,
+        db: AsyncSession,
+        query: str,
+        limit: int,
+        offset: int = 0,
+        columns: Optional[Sequence] = None,
+    ) -> List[Row]:
+        if len(query) < MIN_INDEXED_QUERY_LENGTH:
+            return await super().search(db, query, limit, offset, columns)
+
+        # Frase entre aspas: o termo é tratado como substring literal
+        phrase = '"' + query.replace('"', '""') + '"'
+        result = await db.execute(
+            select(*(columns or SEARCH_COLUMNS))
+            .join(users_fts, users_fts.c.rowid == User.id)
+            .where(literal_column("users_fts").op("MATCH")(phrase))
+            .order_by(func.bm25(literal_column("users_fts")), User.id)
+            .limit(limit)
+            .offset(offset)
+        )
+        return list(result.all())
+
+
+SEARCH_BACKENDS = {
+    "postgresql": PostgresTrigramSearchBackend(),
+    "sqlite": SQLiteFTSSearchBackend(),
+}
+
+
+def get_search_backend(dialect_name: str) -> LikeSearchBackend:
+    """Escolhe o backend de busca pelo dialeto do banco."""
+    return SEARCH_BACKENDS.get(dialect_name, LikeSearchBackend())
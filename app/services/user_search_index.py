@@ -0,0 +1,294 @@
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from array import array
+from typing import AsyncIterator, Iterable, List, NamedTuple, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+USER_SEARCH_INDEX_ENABLED = os.getenv("USER_SEARCH_INDEX", "false").lower() == "true"
+# Fração de entradas obsoletas nas postings que dispara a compactação
+USER_SEARCH_INDEX_COMPACT_RATIO = float(
+    os.getenv("USER_SEARCH_INDEX_COMPACT_RATIO", "0.5")
+)
+# Intervalo da reconstrução periódica a partir do banco (0 desativa)
+USER_SEARCH_INDEX_REFRESH_SECONDS = float(
+    os.getenv("USER_SEARCH_INDEX_REFRESH_SECONDS", "60")
+)
+# Idade máxima do índice; acima dela a busca volta para o banco (0 desativa)
+USER_SEARCH_INDEX_MAX_AGE = float(os.getenv("USER_SEARCH_INDEX_MAX_AGE", "300"))
+
+_WORD_SEPARATORS = re.compile(r"[\W_]+")
+
+
+class IndexedUser(NamedTuple):
+    id: int
+    nome: str
+    email: str
+    role: str
+
+
+def _words(text: str) -> List[str]:
+    return [word for word in _WORD_SEPARATORS.split(text) if word]
+
+
+def _keys(nome: str, email: str) -> set:
+    """
+    Chaves de um documento: os trigramas de cada campo e, para termos curtos,
+    os prefixos de 1 e 2 caracteres de cada palavra (marcados com "^").
+    """
+    keys = set()
+    for text in (nome, email):
+        keys.update(text[i : i + 3] for i in range(len(text) - 2))
+        for word in _words(text):
+            keys.update(("^" + word[:1], "^" + word[:2]))
+    return keys
+
+
+class _IndexData:
+    """
+    Conteúdo do índice: documentos, slots e postings.
+
+    O índice troca uma instância inteira a cada reconstrução, montada fora do
+    event loop e sem o lock do índice.
+    """
+
+    def __init__(self):
+        self.docs: dict[int, IndexedUser] = {}
+        self.texts: dict[int, tuple[str, str]] = {}
+        self.slot_of: dict[int, int] = {}
+        self.slot_user = array("I")
+        self.postings: dict[str, array] = {}
+        self.stale = 0
+
+    def _index(self, user_id: int) -> None:
+        slot = len(self.slot_user)
+        self.slot_user.append(user_id)
+        self.slot_of[user_id] = slot
+        for key in _keys(*self.texts[user_id]):
+            postings = self.postings.get(key)
+            if postings is None:
+                postings = self.postings[key] = array("I")
+            postings.append(slot)
+
+    def forget(self, user_id: int) -> None:
+        self.docs.pop(user_id, None)
+        self.texts.pop(user_id, None)
+        if self.slot_of.pop(user_id, None) is not None:
+            self.stale += 1
+
+    def put(self, user) -> None:
+        self.forget(user.id)
+        self.docs[user.id] = IndexedUser(user.id, user.nome, user.email, user.role)
+        self.texts[user.id] = (user.nome.lower(), user.email.lower())
+        self._index(user.id)
+
+    def extend(self, users: Iterable) -> None:
+        for user in users:
+            self.put(user)
+
+    def compact(self) -> None:
+        # Preserva a ordem atual dos documentos
+        order = sorted(self.slot_of, key=self.slot_of.get)
+        self.slot_of = {}
+        self.slot_user = array("I")
+        self.postings = {}
+        self.stale = 0
+        for user_id in order:
+            self._index(user_id)
+
+
+class UserSearchIndex:
+    """
+    Índice invertido de trigramas sobre nome e email, mantido em memória.
+
+    Cada documento indexado ocupa um slot numerado em ordem crescente, e cada
+    chave aponta para um `array("I")` de slots (postings compactas, sempre
+    ordenadas porque só recebem slots novos no fim). Reindexar um usuário
+    ocupa um slot novo e deixa o antigo como lápide; as lápides são puladas na
+    busca e descartadas quando a compactação reconstrói as postings.
+
+    Termos com 3 ou mais caracteres casam por substring, como na busca SQL;
+    termos menores casam pelo início de alguma palavra do nome ou do email.
+    Cada worker tem o seu índice, construído na inicialização e atualizado
+    pelas escritas que passam por ele. As escritas feitas em outros workers só
+    aparecem na próxima reconstrução periódica; se o índice passar de
+    `max_age` segundos sem ser reconstruído, `fresh` fica falso e a busca
+    volta para o banco.
+
+    A reconstrução monta um conteúdo novo em uma thread, enquanto as buscas
+    seguem no atual, e o troca por uma única atribuição. As escritas locais
+    feitas durante a reconstrução são reaplicadas no conteúdo novo antes da
+    troca, para que a leitura mais antiga do banco não as desfaça.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = USER_SEARCH_INDEX_ENABLED,
+        compact_ratio: float = USER_SEARCH_INDEX_COMPACT_RATIO,
+        max_age: float = USER_SEARCH_INDEX_MAX_AGE,
+    ):
+        self.enabled = enabled
+        self.compact_ratio = compact_ratio
+        self.max_age = max_age
+        self.ready = False
+        self.built_at = 0.0
+        self.rebuilds = 0
+        self.replayed = 0
+        self.queries = 0
+        self.compactions = 0
+        self.total_query_time = 0.0
+        self._data = _IndexData()
+        # Escritas locais registradas durante uma reconstrução; None fora dela
+        self._pending: Optional[list] = None
+        self._lock = threading.Lock()
+
+    def _maybe_compact(self) -> None:
+        data = self._data
+        if data.stale > 1000 and data.stale > len(data.docs) * self.compact_ratio:
+            data.compact()
+            self.compactions += 1
+
+    def _swap(self, data: _IndexData) -> None:
+        with self._lock:
+            for user_id, user in self._pending or ():
+                if user is None:
+                    data.forget(user_id)
+                else:
+                    data.put(user)
+            self.replayed += len(self._pending or ())
+            self._pending = None
+            self._data = data
+            self.ready = True
+            self.built_at = time.monotonic()
+            self.rebuilds += 1
+
+    def load(self, users: Iterable) -> None:
+        """Substitui o conteúdo do índice pelos usuários informados."""
+        data = _IndexData()
+        data.extend(users)
+        self._swap(data)
+
+    async def build(self, batches: AsyncIterator[Sequence]) -> None:
+        """
+        Reconstrói o índice a partir dos lotes de `UserService.stream_users`,
+        indexando cada lote em uma thread para não bloquear o event loop.
+        """
+        start = time.perf_counter()
+        with self._lock:
+            self._pending = []
+        data = _IndexData()
+        try:
+            async for rows in batches:
+                await asyncio.to_thread(data.extend, rows)
+        except BaseException:
+            with self._lock:
+                self._pending = None
+            raise
+        self._swap(data)
+        logger.info(
+            f"Índice de busca construído com {len(data.docs)} usuários em "
+            f"{(time.perf_counter() - start) * 1000:.0f}ms"
+        )
+
+    @property
+    def age(self) -> float:
+        """Segundos desde a última carga do índice."""
+        return time.monotonic() - self.built_at if self.ready else 0.0
+
+    @property
+    def fresh(self) -> bool:
+        """Se o índice está pronto e foi carregado há no máximo `max_age`."""
+        return self.ready and (self.max_age <= 0 or self.age <= self.max_age)
+
+    def add(self, user) -> None:
+        """Indexa um usuário novo ou reindexa um usuário alterado."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(
+                    (user.id, IndexedUser(user.id, user.nome, user.email, user.role))
+                )
+            if self.ready:
+                self._data.put(user)
+                self._maybe_compact()
+
+    def remove(self, user_id: int) -> None:
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((user_id, None))
+            if self.ready:
+                self._data.forget(user_id)
+                self._maybe_compact()
+
+    def search(self, query: str, limit: int, offset: int = 0) -> List[IndexedUser]:
+        """
+        Retorna até `limit` usuários, começando em `offset`: primeiro os que
+        têm uma palavra começando com o termo, depois os que só o contêm no
+        meio de uma palavra; dentro de cada grupo vale a ordem do índice.
+        """
+        start = time.perf_counter()
+        query = query.strip().lower()
+        wanted = offset + limit
+        word_start = re.compile(r"(?:^|[\W_])" + re.escape(query))
+        with self._lock:
+            data = self._data
+            if len(query) >= 3:
+                keys = {query[i : i + 3] for i in range(len(query) - 2)}
+            else:
+                keys = {"^" + query}
+            postings = [data.postings.get(key) for key in keys]
+            if not query or any(p is None for p in postings):
+                postings = []
+
+            first, rest = [], []
+            if postings:
+                # A lista mais curta limita os candidatos; o resto é verificado.
+                # Como as listas seguem a ordem dos slots, basta parar ao juntar
+                # resultados suficientes do primeiro grupo.
+                for slot in min(postings, key=len):
+                    user_id = data.slot_user[slot]
+                    if data.slot_of.get(user_id) != slot:
+                        continue
+                    nome, email = data.texts[user_id]
+                    if word_start.search(nome) or word_start.search(email):
+                        first.append(user_id)
+                        if len(first) >= wanted:
+                            break
+                    elif len(query) >= 3 and (query in nome or query in email):
+                        rest.append(user_id)
+
+            results = [data.docs[i] for i in (first + rest)[offset:wanted]]
+
+        self.queries += 1
+        self.total_query_time += time.perf_counter() - start
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            data = self._data
+            return {
+                "enabled": self.enabled,
+                "ready": self.ready,
+                "fresh": self.fresh,
+                "age_seconds": round(self.age, 1),
+                "rebuilds": self.rebuilds,
+                "replayed_writes": self.replayed,
+                "documents": len(data.docs),
+                "keys": len(data.postings),
+                "slots": len(data.slot_user),
+                "stale_slots": data.stale,
+                "postings_bytes": sum(
+                    p.itemsize * len(p) for p in data.postings.values()
+                ),
+                "compactions": self.compactions,
+                "queries": self.queries,
+                "avg_query_us": (
+                    self.total_query_time / self.queries * 1e6 if self.queries else 0.0
+                ),
+            }
+
+
+user_search_index = UserSearchIndex()
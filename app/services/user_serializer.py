@@ -0,0 +1,87 @@
+from operator import attrgetter, itemgetter
+from typing import List, Mapping, Optional, Sequence, Tuple
+
+import orjson
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+
+from app.schemas.user import User
+
+# Campos públicos de um usuário, na ordem do schema de resposta
+USER_FIELDS = tuple(User.model_fields)
+
+# Serialização de referência, com validação pelo schema
+USER_LIST_ADAPTER = TypeAdapter(List[User])
+
+
+def parse_fields(value: Optional[str]) -> Tuple[str, ...]:
+    """
+    Converte o parâmetro `fields` ("id,nome") nos campos pedidos, na ordem do
+    schema. Sem o parâmetro, retorna todos os campos.
+
+    Raises:
+        ValueError: Se algum campo não existir no schema de usuário
+    """
+    if not value:
+        return USER_FIELDS
+    requested = {field.strip() for field in value.split(",") if field.strip()}
+    unknown = requested.difference(USER_FIELDS)
+    if unknown:
+        raise ValueError(f"Campos inválidos: {', '.join(sorted(unknown))}")
+    if not requested:
+        return USER_FIELDS
+    return tuple(field for field in USER_FIELDS if field in requested)
+
+
+def _field_getter(user, fields: Tuple[str, ...]):
+    # Linhas do SQLAlchemy e IndexedUser são tuplas: ler por posição evita a
+    # busca por nome a cada campo
+    row_fields = getattr(user, "_fields", None)
+    if row_fields is not None:
+        positions = [row_fields.index(field) for field in fields]
+        getter = itemgetter(*positions)
+    else:
+        getter = attrgetter(*fields)
+    if len(fields) == 1:
+        # Com um único campo os getters retornam o valor, não uma tupla
+        return lambda user: (getter(user),)
+    return getter
+
+
+def dump_users(users: Sequence, fields: Tuple[str, ...] = USER_FIELDS) -> bytes:
+    """
+    Serializa os `fields` de cada usuário (objetos ORM, linhas ou IndexedUser,
+    todos do mesmo tipo) direto para JSON com orjson.
+
+    Os valores vêm de colunas do banco com os tipos do schema, então não passam
+    de novo pela validação do Pydantic como acontece com `response_model`.
+    """
+    if not users:
+        return b"[]"
+    get_fields = _field_getter(users[0], fields)
+    return orjson.dumps([dict(zip(fields, get_fields(user))) for user in users])
+
+
+class UserListResponse(Response):
+    """
+    Resposta com uma lista de usuários serializada por `dump_users`, só com os
+    campos em `fields`.
+
+    Rotas que a retornam diretamente pulam a validação e a serialização do
+    `response_model`, que continua servindo para a documentação.
+    """
+
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        content: Sequence,
+        fields: Tuple[str, ...] = USER_FIELDS,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+    ):
+        self.fields = fields
+        super().__init__(content, status_code=status_code, headers=headers)
+
+    def render(self, content: Sequence) -> bytes:
+        return dump_users(content, self.fields)
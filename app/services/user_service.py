@@ -1,117 +1,640 @@
+import asyncio
 import logging
-from typing import List, Optional
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
 
-from sqlalchemy.orm import Session
+from sqlalchemy import DateTime, Row, Select, delete, insert, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models.user import User
-from app.schemas.user import UserCreate, UserUpdate
+from app.database import is_replica_session
+from app.models.user import LEGACY_CREATED_AT, User, email_domain
+from app.schemas.user import UserCreate, UserFilters, UserUpdate
 from app.services.auth_service import AuthService
+from app.services.etag import if_match_versions
+from app.services.pagination import decode_cursor, encode_cursor
+from app.services.password_hasher import password_hasher
+from app.services.user_cache import user_cache
+from app.services.user_export import EXPORT_FIELDS
+from app.services.user_search import get_search_backend
+from app.services.user_search_index import user_search_index
+from app.services.user_serializer import USER_FIELDS
+from app.services.user_stats import (
+    UserStatsService,
+    created_deltas,
+    deleted_deltas,
+    merge_deltas,
+    role_changed_deltas,
+)
 
 # Cria logger para este módulo
 logger = logging.getLogger(__name__)
 
+# Campos guardados no cache de usuários; a versão alimenta as ETags
+CACHED_USER_FIELDS = EXPORT_FIELDS + ("version",)
+
+# Tamanho máximo de um lote nos endpoints /users/bulk, em itens e em bytes
+USERS_BULK_MAX_ITEMS = 1000
+USERS_BULK_MAX_BYTES = 2 * 1024 * 1024
+
+# Colunas da chave de paginação para cada ordenação; o id desempata. Com o
+# prefixo "-" a ordem é decrescente e usa os mesmos índices, lidos ao contrário.
+USER_SORT_KEYS = {
+    "id": (User.id,),
+    "nome": (User.nome, User.id),
+    "created_at": (User.created_at, User.id),
+}
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Datas sem fuso são tratadas como UTC, como as gravadas pela aplicação
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _to_cursor(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _from_cursor(column, value):
+    if isinstance(column.type, DateTime):
+        try:
+            return datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            raise ValueError("Cursor inválido")
+    return value
+
+
+class UserVersionConflict(Exception):
+    """Levantada quando o If-Match não corresponde à versão atual do usuário."""
+
 
 class UserService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
         self.auth_service = AuthService(db)
+        self.stats_service = UserStatsService(db)
         logger.debug("UserService inicializado")
 
-    def get_users(self) -> List[User]:
-        return self.db.query(User).all()
+    def build_users_query(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        sort: str = "id",
+        fields: Sequence[str] = USER_FIELDS,
+        filters: Optional[UserFilters] = None,
+    ) -> Select:
+        """
+        Monta o SELECT de uma página de GET /users.
+
+        Raises:
+            ValueError: Se o cursor for inválido
+        """
+        descending = sort.startswith("-")
+        columns = USER_SORT_KEYS[sort.removeprefix("-")]
+        needed = {"id", "version", *fields}
+        selected = [getattr(User, f) for f in CACHED_USER_FIELDS if f in needed]
+        # A chave de ordenação entra na projeção para gerar o próximo cursor
+        selected += [c for c in columns if c.key not in needed]
+        query = select(*selected)
+
+        if filters is not None:
+            if filters.role:
+                query = query.where(User.role == filters.role)
+            if filters.email_domain:
+                query = query.where(User.email_domain == filters.email_domain)
+            if filters.created_after:
+                created_after = max(_as_utc(filters.created_after), LEGACY_CREATED_AT)
+                query = query.where(User.created_at > created_after)
 
-    def get_user_by_id(self, user_id: int) -> Optional[User]:
-        return self.db.query(User).filter(User.id == user_id).first()
+        if cursor:
+            values = decode_cursor(cursor, sort)
+            if len(values) != len(columns):
+                raise ValueError("Cursor inválido")
+            values = [_from_cursor(c, v) for c, v in zip(columns, values)]
+            if len(columns) == 1:
+                key, bound = columns[0], values[0]
+            else:
+                key, bound = tuple_(*columns), tuple_(*values)
+            query = query.where(key < bound if descending else key > bound)
 
-    def get_user_by_email(self, email: str) -> Optional[User]:
-        return self.db.query(User).filter(User.email == email).first()
+        order = [c.desc() for c in columns] if descending else columns
+        return query.order_by(*order).limit(limit + 1)
+
+    async def get_users(
+        self,
+        limit: int,
+        cursor: Optional[str] = None,
+        sort: str = "id",
+        fields: Sequence[str] = USER_FIELDS,
+        filters: Optional[UserFilters] = None,
+    ) -> Tuple[List[Row], Optional[str]]:
+        """
+        Retorna uma página de usuários e o cursor da página seguinte.
+
+        A paginação é por keyset: a página seguinte começa logo após a chave do
+        último item, então o custo não depende de quantas páginas já passaram.
+        As linhas trazem só os `fields` pedidos, mais o id, a versão e a chave
+        de ordenação, sem montar objetos ORM. Cada filtro e ordenação tem um
+        índice correspondente (ver `User.__table_args__`).
+
+        Raises:
+            ValueError: Se o cursor for inválido
+        """
+        query = self.build_users_query(limit, cursor, sort, fields, filters)
+        users = list((await self.db.execute(query)).all())
+        if len(users) <= limit:
+            return users, None
+
+        users = users[:limit]
+        last = users[-1]
+        columns = USER_SORT_KEYS[sort.removeprefix("-")]
+        return users, encode_cursor(
+            sort, [_to_cursor(getattr(last, c.key)) for c in columns]
+        )
+
+    async def stream_users(
+        self, batch_size: int = 1000
+    ) -> AsyncIterator[Sequence[Row]]:
+        """
+        Percorre todos os usuários com um cursor do lado do servidor, entregando
+        lotes de até `batch_size` linhas sem carregar a tabela em memória.
+        """
+        columns = [getattr(User, field) for field in EXPORT_FIELDS]
+        result = await self.db.stream(
+            select(*columns).order_by(User.id).execution_options(yield_per=batch_size)
+        )
+        # Iterar por lote evita uma troca de contexto async a cada linha
+        async for rows in result.partitions():
+            yield rows
 
-    def create_user(self, user_data: UserCreate) -> User:
+    async def get_user_by_id(self, user_id: int) -> Optional[User]:
+        return await self.db.get(User, user_id)
+
+    async def get_cached_user(self, user_id: int) -> Optional[dict]:
+        """
+        Retorna os dados públicos do usuário, passando pelo cache de usuários.
+
+        Leituras em réplica consultam o cache mas não o preenchem: uma réplica
+        atrasada gravaria a linha antiga, servida depois até para quem acabou
+        de escrever e lê do primário.
+        """
+
+        async def load() -> Optional[dict]:
+            user = await self.get_user_by_id(user_id)
+            if user is None:
+                return None
+            return {field: getattr(user, field) for field in CACHED_USER_FIELDS}
+
+        if is_replica_session(self.db):
+            cached = await user_cache.get(user_id)
+            return cached if cached is not None else await load()
+        return await user_cache.get_or_load(user_id, load)
+
+    async def get_user_version(self, user_id: int) -> Optional[int]:
+        """Lê só a versão do usuário, sem carregar a linha inteira."""
+        return await self.db.scalar(select(User.version).where(User.id == user_id))
+
+    async def get_user_by_email(self, email: str) -> Optional[User]:
+        result = await self.db.scalars(select(User).where(User.email == email))
+        return result.first()
+
+    async def create_user(self, user_data: UserCreate) -> User:
+        """
+        Cria o usuário com um único INSERT ... RETURNING.
+
+        A unicidade do email fica a cargo do índice único: não há consulta
+        prévia, então dois cadastros simultâneos com o mesmo email não passam
+        os dois por uma verificação.
+
+        Raises:
+            ValueError: Se o email já estiver em uso
+        """
         logger.info(f"Tentativa de criar usuário: {user_data.email}")
 
-        if self.get_user_by_email(user_data.email):
+        hashed_password = await self.auth_service.get_password_hash(user_data.password)
+
+        try:
+            db_user = await self.db.scalar(
+                insert(User)
+                .values(
+                    nome=user_data.nome,
+                    email=user_data.email,
+                    hashed_password=hashed_password,
+                    role=user_data.role or "user",
+                )
+                .returning(User)
+            )
+        except IntegrityError:
+            await self.db.rollback()
             logger.warning(f"Email já em uso: {user_data.email}")
             raise ValueError("Email já está em uso")
 
-        hashed_password = self.auth_service.get_password_hash(user_data.password)
+        await self.stats_service.apply(created_deltas(db_user.role, db_user.created_at))
+        await self.db.commit()
+        user_search_index.add(db_user)
+
+        logger.info(
+            f"Usuário criado com sucesso: ID={db_user.id}, Email={db_user.email}"
+        )
+        return db_user
+
+    async def _existing_emails(self, emails: List[str]) -> set:
+        result = await self.db.scalars(select(User.email).where(User.email.in_(emails)))
+        return set(result.all())
+
+    async def bulk_create_users(self, items: List[UserCreate]) -> List[dict]:
+        """
+        Cria vários usuários em uma única transação.
+
+        As colisões de email são verificadas em uma consulta, as senhas são
+        geradas em paralelo no pool de hashing e os usuários são inseridos com
+        um único INSERT ... RETURNING. Retorna o resultado de cada item, na
+        ordem recebida.
+        """
+        results: List[Optional[dict]] = [None] * len(items)
+        existing = await self._existing_emails([item.email for item in items])
+        pending = {}
+        for index, item in enumerate(items):
+            if item.email in existing:
+                detail = "Email já está em uso"
+            elif item.email in pending:
+                detail = "Email repetido no lote"
+            else:
+                pending[item.email] = index
+                continue
+            results[index] = {
+                "index": index,
+                "email": item.email,
+                "status": "error",
+                "detail": detail,
+            }
 
-        db_user = User(
-            nome=user_data.nome,
-            email=user_data.email,
-            hashed_password=hashed_password,
-            role=user_data.role or "user",
+        # Mantém os processos ocupados sem tomar a fila do pool, que é
+        # compartilhada com logins e cadastros individuais: o lote usa no
+        # máximo metade da capacidade (processos + fila), senão o próprio lote
+        # recebe HashingPoolSaturated
+        capacity = password_hasher.pool_size + password_hasher.queue_depth
+        semaphore = asyncio.Semaphore(
+            max(1, min(password_hasher.pool_size * 2, capacity // 2))
         )
 
-        self.db.add(db_user)
-        self.db.commit()
-        self.db.refresh(db_user)
+        async def hash_password(password: str) -> str:
+            async with semaphore:
+                return await self.auth_service.get_password_hash(password)
+
+        hashes = await asyncio.gather(
+            *(hash_password(items[index].password) for index in pending.values())
+        )
+        rows = [
+            {
+                "nome": items[index].nome,
+                "email": email,
+                "hashed_password": hashed_password,
+                "role": items[index].role or "user",
+            }
+            for (email, index), hashed_password in zip(pending.items(), hashes)
+        ]
+
+        created = []
+        while rows:
+            try:
+                result = await self.db.execute(
+                    insert(User).returning(
+                        User.id, User.nome, User.email, User.role, User.created_at
+                    ),
+                    rows,
+                )
+                created = result.all()
+                await self.stats_service.apply(
+                    merge_deltas(
+                        *(created_deltas(row.role, row.created_at) for row in created)
+                    )
+                )
+                await self.db.commit()
+                break
+            except IntegrityError:
+                # Outro cadastro usou um dos emails depois da verificação
+                await self.db.rollback()
+                taken = await self._existing_emails([row["email"] for row in rows])
+                if not taken:
+                    raise
+                for email in taken:
+                    index = pending[email]
+                    results[index] = {
+                        "index": index,
+                        "email": email,
+                        "status": "error",
+                        "detail": "Email já está em uso",
+                    }
+                rows = [row for row in rows if row["email"] not in taken]
+
+        for row in created:
+            user_search_index.add(row)
+            index = pending[row.email]
+            results[index] = {
+                "index": index,
+                "id": row.id,
+                "email": row.email,
+                "status": "created",
+            }
 
         logger.info(
-            f"Usuário criado com sucesso: ID={db_user.id}, Email={db_user.email}"
+            f"Cadastro em lote: {len(created)} de {len(items)} usuários criados"
         )
-        return db_user
+        return results
+
+    @staticmethod
+    def _bulk_targets(ids: List[int]) -> Tuple[List[Optional[dict]], Dict[int, int]]:
+        """
+        Separa os ids repetidos no lote. Retorna os resultados já conhecidos,
+        por posição, e a posição de cada id a processar.
+        """
+        results: List[Optional[dict]] = [None] * len(ids)
+        positions: Dict[int, int] = {}
+        for index, user_id in enumerate(ids):
+            if user_id in positions:
+                results[index] = {
+                    "index": index,
+                    "id": user_id,
+                    "status": "error",
+                    "detail": "Id repetido no lote",
+                }
+            else:
+                positions[user_id] = index
+        return results, positions
+
+    @staticmethod
+    def _fill_not_found(
+        results: List[Optional[dict]], positions: Dict[int, int]
+    ) -> List[dict]:
+        for user_id, index in positions.items():
+            if results[index] is None:
+                results[index] = {
+                    "index": index,
+                    "id": user_id,
+                    "status": "error",
+                    "detail": "Usuário não encontrado",
+                }
+        return results
+
+    async def bulk_update_users(self, ids: List[int], role: str) -> List[dict]:
+        """
+        Altera a role de vários usuários em uma única transação.
+
+        As roles atuais são lidas em uma consulta (para ajustar os contadores)
+        e só os usuários com role diferente recebem um único UPDATE ... WHERE
+        id IN, que também incrementa a versão. Retorna o resultado de cada id,
+        na ordem recebida.
+        """
+        results, positions = self._bulk_targets(ids)
+        current = (
+            await self.db.execute(
+                select(User.id, User.role)
+                .where(User.id.in_(positions))
+                .with_for_update()
+            )
+        ).all()
+
+        changed_ids = [row.id for row in current if row.role != role]
+        for row in current:
+            if row.role == role:
+                index = positions[row.id]
+                results[index] = {"index": index, "id": row.id, "status": "unchanged"}
+
+        updated = []
+        if changed_ids:
+            result = await self.db.execute(
+                update(User)
+                .where(User.id.in_(changed_ids))
+                .values(
+                    role=role,
+                    version=User.version + 1,
+                    updated_at=datetime.now(timezone.utc),
+                )
+                .returning(User.id, User.nome, User.email, User.role)
+                .execution_options(synchronize_session=False)
+            )
+            updated = result.all()
+            await self.stats_service.apply(
+                merge_deltas(
+                    *(
+                        role_changed_deltas(row.role, role)
+                        for row in current
+                        if row.role != role
+                    )
+                )
+            )
+        await self.db.commit()
+
+        for row in updated:
+            user_search_index.add(row)
+            await user_cache.invalidate(row.id)
+            index = positions[row.id]
+            results[index] = {
+                "index": index,
+                "id": row.id,
+                "email": row.email,
+                "status": "updated",
+            }
+
+        logger.info(
+            f"Atualização em lote: {len(updated)} de {len(ids)} usuários alterados"
+        )
+        return self._fill_not_found(results, positions)
+
+    async def bulk_delete_users(self, ids: List[int]) -> List[dict]:
+        """
+        Remove vários usuários com um único DELETE ... RETURNING, ajustando os
+        contadores na mesma transação. Retorna o resultado de cada id, na ordem
+        recebida.
+        """
+        results, positions = self._bulk_targets(ids)
+        result = await self.db.execute(
+            delete(User)
+            .where(User.id.in_(positions))
+            .returning(User.id, User.email, User.role, User.created_at)
+            .execution_options(synchronize_session=False)
+        )
+        deleted = result.all()
+        await self.stats_service.apply(
+            merge_deltas(*(deleted_deltas(row.role, row.created_at) for row in deleted))
+        )
+        await self.db.commit()
+
+        for row in deleted:
+            user_search_index.remove(row.id)
+            await user_cache.invalidate(row.id)
+            index = positions[row.id]
+            results[index] = {
+                "index": index,
+                "id": row.id,
+                "email": row.email,
+                "status": "deleted",
+            }
 
-    def delete_user(self, user_id: int) -> bool:
+        logger.info(f"Remoção em lote: {len(deleted)} de {len(ids)} usuários removidos")
+        return self._fill_not_found(results, positions)
+
+    async def delete_user(self, user_id: int) -> bool:
+        """
+        Remove o usuário com um único DELETE ... RETURNING, que devolve o que
+        os contadores precisam sem carregar a linha antes.
+        """
         logger.info(f"Tentativa de deletar usuário: ID={user_id}")
 
-        user = self.get_user_by_id(user_id)
-        if user:
-            self.db.delete(user)
-            self.db.commit()
-            logger.info(f"Usuário deletado: ID={user_id}, Email={user.email}")
-            return True
+        deleted = (
+            await self.db.execute(
+                delete(User)
+                .where(User.id == user_id)
+                .returning(User.email, User.role, User.created_at)
+                .execution_options(synchronize_session=False)
+            )
+        ).first()
+        if deleted is None:
+            logger.warning(f"Tentativa de deletar usuário inexistente: ID={user_id}")
+            return False
 
-        logger.warning(f"Tentativa de deletar usuário inexistente: ID={user_id}")
-        return False
+        await self.stats_service.apply(deleted_deltas(deleted.role, deleted.created_at))
+        await self.db.commit()
+        user_search_index.remove(user_id)
+        await user_cache.invalidate(user_id)
+        logger.info(f"Usuário deletado: ID={user_id}, Email={deleted.email}")
+        return True
 
-    def update_user(self, user_id: int, user_data: UserUpdate) -> Optional[User]:
-        user = self.get_user_by_id(user_id)
-        if not user:
-            return None
+    async def update_user(
+        self, user_id: int, user_data: UserUpdate, if_match: Optional[str] = None
+    ) -> Optional[User]:
+        """
+        Atualiza os campos informados do usuário com um único UPDATE ...
+        RETURNING.
+
+        O If-Match vira uma condição sobre a versão no próprio UPDATE e a
+        unicidade do email fica a cargo do índice único. Só a troca de role lê
+        a role atual antes (com lock), para ajustar os contadores.
 
+        Raises:
+            ValueError: Se a role for inválida ou o email já estiver em uso
+            UserVersionConflict: Se `if_match` não corresponder à ETag atual
+        """
         # Validar role
         if user_data.role and user_data.role not in ["user", "admin"]:
             raise ValueError("Role inválida. Deve ser 'user' ou 'admin'.")
 
-        # Verificar se está tentando atualizar email para um já existente
-        if user_data.email and user_data.email != user.email:
-            existing_user = self.get_user_by_email(user_data.email)
-            if existing_user:
-                raise ValueError("Email já está em uso")
-
         # Pegar apenas campos que foram fornecidos (não None)
-        update_data = user_data.model_dump(exclude_unset=True)
-
-        # Atualizar campos fornecidos
+        values = {}
+        update_data = user_data.model_dump(exclude_unset=True, exclude_none=True)
         for field, value in update_data.items():
             if field == "password":
                 # Hash da senha se fornecida
-                user.hashed_password = self.auth_service.get_password_hash(value)
-            elif hasattr(user, field):
-                # Atualizar outros campos diretamente
-                setattr(user, field, value)
+                values["hashed_password"] = await self.auth_service.get_password_hash(
+                    value
+                )
+            elif field == "email":
+                values["email"] = value
+                values["email_domain"] = email_domain(value)
+            elif hasattr(User, field):
+                values[field] = value
+
+        conditions = [User.id == user_id]
+        versions = if_match_versions(if_match, user_id)
+        if versions is not None:
+            conditions.append(User.version.in_(versions))
 
-        self.db.commit()
-        self.db.refresh(user)
+        if not values:
+            user = await self.db.scalar(select(User).where(*conditions))
+            if user is None:
+                return await self._missing_or_conflict(user_id)
+            return user
+
+        old_role = None
+        if "role" in values:
+            old_role = await self.db.scalar(
+                select(User.role).where(*conditions).with_for_update()
+            )
+            if old_role is None:
+                return await self._missing_or_conflict(user_id)
+
+        try:
+            user = await self.db.scalar(
+                update(User)
+                .where(*conditions)
+                .values(**values, version=User.version + 1)
+                .returning(User)
+                .execution_options(populate_existing=True)
+            )
+        except IntegrityError:
+            await self.db.rollback()
+            raise ValueError("Email já está em uso")
+        if user is None:
+            await self.db.rollback()
+            return await self._missing_or_conflict(user_id)
+
+        if old_role is not None:
+            await self.stats_service.apply(role_changed_deltas(old_role, user.role))
+        await self.db.commit()
+        user_search_index.add(user)
+        await user_cache.invalidate(user_id)
         return user
 
-    def search_users(self, query: str) -> List[User]:
+    async def _missing_or_conflict(self, user_id: int) -> None:
+        """
+        Explica por que uma escrita condicional não encontrou a linha: o
+        usuário não existe (retorna None) ou o If-Match não confere.
+        """
+        if await self.get_user_version(user_id) is None:
+            return None
+        raise UserVersionConflict("Usuário alterado por outra requisição")
+
+    async def search_users(
+        self,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+        fields: Sequence[str] = USER_FIELDS,
+    ) -> Sequence:
         """
-        Busca usuários pelo nome ou email.
+        Busca usuários pelo nome ou email, dos mais relevantes para os menos.
+
+        A busca usa o índice do banco (pg_trgm no Postgres, FTS5 no SQLite);
+        termos com menos de 3 caracteres caem para ILIKE. Com USER_SEARCH_INDEX
+        ativo, a busca é respondida pelo índice em memória, sem ir ao banco,
+        enquanto ele estiver dentro de USER_SEARCH_INDEX_MAX_AGE.
+        No banco, só as colunas dos `fields` pedidos são lidas.
         """
         if not query or query.strip() == "":
             return []
 
-        search_term = f"%{query.strip().lower()}%"
+        if user_search_index.fresh:
+            return user_search_index.search(query, limit, offset)
 
-        return (
-            self.db.query(User)
-            .filter((User.nome.ilike(search_term)) | (User.email.ilike(search_term)))
-            .all()
-        )
+        backend = get_search_backend(self.db.get_bind().dialect.name)
+        columns = [getattr(User, field) for field in fields]
+        return await backend.search(self.db, query.strip(), limit, offset, columns)
+
+    async def count_users(self) -> int:
+        """
+        Conta o número total de usuários pelo contador mantido nas escritas.
+        """
+        return await self.stats_service.get_total()
 
-    def count_users(self) -> int:
+    async def get_stats(self, days: int = 7) -> dict:
         """
-        Conta o número total de usuários.
+        Retorna o total de usuários, o total por role e os cadastros recentes.
         """
-        return self.db.query(User).count()
+        return await self.stats_service.get_stats(days)
+
+
+async def run_index_refresh(sessionmaker, interval: float) -> None:
+    """
+    Reconstrói o índice de busca a cada `interval` segundos até ser cancelada,
+    trazendo as escritas feitas pelos outros workers.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with sessionmaker() as db:
+                await user_search_index.build(UserService(db).stream_users())
+        except Exception as e:
+            logger.error(f"Falha ao reconstruir o índice de busca: {e}")
@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import os
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Optional
+
+from sqlalchemy import delete, func, insert, or_, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.user import LEGACY_CREATED_AT, User
+from app.models.user_counter import UserCounter
+
+logger = logging.getLogger(__name__)
+
+# Intervalo da reconciliação dos contadores com a tabela users; 0 desativa
+USER_STATS_RECONCILE_SECONDS = float(os.getenv("USER_STATS_RECONCILE_SECONDS", "3600"))
+
+TOTAL = "total"
+ROLE_PREFIX = "role:"
+SIGNUPS_PREFIX = "signups:"
+
+_UPSERT_DIALECTS = {"postgresql": postgresql, "sqlite": sqlite}
+
+
+def _signups_key(day: date) -> str:
+    return f"{SIGNUPS_PREFIX}{day.isoformat()}"
+
+
+def _as_day(created_at: Optional[datetime]) -> date:
+    if created_at is None:
+        return datetime.now(timezone.utc).date()
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(timezone.utc)
+    return created_at.date()
+
+
+def _is_legacy(created_at: Optional[datetime]) -> bool:
+    if created_at is None:
+        return False
+    if created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return created_at <= LEGACY_CREATED_AT
+
+
+def created_deltas(role: str, created_at: Optional[datetime]) -> Dict[str, int]:
+    """Incrementos dos contadores para um usuário criado."""
+    deltas = {TOTAL: 1, ROLE_PREFIX + role: 1}
+    # Usuários sem data de cadastro conhecida não entram nos cadastros por dia
+    if not _is_legacy(created_at):
+        deltas[_signups_key(_as_day(created_at))] = 1
+    return deltas
+
+
+def deleted_deltas(role: str, created_at: Optional[datetime]) -> Dict[str, int]:
+    """Decrementos dos contadores para um usuário removido."""
+    return {name: -delta for name, delta in created_deltas(role, created_at).items()}
+
+
+def merge_deltas(*deltas: Dict[str, int]) -> Dict[str, int]:
+    """Soma vários conjuntos de deltas, descartando os que se anulam."""
+    merged: Dict[str, int] = {}
+    for delta in deltas:
+        for name, value in delta.items():
+            merged[name] = merged.get(name, 0) + value
+    return {name: value for name, value in merged.items() if value}
+
+
+def _created_day(dialect_name: str):
+    """
+    Dia de criação em UTC. No Postgres, date() de um timestamptz usa o fuso da
+    sessão, então o valor é convertido para UTC antes; o SQLite guarda o texto
+    já em UTC.
+    """
+    if dialect_name == "postgresql":
+        return func.date(func.timezone("UTC", User.created_at))
+    return func.date(User.created_at)
+
+
+def role_changed_deltas(old_role: str, new_role: str) -> Dict[str, int]:
+    if old_role == new_role:
+        return {}
+    return {ROLE_PREFIX + old_role: -1, ROLE_PREFIX + new_role: 1}
+
+
+class UserStatsService:
+    """
+    Estatísticas de usuários servidas pela tabela user_counters.
+
+    Os contadores são atualizados na mesma transação da escrita em users
+    (`apply`), então ler as estatísticas custa uma consulta pela chave, sem
+    varrer a tabela. `reconcile` recalcula tudo a partir de users para corrigir
+    desvios (escritas feitas fora da aplicação, por exemplo).
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def apply(self, deltas: Dict[str, int]) -> None:
+        """Soma os deltas aos contadores sem fazer commit."""
+        if not deltas:
+            return
+
+        dialect = _UPSERT_DIALECTS.get(self.db.get_bind().dialect.name)
+        if dialect is None:
+            # Sem upsert nativo: garante a linha e depois incrementa
+            for name, delta in deltas.items():
+                counter = await self.db.scalar(
+                    select(UserCounter).where(UserCounter.name == name)
+                )
+                if counter is None:
+                    self.db.add(UserCounter(name=name, value=delta))
+                else:
+                    counter.value += delta
+            await self.db.flush()
+            return
+
+        # Um único upsert para todas as chaves; a ordem fixa das linhas evita
+        # deadlock entre transações concorrentes
+        statement = dialect.insert(UserCounter).values(
+            [{"name": name, "value": deltas[name]} for name in sorted(deltas)]
+        )
+        await self.db.execute(
+            statement.on_conflict_do_update(
+                index_elements=[UserCounter.name],
+                set_={"value": UserCounter.value + statement.excluded.value},
+            )
+        )
+
+    async def get_total(self) -> int:
+        value = await self.db.scalar(
+            select(UserCounter.value).where(UserCounter.name == TOTAL)
+        )
+        return value or 0
+
+    async def get_stats(self, days: int = 7) -> dict:
+        """
+        Retorna o total de usuários, o total por role e os cadastros nos
+        últimos `days` dias (incluindo hoje, em UTC).
+        """
+        today = datetime.now(timezone.utc).date()
+        signup_keys = [_signups_key(today - timedelta(days=n)) for n in range(days)]
+        rows = await self.db.execute(
+            select(UserCounter.name, UserCounter.value).where(
+                or_(
+                    UserCounter.name == TOTAL,
+                    UserCounter.name.startswith(ROLE_PREFIX),
+                    UserCounter.name.in_(signup_keys),
+                )
+            )
+        )
+
+        total = 0
+        by_role = {}
+        by_day = {key[len(SIGNUPS_PREFIX) :]: 0 for key in signup_keys}
+        for name, value in rows:
+            if name == TOTAL:
+                total = value
+            elif name.startswith(ROLE_PREFIX):
+                if value:
+                    by_role[name[len(ROLE_PREFIX) :]] = value
+            else:
+                by_day[name[len(SIGNUPS_PREFIX) :]] = value
+
+        return {
+            "total": total,
+            "by_role": by_role,
+            "created_last_days": {
+                "days": days,
+                "total": sum(by_day.values()),
+                "by_day": by_day,
+            },
+        }
+
+    async def _actual_counts(self) -> Dict[str, int]:
+        counts = {TOTAL: await self.db.scalar(select(func.count()).select_from(User))}
+        for role, value in await self.db.execute(
+            select(User.role, func.count()).group_by(User.role)
+        ):
+            counts[ROLE_PREFIX + role] = value
+
+        created_day = _created_day(self.db.get_bind().dialect.name)
+        for day, value in await self.db.execute(
+            select(created_day, func.count())
+            .where(User.created_at > LEGACY_CREATED_AT)
+            .group_by(created_day)
+        ):
+            if day is not None:
+                counts[f"{SIGNUPS_PREFIX}{day}"] = value
+        return counts
+
+    async def reconcile(self) -> int:
+        """
+        Recalcula os contadores a partir da tabela users e retorna quantos
+        estavam errados.
+        """
+        # Trava as linhas dos contadores antes de contar: criações, remoções e
+        # trocas de role (que sempre decrementam a linha da role antiga) esperam
+        # o fim da reconciliação em vez de se perderem. A ordem por nome é a
+        # mesma de `apply`, o que evita deadlock.
+        await self.db.execute(
+            select(UserCounter.id).order_by(UserCounter.name).with_for_update()
+        )
+        actual = await self._actual_counts()
+        stored = dict(
+            (await self.db.execute(select(UserCounter.name, UserCounter.value))).all()
+        )
+
+        drifted = {
+            name
+            for name in actual.keys() | stored.keys()
+            if actual.get(name, 0) != stored.get(name, 0)
+        }
+        if drifted:
+            await self.db.execute(
+                delete(UserCounter).where(UserCounter.name.in_(drifted))
+            )
+            values = [
+                {"name": name, "value": actual[name]}
+                for name in drifted
+                if actual.get(name)
+            ]
+            if values:
+                await self.db.execute(insert(UserCounter), values)
+            logger.warning(f"Contadores de usuários corrigidos: {sorted(drifted)}")
+
+        await self.db.commit()
+        return len(drifted)
+
+
+async def run_reconciliation(sessionmaker, interval: float) -> None:
+    """Reconcilia os contadores a cada `interval` segundos até ser cancelada."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with sessionmaker() as db:
+                await UserStatsService(db).reconcile()
+        except Exception as e:
+            logger.error(f"Falha ao reconciliar contadores de usuários: {e}")
@@ -1,3 +1,4 @@
+import asyncio
 import os
 import sys
 from pathlib import Path
@@ -5,6 +6,7 @@ from pathlib import Path
 # PRIMEIRA COISA: Definir ambiente de teste
 os.environ["TESTING"] = "True"
 os.environ["LOG_LEVEL"] = "ERROR"
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
 
 # Adicionar o diretório raiz ao Python path ANTES dos imports
 root_dir = Path(__file__).parent.parent
@@ -12,12 +14,20 @@ sys.path.insert(0, str(root_dir))
 
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
 
-from app.database import get_db
+from app.database import get_async_db, get_db
 from app.main import app
 from app.models.base import Base
+from app.services.user_cache import user_cache
+
+# Testes com @pytest.mark.benchmark comparam tempos e variam com a carga da
+# máquina; por padrão são pulados
+RUN_BENCHMARKS = os.getenv("RUN_BENCHMARKS", "false").lower() == "true"
 
 # Banco de dados em memória para testes
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -27,6 +37,13 @@ engine = create_engine(
 )
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Cada TestClient roda em um event loop próprio, então as conexões async não
+# podem ser reaproveitadas entre testes
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db", poolclass=NullPool)
+TestingAsyncSessionLocal = async_sessionmaker(
+    async_engine, autoflush=False, expire_on_commit=False
+)
+
 
 def override_get_db():
     """Override da função get_db para usar o banco de teste"""
@@ -37,6 +54,12 @@ def override_get_db():
         db.close()
 
 
+async def override_get_async_db():
+    """Override da função get_async_db para usar o banco de teste"""
+    async with TestingAsyncSessionLocal() as db:
+        yield db
+
+
 @pytest.fixture
 def client():
     """Fixture do cliente de teste FastAPI"""
@@ -45,6 +68,7 @@ def client():
 
     # Override da dependência do banco
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
 
     # Cliente de teste
     with TestClient(app) as test_client:
@@ -52,6 +76,8 @@ def client():
 
     # Limpar depois dos testes
     Base.metadata.drop_all(bind=engine)
+    # Os ids se repetem entre testes; o cache não pode sobreviver ao banco
+    asyncio.run(user_cache.clear())
     app.dependency_overrides.clear()
 
 
@@ -65,3 +91,25 @@ def db_session():
     finally:
         session.close()
         Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def captured_statements():
+    """Captura os comandos SQL executados em qualquer engine durante o teste."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.strip())
+
+    event.listen(Engine, "before_cursor_execute", capture)
+    yield statements
+    event.remove(Engine, "before_cursor_execute", capture)
+
+
+def pytest_collection_modifyitems(config, items):
+    if RUN_BENCHMARKS:
+        return
+    skip = pytest.mark.skip(reason="Benchmark; rode com RUN_BENCHMARKS=true")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
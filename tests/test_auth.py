@@ -0,0 +1,472 @@
+import asyncio
+import time
+
+import bcrypt
+import jwt
+import pytest
+from fastapi.testclient import TestClient
+from limits import parse
+from starlette.requests import Request
+
+import app.services.token_denylist as token_denylist_module
+from app.middleware.rate_limit import (
+    LocalTokenBuckets,
+    limiter,
+    local_buckets,
+    rate_limit_key,
+)
+from app.models.user import User
+from app.services.password_hasher import (
+    HashingPoolSaturated,
+    PasswordHasher,
+    calibrate_rounds,
+    get_rounds,
+    password_hasher,
+)
+from app.services.token_cache import TokenCache, token_cache
+from app.services.token_denylist import (
+    BloomFilter,
+    DatabaseRevocationStore,
+    InMemoryRevocationStore,
+    TokenDenylist,
+)
+from tests.conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def users_in_db(client: TestClient):
+    """
+    Fixture que cria um conjunto de usuários no banco de dados para os testes.
+    Retorna os dados dos usuários criados para referência.
+    """
+    users_data = [
+        {
+            "nome": "Admin User",
+            "email": "admin@example.com",
+            "password": "password123",
+            "role": "admin",
+        },
+        {
+            "nome": "Common User",
+            "email": "user@example.com",
+            "password": "password123",
+            "role": "user",
+        },
+    ]
+    created_users = []
+    for user in users_data:
+        response = client.post("/users", json=user)
+        assert response.status_code == 201
+        created_users.append({**response.json(), "password": user["password"]})
+    return created_users
+
+
+def login(client: TestClient, user: dict) -> dict:
+    """Faz login e retorna os headers de autorização."""
+    response = client.post(
+        "/login", json={"email": user["email"], "password": user["password"]}
+    )
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def hasher():
+    """Fixture que cria um pool de hashing isolado e o encerra ao final."""
+    instance = PasswordHasher(pool_size=1, queue_depth=1)
+    yield instance
+    instance.shutdown()
+
+
+def test_hasher_hash_and_verify(hasher: PasswordHasher):
+    async def run():
+        hashed = await hasher.hash("password123")
+        return (
+            await hasher.verify("password123", hashed),
+            await hasher.verify("wrong", hashed),
+        )
+
+    assert asyncio.run(run()) == (True, False)
+    stats = hasher.stats()
+    assert stats["completed"] == 3
+    assert stats["in_flight"] == 0
+    assert stats["avg_latency_ms"] >= stats["avg_queue_wait_ms"]
+
+
+def test_hasher_rejects_when_saturated(hasher: PasswordHasher):
+    """Acima de pool_size + queue_depth tarefas o pool deve recusar novas."""
+
+    async def run():
+        return await asyncio.gather(
+            *(hasher.hash("password123") for _ in range(3)), return_exceptions=True
+        )
+
+    results = asyncio.run(run())
+    rejected = [r for r in results if isinstance(r, HashingPoolSaturated)]
+    assert len(rejected) == 1
+    assert hasher.stats()["rejected"] == 1
+
+
+async def saturated(*args, **kwargs):
+    raise HashingPoolSaturated("Pool de hashing saturado")
+
+
+def test_create_user_returns_503_when_hashing_pool_saturated(client, monkeypatch):
+    monkeypatch.setattr(password_hasher, "hash", saturated)
+    response = client.post(
+        "/users",
+        json={"nome": "New User", "email": "new@example.com", "password": "secret"},
+    )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_login_returns_503_when_hashing_pool_saturated(
+    client, users_in_db, monkeypatch
+):
+    monkeypatch.setattr(password_hasher, "verify", saturated)
+    response = client.post(
+        "/login", json={"email": "user@example.com", "password": "password123"}
+    )
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_calibrate_rounds_respects_budget():
+    """Orçamentos maiores nunca devem produzir custos menores."""
+    low = calibrate_rounds(target_ms=5)
+    high = calibrate_rounds(target_ms=500)
+    assert 4 <= low <= high <= 31
+
+
+def test_hasher_needs_rehash_outside_tolerance():
+    hasher = PasswordHasher(rounds=10)
+    assert hasher.needs_rehash("$2b$09$" + "a" * 53)
+    assert not hasher.needs_rehash("$2b$10$" + "a" * 53)
+    # Um worker calibrado um custo acima não provoca regravações alternadas
+    assert not hasher.needs_rehash("$2b$11$" + "a" * 53)
+    assert hasher.needs_rehash("$2b$12$" + "a" * 53)
+    assert not hasher.needs_rehash("not-a-bcrypt-hash")
+
+
+def test_calibrate_keeps_pinned_rounds():
+    hasher = PasswordHasher(rounds=7)
+    assert hasher.calibrate(target_ms=10000) == 7
+    assert hasher.rounds == 7
+
+
+def test_login_rehashes_password_with_current_cost(client, db_session):
+    """Um hash com custo fora da tolerância do alvo é regravado no login."""
+    old_hash = bcrypt.hashpw(b"password123", bcrypt.gensalt(6)).decode("utf-8")
+    db_session.add(
+        User(nome="Legacy", email="legacy@example.com", hashed_password=old_hash)
+    )
+    db_session.commit()
+
+    response = client.post(
+        "/login", json={"email": "legacy@example.com", "password": "password123"}
+    )
+    assert response.status_code == 200
+
+    db_session.expire_all()
+    user = db_session.query(User).filter(User.email == "legacy@example.com").one()
+    assert user.hashed_password != old_hash
+    assert get_rounds(user.hashed_password) == password_hasher.rounds
+    assert bcrypt.checkpw(b"password123", user.hashed_password.encode("utf-8"))
+
+
+def test_token_cache_hit_and_miss():
+    cache = TokenCache(max_size=10)
+    payload = {"sub": "1", "exp": time.time() + 60}
+
+    assert cache.get("token") is None
+    cache.put("token", payload)
+    assert cache.get("token") == payload
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_token_cache_evicts_expired_tokens():
+    cache = TokenCache(max_size=10)
+    cache.put("token", {"sub": "1", "exp": time.time() - 1})
+    assert cache.get("token") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_token_cache_is_size_capped():
+    cache = TokenCache(max_size=2)
+    exp = time.time() + 60
+    for token in ("a", "b", "c"):
+        cache.put(token, {"sub": token, "exp": exp})
+
+    assert cache.get("a") is None
+    assert cache.get("c") is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_verify_token_served_from_cache(client, users_in_db):
+    headers = login(client, users_in_db[1])
+
+    client.get("/me", headers=headers)
+    hits_before = token_cache.stats()["hits"]
+    response = client.get("/me", headers=headers)
+
+    assert response.status_code == 200
+    assert token_cache.stats()["hits"] == hits_before + 1
+
+
+def test_login_returns_refresh_token(client, users_in_db):
+    response = client.post(
+        "/login",
+        json={"email": users_in_db[1]["email"], "password": "password123"},
+    )
+    assert response.status_code == 200
+    assert response.json()["refresh_token"]
+
+
+def test_refresh_token_issues_new_pair_and_rotates(client, users_in_db):
+    response = client.post(
+        "/login",
+        json={"email": users_in_db[1]["email"], "password": "password123"},
+    )
+    refresh_token = response.json()["refresh_token"]
+
+    response = client.post("/token/refresh", json={"refresh_token": refresh_token})
+    assert response.status_code == 200
+    tokens = response.json()
+    assert tokens["refresh_token"] != refresh_token
+
+    response = client.get(
+        "/me", headers={"Authorization": f"Bearer {tokens['access_token']}"}
+    )
+    assert response.status_code == 200
+    assert response.json()["email"] == users_in_db[1]["email"]
+
+
+def test_refresh_token_reuse_revokes_all_tokens(client, users_in_db):
+    """Reapresentar um refresh token já rotacionado invalida toda a cadeia."""
+    response = client.post(
+        "/login",
+        json={"email": users_in_db[1]["email"], "password": "password123"},
+    )
+    original = response.json()["refresh_token"]
+    rotated = client.post("/token/refresh", json={"refresh_token": original}).json()[
+        "refresh_token"
+    ]
+
+    response = client.post("/token/refresh", json={"refresh_token": original})
+    assert response.status_code == 401
+
+    response = client.post("/token/refresh", json={"refresh_token": rotated})
+    assert response.status_code == 401
+
+
+def test_revoked_refresh_token_is_rejected(client, users_in_db):
+    response = client.post(
+        "/login",
+        json={"email": users_in_db[1]["email"], "password": "password123"},
+    )
+    refresh_token = response.json()["refresh_token"]
+
+    response = client.post("/token/revoke", json={"refresh_token": refresh_token})
+    assert response.status_code == 200
+
+    response = client.post("/token/refresh", json={"refresh_token": refresh_token})
+    assert response.status_code == 401
+
+
+def test_refresh_with_unknown_token_fails(client):
+    response = client.post("/token/refresh", json={"refresh_token": "unknown"})
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Refresh token inválido"
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    items = [f"jti-{i}" for i in range(1000)]
+    for item in items:
+        bloom.add(item)
+
+    assert all(item in bloom for item in items)
+    false_positives = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+def test_denylist_skips_store_for_unrevoked_tokens():
+    denylist = TokenDenylist(InMemoryRevocationStore(), sync_interval=3600)
+    denylist.revoke("revoked", time.time() + 60)
+
+    assert denylist.is_revoked("revoked")
+    assert not denylist.is_revoked("valid")
+    assert denylist.stats()["store_lookups"] == 1
+
+
+def test_denylist_sync_drops_expired_entries():
+    store = InMemoryRevocationStore()
+    denylist = TokenDenylist(store, sync_interval=3600)
+    denylist.revoke("expired", time.time() - 1)
+
+    denylist.sync()
+
+    assert not denylist.is_revoked("expired")
+    assert list(store.active()) == []
+
+
+def test_logout_revokes_access_token(client, users_in_db):
+    headers = login(client, users_in_db[1])
+    assert client.get("/me", headers=headers).status_code == 200
+
+    response = client.post("/logout", headers=headers)
+    assert response.status_code == 200
+
+    response = client.get("/me", headers=headers)
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Token revogado"
+
+
+def test_database_store_ignores_duplicate_revocations(db_session, monkeypatch):
+    monkeypatch.setattr(
+        token_denylist_module, "get_sessionmaker", lambda: TestingSessionLocal
+    )
+    store = DatabaseRevocationStore()
+    expires_at = time.time() + 60
+
+    # Dois workers revogando o mesmo access token antes de sincronizar
+    store.add("same-jti", expires_at)
+    store.add("same-jti", expires_at)
+
+    assert store.contains("same-jti")
+    assert list(store.active()) == ["same-jti"]
+
+
+def test_logout_revokes_session_refresh_token(client, users_in_db):
+    credentials = {"email": "user@example.com", "password": "password123"}
+    tokens = client.post("/login", json=credentials).json()
+    other = client.post("/login", json=credentials).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    assert client.post("/logout", headers=headers).status_code == 200
+
+    # A outra sessão do mesmo usuário continua renovando
+    response = client.post(
+        "/token/refresh", json={"refresh_token": other["refresh_token"]}
+    )
+    assert response.status_code == 200
+    response = client.post(
+        "/token/refresh", json={"refresh_token": tokens["refresh_token"]}
+    )
+    assert response.status_code == 401
+
+
+def test_refresh_after_logout_does_not_revoke_other_sessions(client, users_in_db):
+    credentials = {"email": "user@example.com", "password": "password123"}
+    tokens = client.post("/login", json=credentials).json()
+    other = client.post("/login", json=credentials).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    client.post("/logout", headers=headers)
+    client.post("/token/revoke", json={"refresh_token": other["refresh_token"]})
+    third = client.post("/login", json=credentials).json()
+
+    # Um cliente que tenta renovar a sessão encerrada não é tratado como reuso
+    for revoked in (tokens, other):
+        response = client.post(
+            "/token/refresh", json={"refresh_token": revoked["refresh_token"]}
+        )
+        assert response.status_code == 401
+    response = client.post(
+        "/token/refresh", json={"refresh_token": third["refresh_token"]}
+    )
+    assert response.status_code == 200
+
+
+def test_logout_does_not_affect_other_sessions(client, users_in_db):
+    first = login(client, users_in_db[1])
+    second = login(client, users_in_db[1])
+
+    client.post("/logout", headers=first)
+
+    assert client.get("/me", headers=second).status_code == 200
+
+
+@pytest.fixture
+def rate_limiting(monkeypatch):
+    """Ativa o rate limiting, com contadores zerados."""
+    monkeypatch.setattr(limiter, "enabled", True)
+    limiter.reset()
+    local_buckets.clear()
+    yield
+    limiter.reset()
+    local_buckets.clear()
+
+
+def failed_logins(client: TestClient, count: int) -> list:
+    credentials = {"email": "ninguem@example.com", "password": "password123"}
+    return [client.post("/login", json=credentials).status_code for _ in range(count)]
+
+
+def test_local_token_bucket_refills():
+    buckets = LocalTokenBuckets()
+    limit = parse("2/second")
+    assert buckets.consume(("rota", "cliente"), limit)
+    assert buckets.consume(("rota", "cliente"), limit)
+    assert not buckets.consume(("rota", "cliente"), limit)
+    assert buckets.consume(("rota", "outro"), limit)
+    time.sleep(0.6)
+    assert buckets.consume(("rota", "cliente"), limit)
+    assert buckets.rejected == 1
+
+
+def test_login_rate_limit_rejected_by_local_bucket(client, rate_limiting):
+    rejected = local_buckets.rejected
+    assert failed_logins(client, 6) == [401] * 5 + [429]
+    assert local_buckets.rejected == rejected + 1
+
+
+def test_login_rate_limit_is_shared_between_workers(client, rate_limiting):
+    rejected = local_buckets.rejected
+    assert failed_logins(client, 5) == [401] * 5
+    # Outro worker começa com o bucket local cheio, mas a contagem é a mesma
+    local_buckets.clear()
+    response = client.post(
+        "/login", json={"email": "ninguem@example.com", "password": "password123"}
+    )
+    assert response.status_code == 429
+    assert local_buckets.rejected == rejected
+
+
+def test_rate_limit_key_uses_token_subject(client, users_in_db):
+    def key(headers: dict) -> str:
+        raw_headers = [
+            (name.lower().encode(), value.encode()) for name, value in headers.items()
+        ]
+        scope = {"type": "http", "headers": raw_headers, "client": ("10.0.0.1", 1)}
+        return rate_limit_key(Request(scope))
+
+    admin_key = key(login(client, users_in_db[0]))
+    user_key = key(login(client, users_in_db[1]))
+    assert admin_key.startswith("user:")
+    assert admin_key != user_key
+    assert key(login(client, users_in_db[0])) == admin_key
+    assert key({"Authorization": "Bearer invalido"}) == "10.0.0.1"
+    assert key({}) == "10.0.0.1"
+
+
+def test_rate_limit_key_uses_token_cache(client, users_in_db, monkeypatch):
+    headers = login(client, users_in_db[1])
+    scope = {
+        "type": "http",
+        "headers": [(b"authorization", headers["Authorization"].encode())],
+        "client": ("10.0.0.1", 1),
+    }
+    token_cache.clear()
+    expected = rate_limit_key(Request(scope))
+
+    def decode(*args, **kwargs):
+        raise AssertionError("token já verificado foi decodificado de novo")
+
+    # A chave e a verificação do token reaproveitam a decodificação anterior
+    monkeypatch.setattr(jwt, "decode", decode)
+    assert rate_limit_key(Request(scope)) == expected
+    assert client.get("/me", headers=headers).status_code == 200
@@ -0,0 +1,166 @@
+import os
+from datetime import datetime, timezone
+
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+from app.database import create_instrumented_engine, get_engine, get_pool_stats
+from app.models.base import Base
+from app.schemas.user import UserFilters
+from app.services.pagination import encode_cursor
+from app.services.user_service import UserService
+
+
+@pytest.fixture
+def small_pool_engine(tmp_path):
+    """Engine com pool de uma conexão e sem overflow."""
+    engine = create_instrumented_engine(
+        "test_small_pool",
+        f"sqlite:///{tmp_path / 'pool.db'}",
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.1,
+    )
+    yield engine
+    engine.dispose()
+
+
+def test_pool_metrics_record_checkouts(small_pool_engine):
+    with small_pool_engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        stats = get_pool_stats()["test_small_pool"]
+        assert stats["checked_out"] == 1
+        assert stats["pool_size"] == 1
+
+    stats = get_pool_stats()["test_small_pool"]
+    assert stats["checkouts"] == 1
+    assert stats["checkins"] == 1
+    assert stats["checked_out"] == 0
+    assert stats["peak_checked_out"] == 1
+
+
+def test_pool_metrics_record_timeouts(small_pool_engine):
+    with small_pool_engine.connect():
+        with pytest.raises(PoolTimeoutError):
+            small_pool_engine.connect()
+
+    stats = get_pool_stats()["test_small_pool"]
+    assert stats["timeouts"] == 1
+    assert stats["max_checkout_wait_ms"] >= 100
+
+
+def test_pool_metrics_survive_dispose(small_pool_engine):
+    small_pool_engine.dispose()
+    with small_pool_engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+    assert get_pool_stats()["test_small_pool"]["checkouts"] == 1
+
+
+def test_db_pool_endpoint_requires_admin(client):
+    response = client.post(
+        "/users",
+        json={"nome": "Common", "email": "common@example.com", "password": "secret"},
+    )
+    assert response.status_code == 201
+    token = client.post(
+        "/login", json={"email": "common@example.com", "password": "secret"}
+    ).json()["access_token"]
+
+    response = client.get(
+        "/metrics/db-pool", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 403
+
+
+def test_db_pool_endpoint_as_admin(client):
+    # Os engines da aplicação são criados no primeiro uso
+    get_engine()
+    client.post(
+        "/users",
+        json={
+            "nome": "Admin",
+            "email": "admin@example.com",
+            "password": "secret",
+            "role": "admin",
+        },
+    )
+    token = client.post(
+        "/login", json={"email": "admin@example.com", "password": "secret"}
+    ).json()["access_token"]
+
+    response = client.get(
+        "/metrics/db-pool", headers={"Authorization": f"Bearer {token}"}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert "avg_checkout_wait_ms" in data["primary"]
+
+
+# (ordenação, filtros, índice esperado, cursor) das consultas de GET /users
+FILTERED_QUERIES = [
+    ("id", {"role": "admin"}, "ix_users_role_id", None),
+    ("-nome", {"role": "admin"}, "ix_users_role_nome_id", ["Ana", 3]),
+    ("created_at", {"role": "user"}, "ix_users_role_created_at_id", None),
+    ("id", {"email_domain": "example.com"}, "ix_users_email_domain_id", None),
+    (
+        "created_at",
+        {"created_after": datetime(2026, 1, 1, tzinfo=timezone.utc)},
+        "ix_users_created_at_id",
+        None,
+    ),
+    ("-created_at", {}, "ix_users_created_at_id", None),
+    ("nome", {}, "ix_users_nome_id", None),
+]
+
+
+def explain_users_query(conn, sort, filters, cursor) -> str:
+    """Retorna o plano da consulta que GET /users faria com esses parâmetros."""
+    query = UserService(None).build_users_query(
+        50,
+        encode_cursor(sort, cursor) if cursor else None,
+        sort,
+        ("id", "nome"),
+        UserFilters(**filters),
+    )
+    sql = str(
+        query.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True})
+    )
+    if conn.dialect.name == "sqlite":
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").all()
+        return "\n".join(row[-1] for row in rows)
+    return "\n".join(row[0] for row in conn.exec_driver_sql(f"EXPLAIN {sql}"))
+
+
+@pytest.mark.parametrize("sort,filters,index,cursor", FILTERED_QUERIES)
+def test_users_filters_use_indexes_on_sqlite(tmp_path, sort, filters, index, cursor):
+    engine = create_engine(f"sqlite:///{tmp_path / 'plan.db'}")
+    Base.metadata.create_all(bind=engine)
+    with engine.connect() as conn:
+        plan = explain_users_query(conn, sort, filters, cursor)
+    engine.dispose()
+
+    assert f"USING INDEX {index}" in plan or f"USING COVERING INDEX {index}" in plan
+    # A ordenação vem do índice, sem ordenar o resultado à parte
+    assert "TEMP B-TREE" not in plan
+
+
+@pytest.mark.skipif(
+    not os.getenv("TEST_POSTGRES_URL"), reason="Requer TEST_POSTGRES_URL"
+)
+@pytest.mark.parametrize("sort,filters,index,cursor", FILTERED_QUERIES)
+def test_users_filters_use_indexes_on_postgres(sort, filters, index, cursor):
+    engine = create_engine(os.environ["TEST_POSTGRES_URL"])
+    Base.metadata.create_all(bind=engine)
+    try:
+        with engine.connect() as conn:
+            # Em tabelas vazias o planejador prefere varrer a tabela
+            conn.exec_driver_sql("SET enable_seqscan = off")
+            plan = explain_users_query(conn, sort, filters, cursor)
+    finally:
+        Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+
+    assert index in plan
+    assert "Sort" not in plan
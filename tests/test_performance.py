@@ -1,7 +1,64 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
 import time
+import tracemalloc
+from pathlib import Path
 
+import bcrypt
 import pytest
+from fastapi.encoders import jsonable_encoder
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+
+from app.models.base import Base
+from app.models.user import User
+from app.services.auth_service import AuthService
+from app.services.password_hasher import PasswordHasher
+from app.services.user_export import iter_ndjson
+from app.services.user_search import get_search_backend
+from app.services.user_search_index import UserSearchIndex
+from app.services.user_serializer import USER_LIST_ADAPTER, dump_users
+from app.services.user_service import CACHED_USER_FIELDS, UserService
+from tests.conftest import TestingAsyncSessionLocal
+
+ROOT_DIR = Path(__file__).parent.parent
+
+
+def run_python(script: str, **env) -> str:
+    """Executa um script em um interpretador novo e retorna a saída."""
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=ROOT_DIR,
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stdout.strip()
+
+
+def create_users_db(path: Path, users: list) -> str:
+    """Cria um banco SQLite em `path` com os usuários dados e retorna a URL."""
+    url = f"sqlite:///{path}"
+    engine = create_engine(url)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for offset in range(0, len(users), 50_000):
+            conn.execute(insert(User), users[offset : offset + 50_000])
+    engine.dispose()
+    return url
+
+
+def auth_headers(client: TestClient, user: dict) -> dict:
+    response = client.post(
+        "/login", json={"email": user["email"], "password": user["password"]}
+    )
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
 
 
 @pytest.fixture
@@ -54,3 +111,457 @@ def test_login_performance(client, users_in_db):
     avg_time = (end_time - start_time) / 100
     # TODO : Ajustar o valor do limite de tempo conforme necessário
     assert avg_time < 0.3  # Menos de 100ms por login
+
+
+def test_hashing_pool_runs_hashes_concurrently():
+    """Hashes simultâneos são enviados juntos ao pool, não um de cada vez."""
+    hasher = PasswordHasher(pool_size=2, queue_depth=2, rounds=4)
+    passwords = [f"password{i}" for i in range(4)]
+
+    async def run():
+        tasks = [asyncio.create_task(hasher.hash(p)) for p in passwords]
+        await asyncio.sleep(0)
+        in_flight = hasher.in_flight
+        return in_flight, await asyncio.gather(*tasks)
+
+    try:
+        in_flight, hashes = asyncio.run(run())
+    finally:
+        hasher.shutdown()
+
+    assert in_flight == len(passwords)
+    assert all(
+        bcrypt.checkpw(password.encode(), hashed.encode())
+        for password, hashed in zip(passwords, hashes)
+    )
+    stats = hasher.stats()
+    assert stats["completed"] == len(passwords)
+    assert stats["in_flight"] == 0
+
+
+@pytest.mark.benchmark
+@pytest.mark.skipif((os.cpu_count() or 1) < 2, reason="Requer múltiplos núcleos")
+def test_hashing_pool_scales_across_cores():
+    """O throughput de hashing deve crescer ~linearmente com o número de processos."""
+    workers = min(os.cpu_count(), 4)
+    jobs = workers * 4
+
+    def throughput(pool_size: int) -> float:
+        hasher = PasswordHasher(pool_size=pool_size, queue_depth=jobs, rounds=12)
+        try:
+            # Aquece os processos antes de medir
+            asyncio.run(hasher.hash("warmup"))
+
+            async def run():
+                await asyncio.gather(*(hasher.hash("password123") for _ in range(jobs)))
+
+            start_time = time.perf_counter()
+            asyncio.run(run())
+            return jobs / (time.perf_counter() - start_time)
+        finally:
+            hasher.shutdown()
+
+    speedup = throughput(workers) / throughput(1)
+    assert speedup >= workers * 0.7
+
+
+def test_login_reads_only_credential_columns(client, users_in_db, captured_statements):
+    """O login lê só as colunas de que precisa, em uma única consulta."""
+    auth_headers(client, users_in_db[0])
+    lookups = [
+        q for q in captured_statements if q.startswith("SELECT") and "FROM users" in q
+    ]
+    assert len(lookups) == 1
+    assert "users.hashed_password" in lookups[0]
+    assert "users.created_at" not in lookups[0]
+    assert "users.version" not in lookups[0]
+
+
+@pytest.mark.benchmark
+def test_credentials_lookup_cheaper_than_orm(db_session):
+    """A projeção do login deve custar menos que hidratar o User completo."""
+    db_session.add(
+        User(
+            nome="Bench User",
+            email="bench@example.com",
+            hashed_password="$2b$04$" + "a" * 53,
+            role="user",
+        )
+    )
+    db_session.commit()
+    iterations = 2000
+
+    async def run():
+        async with TestingAsyncSessionLocal() as db:
+            auth_service = AuthService(db)
+
+            async def orm_lookup():
+                result = await db.scalars(
+                    select(User).where(User.email == "bench@example.com")
+                )
+                # Evita que o identity map sirva a próxima iteração sem hidratar
+                db.expunge(result.first())
+
+            async def core_lookup():
+                await auth_service.get_credentials("bench@example.com")
+
+            async def measure(lookup) -> float:
+                await lookup()
+                start_time = time.perf_counter()
+                for _ in range(iterations):
+                    await lookup()
+                return (time.perf_counter() - start_time) / iterations
+
+            return await measure(orm_lookup), await measure(core_lookup)
+
+    orm_time, core_time = asyncio.run(run())
+    print(f"\nORM: {orm_time * 1e6:.1f}us/login, Core: {core_time * 1e6:.1f}us/login")
+    assert core_time < orm_time
+
+
+def test_import_does_not_touch_database(tmp_path):
+    """Importar e montar a aplicação não deve criar engines nem conexões."""
+    # Um caminho inexistente faria qualquer conexão falhar
+    database_url = f"sqlite:///{tmp_path / 'missing' / 'app.db'}"
+    output = run_python(
+        "import app.database as database\n"
+        "from app.main import create_app\n"
+        "create_app()\n"
+        "print(database._engine is None and database._async_engine is None)",
+        DATABASE_URL=database_url,
+    )
+    assert output == "True"
+
+
+@pytest.mark.benchmark
+def test_cold_start_to_first_request():
+    """Tempo de um interpretador novo até a primeira resposta servida."""
+    output = run_python(
+        "import time\n"
+        "start = time.perf_counter()\n"
+        "from app.main import create_app\n"
+        "imported = time.perf_counter()\n"
+        "from fastapi.testclient import TestClient\n"
+        "with TestClient(create_app()) as client:\n"
+        "    assert client.get('/').status_code == 200\n"
+        "print(imported - start, time.perf_counter() - start)"
+    )
+    import_time, first_request_time = map(float, output.splitlines()[-1].split())
+    print(
+        f"\nImport: {import_time * 1000:.0f}ms, "
+        f"primeira requisição: {first_request_time * 1000:.0f}ms"
+    )
+    assert first_request_time < 3.0
+
+
+def export_users(rows: int) -> list:
+    return [
+        {
+            "nome": f"User {i}",
+            "email": f"user{i}@example.com",
+            "hashed_password": "x",
+            "role": "user",
+        }
+        for i in range(rows)
+    ]
+
+
+def test_export_streams_in_constant_memory(tmp_path):
+    """O pico de memória da exportação não cresce com o número de linhas."""
+
+    async def export_peak(database_path: Path) -> tuple[int, int]:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{database_path}")
+        try:
+            async with AsyncSession(engine) as db:
+                await db.connection()
+                tracemalloc.start()
+                lines = 0
+                async for chunk in iter_ndjson(UserService(db).stream_users()):
+                    lines += chunk.count(b"\n")
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+        finally:
+            await engine.dispose()
+        return lines, peak
+
+    peaks = {}
+    for rows in (2_000, 20_000):
+        database_path = tmp_path / f"export_{rows}.db"
+        create_users_db(database_path, export_users(rows))
+        lines, peaks[rows] = asyncio.run(export_peak(database_path))
+        assert lines == rows
+    print(f"\nPico da exportação: {peaks}")
+    # Dez vezes mais linhas, o mesmo número de linhas por lote em memória
+    assert peaks[20_000] < peaks[2_000] * 1.5
+
+
+@pytest.mark.benchmark
+def test_export_rss_with_many_rows(tmp_path):
+    """Exporta EXPORT_BENCH_ROWS linhas e mede o crescimento do RSS."""
+    rows = int(os.getenv("EXPORT_BENCH_ROWS", "1000000"))
+    database_path = tmp_path / "export.db"
+    create_users_db(database_path, export_users(rows))
+
+    # Interpretador novo para o pico de RSS refletir só a exportação
+    output = run_python(
+        "import asyncio, resource, time\n"
+        "from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine\n"
+        "from app.services.user_export import iter_ndjson\n"
+        "from app.services.user_service import UserService\n"
+        "async def run():\n"
+        f"    engine = create_async_engine('sqlite+aiosqlite:///{database_path}')\n"
+        "    async with AsyncSession(engine) as db:\n"
+        "        lines = size = 0\n"
+        "        async for chunk in iter_ndjson(UserService(db).stream_users()):\n"
+        "            lines += chunk.count(b'\\n')\n"
+        "            size += len(chunk)\n"
+        "    await engine.dispose()\n"
+        "    return lines, size\n"
+        "rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+        "start = time.perf_counter()\n"
+        "lines, size = asyncio.run(run())\n"
+        "elapsed = time.perf_counter() - start\n"
+        "rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss\n"
+        "print(lines, size, elapsed, (rss_after - rss_before) * 1024)"
+    )
+    lines, total_bytes, elapsed, rss_growth = output.splitlines()[-1].split()
+    lines, total_bytes, rss_growth = int(lines), int(total_bytes), int(rss_growth)
+    elapsed = float(elapsed)
+    print(
+        f"\nExport: {rows} linhas em {elapsed:.1f}s "
+        f"({rows / elapsed:.0f} linhas/s), {total_bytes / 1e6:.0f}MB gerados, "
+        f"RSS cresceu {rss_growth / 1e6:.1f}MB"
+    )
+    assert lines == rows
+    # O consumo depende do tamanho do lote, não do número de linhas
+    assert rss_growth < 50 * 1024 * 1024
+
+
+SEARCH_QUERIES = ["user1234@", "12345", "oliv", "Usuario 999", "user777", "us"]
+
+
+def search_users(rows: int) -> list:
+    surnames = ["Silva", "Souza", "Oliveira", "Pereira", "Costa", "Almeida"]
+    return [
+        {
+            "nome": f"Usuario {i} {surnames[i % len(surnames)]}",
+            "email": f"user{i}@example.com",
+            "hashed_password": "x",
+            "role": "user",
+        }
+        for i in range(rows)
+    ]
+
+
+def test_search_index_matches_sql_without_queries(tmp_path, captured_statements):
+    """O índice em memória responde como o banco, sem executar SQL."""
+    database_path = tmp_path / "search.db"
+    create_users_db(database_path, search_users(2_000))
+    user_search_index = UserSearchIndex(enabled=True)
+
+    async def run():
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{database_path}")
+        try:
+            async with AsyncSession(async_engine) as db:
+                await user_search_index.build(UserService(db).stream_users())
+                backend = get_search_backend("sqlite")
+                for query in SEARCH_QUERIES:
+                    sql_ids = {u.id for u in await backend.search(db, query, 20)}
+                    captured_statements.clear()
+                    index_ids = {u.id for u in user_search_index.search(query, 20)}
+                    assert captured_statements == []
+                    # Termos curtos têm semânticas diferentes (prefixo x LIKE)
+                    if len(query) >= 3:
+                        assert index_ids == sql_ids or len(sql_ids) == 20
+        finally:
+            await async_engine.dispose()
+
+    asyncio.run(run())
+    assert user_search_index.stats()["queries"] == len(SEARCH_QUERIES)
+
+
+@pytest.mark.benchmark
+def test_search_index_faster_than_sql(tmp_path):
+    """O índice em memória deve responder buscas mais rápido que o banco."""
+    rows = 20_000
+    database_path = tmp_path / "search.db"
+    create_users_db(database_path, search_users(rows))
+    iterations = 50
+
+    async def run() -> tuple[float, float, float, int]:
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{database_path}")
+        try:
+            async with AsyncSession(async_engine) as db:
+                user_service = UserService(db)
+                start_time = time.perf_counter()
+                await user_search_index.build(user_service.stream_users())
+                build_time = time.perf_counter() - start_time
+
+                async def measure(search) -> float:
+                    start_time = time.perf_counter()
+                    for _ in range(iterations):
+                        for query in SEARCH_QUERIES:
+                            await search(query)
+                    return (time.perf_counter() - start_time) / (
+                        iterations * len(SEARCH_QUERIES)
+                    )
+
+                async def sql_search(query):
+                    backend = get_search_backend("sqlite")
+                    return await backend.search(db, query, 20)
+
+                async def index_search(query):
+                    return user_search_index.search(query, 20)
+
+                return (
+                    build_time,
+                    await measure(sql_search),
+                    await measure(index_search),
+                    user_search_index.stats()["postings_bytes"],
+                )
+        finally:
+            await async_engine.dispose()
+
+    user_search_index = UserSearchIndex(enabled=True)
+    build_time, sql_time, index_time, postings_bytes = asyncio.run(run())
+    print(
+        f"\nÍndice: {rows} usuários em {build_time * 1000:.0f}ms, "
+        f"postings {postings_bytes / 1e6:.1f}MB; "
+        f"SQL: {sql_time * 1e6:.0f}us/busca, índice: {index_time * 1e6:.0f}us/busca"
+    )
+    assert index_time < sql_time
+
+
+def bulk_payload(prefix: str, count: int) -> list:
+    return [
+        {"nome": f"{prefix} {i}", "email": f"{prefix}{i}@example.com", "password": "x"}
+        for i in range(count)
+    ]
+
+
+def test_bulk_create_is_a_single_insert(client, users_in_db, captured_statements):
+    """O lote inteiro é gravado com um INSERT, não um por usuário."""
+    headers = auth_headers(client, users_in_db[0])
+    captured_statements.clear()
+    response = client.post(
+        "/users/bulk", json=bulk_payload("bulk", 50), headers=headers
+    )
+    assert response.json()["succeeded"] == 50
+    inserts = [q for q in captured_statements if q.startswith("INSERT INTO users")]
+    assert len(inserts) == 1
+
+
+@pytest.mark.benchmark
+def test_bulk_create_faster_than_one_by_one(client, users_in_db):
+    """Criar em lote deve custar menos que um POST /users por usuário."""
+    headers = auth_headers(client, users_in_db[0])
+    count = 100
+
+    def payload(prefix: str) -> list:
+        return bulk_payload(prefix, count)
+
+    start_time = time.perf_counter()
+    for item in payload("single"):
+        assert client.post("/users", json=item).status_code == 201
+    single_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    response = client.post("/users/bulk", json=payload("bulk"), headers=headers)
+    bulk_time = time.perf_counter() - start_time
+    assert response.json()["succeeded"] == count
+
+    print(
+        f"\nUm a um: {single_time * 1000:.0f}ms, lote: {bulk_time * 1000:.0f}ms "
+        f"({count} usuários)"
+    )
+    assert bulk_time < single_time
+
+
+def test_user_serialization_fast_path_matches_response_model(tmp_path):
+    """dump_users gera o mesmo JSON que o response_model validado."""
+    url = create_users_db(
+        tmp_path / "serialize.db",
+        [
+            {
+                "nome": f"Usuário {i}",
+                "email": f"user{i}@example.com",
+                "hashed_password": "x",
+                "role": "admin" if i % 7 == 0 else "user",
+            }
+            for i in range(200)
+        ],
+    )
+    engine = create_engine(url)
+    columns = [getattr(User, field) for field in CACHED_USER_FIELDS]
+    with Session(engine) as db:
+        orm_users = db.scalars(select(User)).all()
+        user_rows = db.execute(select(*columns)).all()
+        users = USER_LIST_ADAPTER.validate_python(orm_users, from_attributes=True)
+        expected = json.loads(USER_LIST_ADAPTER.dump_json(users))
+    engine.dispose()
+
+    assert json.loads(dump_users(user_rows)) == expected
+
+
+@pytest.mark.benchmark
+def test_user_serialization_fast_path(tmp_path):
+    """Linhas serializadas com orjson devem custar menos que o response_model."""
+    rows = 10_000
+    database_path = tmp_path / "serialize.db"
+    engine = create_engine(f"sqlite:///{database_path}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(
+            insert(User),
+            [
+                {
+                    "nome": f"Usuário {i}",
+                    "email": f"user{i}@example.com",
+                    "hashed_password": "x",
+                    "role": "user",
+                }
+                for i in range(rows)
+            ],
+        )
+
+    def measure(fn, repeat: int = 5) -> float:
+        best = float("inf")
+        for _ in range(repeat):
+            start_time = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - start_time)
+        return best
+
+    columns = [getattr(User, field) for field in CACHED_USER_FIELDS]
+    with engine.connect() as conn:
+        with Session(bind=conn) as db:
+            orm_users = db.scalars(select(User)).all()
+            orm_load = measure(lambda: db.scalars(select(User)).all(), repeat=3)
+            db.expunge_all()
+        user_rows = conn.execute(select(*columns)).all()
+        rows_load = measure(lambda: conn.execute(select(*columns)).all(), repeat=3)
+    engine.dispose()
+
+    # Antes: objetos ORM validados pelo schema e então serializados
+    def stdlib():
+        users = USER_LIST_ADAPTER.validate_python(orm_users, from_attributes=True)
+        return json.dumps(jsonable_encoder(users)).encode("utf-8")
+
+    def adapter():
+        users = USER_LIST_ADAPTER.validate_python(orm_users, from_attributes=True)
+        return USER_LIST_ADAPTER.dump_json(users)
+
+    def fast():
+        return dump_users(user_rows)
+
+    assert json.loads(fast()) == json.loads(adapter())
+    stdlib_time = measure(stdlib)
+    adapter_time = measure(adapter)
+    fast_time = measure(fast)
+    print(
+        f"\nSerialização de {rows} usuários: json {stdlib_time * 1000:.1f}ms, "
+        f"TypeAdapter {adapter_time * 1000:.1f}ms, orjson {fast_time * 1000:.1f}ms; "
+        f"leitura ORM {orm_load * 1000:.0f}ms, colunas {rows_load * 1000:.0f}ms"
+    )
+    assert fast_time < adapter_time < stdlib_time
+    assert rows_load + fast_time < orm_load + adapter_time
@@ -1,5 +1,29 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+
+import app.database as database
+import app.services.user_service as user_service_module
+import app.services.user_stats as user_stats_module
+from app.models.base import Base
+from app.models.user import LEGACY_CREATED_AT, User
+from app.models.user_counter import UserCounter
+from app.schemas.user import UserCreate, UserUpdate
+from app.services.password_hasher import password_hasher
+from app.services.user_cache import InMemoryCacheBackend, UserCache, user_cache
+from app.services.user_search_index import IndexedUser, UserSearchIndex
+from app.services.user_service import UserService
+from app.services.user_stats import UserStatsService
+from tests.conftest import TestingAsyncSessionLocal, TestingSessionLocal
 
 
 @pytest.fixture
@@ -429,3 +453,1236 @@ def test_count_users_after_deleting_user(
     response = client.get("/users/count", headers=admin_auth_headers)
     new_count = response.json()
     assert new_count == initial_count - 1
+
+
+@pytest.fixture
+def many_users(client: TestClient, users_in_db):
+    """Fixture que cria usuários extras para testar a paginação."""
+    for nome in ["Eduarda", "Bruno", "Daniel", "Carla", "Ana"]:
+        response = client.post(
+            "/users",
+            json={
+                "nome": nome,
+                "email": f"{nome.lower()}@example.com",
+                "password": "password123",
+            },
+        )
+        assert response.status_code == 201
+
+
+def fetch_all_pages(client: TestClient, headers: dict, **params) -> list:
+    """Percorre todas as páginas de GET /users seguindo o cursor."""
+    users = []
+    cursor = None
+    while True:
+        query = {**params, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/users", params=query, headers=headers)
+        assert response.status_code == 200
+        users.extend(response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            return users
+
+
+def test_get_users_paginates_by_id(client: TestClient, admin_auth_headers, many_users):
+    response = client.get("/users?limit=3", headers=admin_auth_headers)
+    assert response.status_code == 200
+    assert len(response.json()) == 3
+    assert "X-Next-Cursor" in response.headers
+    assert 'rel="next"' in response.headers["Link"]
+
+    users = fetch_all_pages(client, admin_auth_headers, limit=3)
+    ids = [user["id"] for user in users]
+    assert len(ids) == 7
+    assert ids == sorted(ids)
+
+
+def test_get_users_paginates_by_nome(
+    client: TestClient, admin_auth_headers, many_users
+):
+    users = fetch_all_pages(client, admin_auth_headers, limit=2, sort="nome")
+    nomes = [user["nome"] for user in users]
+    assert len(nomes) == 7
+    assert nomes == sorted(nomes)
+
+
+def test_get_users_last_page_has_no_cursor(
+    client: TestClient, admin_auth_headers, users_in_db
+):
+    response = client.get("/users?limit=10", headers=admin_auth_headers)
+    assert response.status_code == 200
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_get_users_invalid_cursor_fails(client: TestClient, admin_auth_headers):
+    response = client.get("/users?cursor=invalido", headers=admin_auth_headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Cursor inválido"
+
+
+def test_get_users_cursor_from_other_sort_fails(
+    client: TestClient, admin_auth_headers, many_users
+):
+    response = client.get("/users?limit=2", headers=admin_auth_headers)
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get(
+        "/users", params={"cursor": cursor, "sort": "nome"}, headers=admin_auth_headers
+    )
+    assert response.status_code == 400
+
+
+def test_get_users_page_size_is_capped(client: TestClient, admin_auth_headers):
+    response = client.get("/users?limit=1000", headers=admin_auth_headers)
+    assert response.status_code == 422
+
+
+def test_get_users_filters(client: TestClient, admin_auth_headers, many_users):
+    response = client.get("/users?role=admin", headers=admin_auth_headers)
+    assert [user["email"] for user in response.json()] == ["admin@example.com"]
+
+    users = fetch_all_pages(
+        client, admin_auth_headers, limit=2, email_domain="@Example.COM"
+    )
+    assert len(users) == 7
+    response = client.get("/users?email_domain=other.com", headers=admin_auth_headers)
+    assert response.json() == []
+
+    with TestingSessionLocal() as db:
+        db.execute(
+            update(User)
+            .where(User.email.in_(["ana@example.com", "bruno@example.com"]))
+            .values(created_at=datetime(2020, 1, 1, tzinfo=timezone.utc))
+        )
+        db.commit()
+    users = fetch_all_pages(
+        client,
+        admin_auth_headers,
+        limit=2,
+        role="user",
+        created_after="2021-01-01T00:00:00-03:00",
+    )
+    assert sorted(user["nome"] for user in users) == [
+        "Carla",
+        "Common User",
+        "Daniel",
+        "Eduarda",
+    ]
+
+
+def test_get_users_sorts(client: TestClient, admin_auth_headers, many_users):
+    by_id = [user["id"] for user in fetch_all_pages(client, admin_auth_headers)]
+
+    users = fetch_all_pages(client, admin_auth_headers, limit=2, sort="-id")
+    assert [user["id"] for user in users] == by_id[::-1]
+
+    users = fetch_all_pages(client, admin_auth_headers, limit=2, sort="-nome")
+    nomes = [user["nome"] for user in users]
+    assert nomes == sorted(nomes, reverse=True)
+
+    # Os usuários foram criados em ordem de id
+    users = fetch_all_pages(client, admin_auth_headers, limit=2, sort="created_at")
+    assert [user["id"] for user in users] == by_id
+    users = fetch_all_pages(
+        client, admin_auth_headers, limit=2, sort="-created_at", fields="nome"
+    )
+    assert [user["nome"] for user in users][-2:] == ["Common User", "Admin User"]
+
+
+def test_get_users_rejects_invalid_filters(
+    client: TestClient, admin_auth_headers, users_in_db
+):
+    for params in (
+        {"role": "root"},
+        {"created_after": "ontem"},
+        {"email_domain": ""},
+        {"sort": "email"},
+    ):
+        response = client.get("/users", params=params, headers=admin_auth_headers)
+        assert response.status_code == 422
+
+    response = client.get("/users?limit=1&sort=-nome", headers=admin_auth_headers)
+    cursor = response.headers["X-Next-Cursor"]
+    response = client.get(
+        "/users", params={"cursor": cursor, "sort": "nome"}, headers=admin_auth_headers
+    )
+    assert response.status_code == 400
+
+
+def test_export_users_ndjson(client: TestClient, admin_auth_headers, many_users):
+    response = client.get("/users/export", headers=admin_auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+
+    users = [json.loads(line) for line in response.text.splitlines()]
+    assert len(users) == 7
+    assert [user["id"] for user in users] == sorted(user["id"] for user in users)
+    assert set(users[0]) == {"id", "nome", "email", "role"}
+
+
+def test_export_users_csv(client: TestClient, admin_auth_headers, many_users):
+    response = client.get("/users/export?format=csv", headers=admin_auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    assert 'filename="users.csv"' in response.headers["content-disposition"]
+
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 7
+    assert {row["email"] for row in rows} >= {"admin@example.com", "ana@example.com"}
+
+
+def test_export_users_as_common_user_fails(client: TestClient, user_auth_headers):
+    response = client.get("/users/export", headers=user_auth_headers)
+    assert response.status_code == 403
+
+
+def test_search_users_ranks_and_paginates(
+    client: TestClient, admin_auth_headers, many_users
+):
+    response = client.get(
+        "/users/search", params={"query": "dani"}, headers=admin_auth_headers
+    )
+    assert response.status_code == 200
+    assert [user["email"] for user in response.json()] == ["daniel@example.com"]
+
+    response = client.get(
+        "/users/search",
+        params={"query": "example", "limit": 3, "offset": 3},
+        headers=admin_auth_headers,
+    )
+    assert response.status_code == 200
+    assert len(response.json()) == 3
+
+
+def test_search_users_short_query_falls_back_to_like(
+    client: TestClient, admin_auth_headers, many_users
+):
+    response = client.get(
+        "/users/search", params={"query": "rl"}, headers=admin_auth_headers
+    )
+    assert response.status_code == 200
+    assert [user["nome"] for user in response.json()] == ["Carla"]
+
+
+def test_search_users_index_follows_updates_and_deletes(
+    client: TestClient, admin_auth_headers, user_auth_headers, users_in_db
+):
+    user_id = users_in_db[1]["id"]
+    response = client.put(
+        f"/users/{user_id}", json={"nome": "Zuleica"}, headers=user_auth_headers
+    )
+    assert response.status_code == 200
+
+    response = client.get("/users/search?query=zulei", headers=admin_auth_headers)
+    assert [user["id"] for user in response.json()] == [user_id]
+    response = client.get("/users/search?query=common", headers=admin_auth_headers)
+    assert response.json() == []
+
+    client.delete(f"/users/{user_id}", headers=admin_auth_headers)
+    response = client.get("/users/search?query=zulei", headers=admin_auth_headers)
+    assert response.json() == []
+
+
+def test_search_users_treats_query_literally(client: TestClient, admin_auth_headers):
+    for query in ['"admin', "a%b", "OR NOT"]:
+        response = client.get(
+            "/users/search", params={"query": query}, headers=admin_auth_headers
+        )
+        assert response.status_code == 200
+        assert response.json() == []
+
+
+def test_user_search_index_ranks_prefix_and_substring():
+    index = UserSearchIndex()
+    index.load(
+        [
+            IndexedUser(1, "Mariana Silva", "mariana@example.com", "user"),
+            IndexedUser(2, "Ana Maria", "ana@example.com", "user"),
+            IndexedUser(3, "Joana", "joana@corp.com", "admin"),
+        ]
+    )
+
+    # Início de palavra primeiro, depois substring no meio da palavra
+    assert [u.id for u in index.search("ana", limit=10)] == [2, 1, 3]
+    assert [u.id for u in index.search("ana", limit=1, offset=1)] == [1]
+    # Termos curtos casam pelo início de uma palavra
+    assert [u.id for u in index.search("ma", limit=10)] == [1, 2]
+    assert index.search("xyz", limit=10) == []
+
+
+def test_user_search_index_updates_and_compacts():
+    index = UserSearchIndex(compact_ratio=0.5)
+    index.load([IndexedUser(1, "Bruno", "bruno@example.com", "user")])
+
+    index.add(IndexedUser(1, "Carlos", "carlos@example.com", "user"))
+    assert index.search("bruno", limit=10) == []
+    assert [u.nome for u in index.search("carl", limit=10)] == ["Carlos"]
+
+    # Reindexações sucessivas acumulam lápides até a compactação
+    for i in range(1100):
+        index.add(IndexedUser(1, f"Carlos {i}", "carlos@example.com", "user"))
+    stats = index.stats()
+    assert stats["compactions"] == 1
+    assert stats["slots"] < 1100
+    assert [u.nome for u in index.search("carlos", limit=10)] == ["Carlos 1099"]
+
+    index.remove(1)
+    assert index.search("carl", limit=10) == []
+    assert index.stats()["documents"] == 0
+
+
+def test_user_search_index_rebuild_keeps_concurrent_writes():
+    index = UserSearchIndex()
+    snapshot = [
+        IndexedUser(1, "Ana", "u1@example.com", "user"),
+        IndexedUser(2, "Bruno", "u2@example.com", "user"),
+    ]
+    index.load(snapshot)
+
+    async def batches():
+        # Lote lido do banco antes das escritas abaixo
+        yield snapshot
+        # Escritas locais enquanto a reconstrução ainda lê o banco
+        index.add(IndexedUser(1, "Carla", "u1@example.com", "user"))
+        index.remove(2)
+        index.add(IndexedUser(3, "Daniel", "u3@example.com", "user"))
+        # As buscas seguem no conteúdo atual durante a reconstrução
+        assert [u.nome for u in index.search("carla", limit=10)] == ["Carla"]
+        yield []
+
+    asyncio.run(index.build(batches()))
+
+    assert index.search("ana", limit=10) == []
+    assert index.search("bruno", limit=10) == []
+    assert [u.nome for u in index.search("carla", limit=10)] == ["Carla"]
+    assert [u.nome for u in index.search("daniel", limit=10)] == ["Daniel"]
+    stats = index.stats()
+    assert stats["documents"] == 2
+    assert stats["replayed_writes"] == 3
+    assert stats["rebuilds"] == 2
+
+
+@pytest.fixture
+def search_index(monkeypatch, client: TestClient, many_users):
+    """Fixture que ativa o índice em memória carregado com os usuários do banco."""
+    monkeypatch.setattr(user_service_module, "user_search_index", UserSearchIndex())
+    with TestingSessionLocal() as db:
+        user_service_module.user_search_index.load(db.query(User).all())
+    return user_service_module.user_search_index
+
+
+def test_search_users_uses_in_memory_index(
+    client: TestClient, admin_auth_headers, user_auth_headers, users_in_db, search_index
+):
+    response = client.get("/users/search?query=dani", headers=admin_auth_headers)
+    assert [user["email"] for user in response.json()] == ["daniel@example.com"]
+
+    user_id = users_in_db[1]["id"]
+    client.put(f"/users/{user_id}", json={"nome": "Zuleica"}, headers=user_auth_headers)
+    response = client.get("/users/search?query=zul", headers=admin_auth_headers)
+    assert response.json() == [
+        {"id": user_id, "nome": "Zuleica", "email": "user@example.com", "role": "user"}
+    ]
+
+    client.delete(f"/users/{user_id}", headers=admin_auth_headers)
+    response = client.get("/users/search?query=zul", headers=admin_auth_headers)
+    assert response.json() == []
+    assert search_index.stats()["queries"] == 3
+
+
+def test_search_index_falls_back_to_db_when_stale_and_refreshes(
+    client: TestClient, admin_auth_headers, search_index
+):
+    # Usuário criado por outro worker, que o índice deste worker não viu
+    with TestingSessionLocal() as db:
+        db.add(User(nome="Otavio", email="otavio@example.com", hashed_password="x"))
+        db.commit()
+
+    response = client.get("/users/search?query=otav", headers=admin_auth_headers)
+    assert response.json() == []
+
+    search_index.built_at -= search_index.max_age + 1
+    assert not search_index.stats()["fresh"]
+    response = client.get("/users/search?query=otav", headers=admin_auth_headers)
+    assert [user["nome"] for user in response.json()] == ["Otavio"]
+    assert search_index.stats()["queries"] == 1
+
+    async def refresh_once():
+        task = asyncio.create_task(
+            user_service_module.run_index_refresh(TestingAsyncSessionLocal, 0.01)
+        )
+        while search_index.rebuilds < 2:
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(refresh_once())
+    assert search_index.fresh
+    assert [u.nome for u in search_index.search("otav", limit=10)] == ["Otavio"]
+
+
+def test_user_stats_as_admin(
+    client: TestClient, admin_auth_headers, user_auth_headers, many_users
+):
+    response = client.get("/users/stats?days=3", headers=admin_auth_headers)
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["total"] == 7
+    assert stats["by_role"] == {"admin": 1, "user": 6}
+    assert stats["created_last_days"]["days"] == 3
+    assert stats["created_last_days"]["total"] == 7
+    assert len(stats["created_last_days"]["by_day"]) == 3
+
+
+def test_user_stats_follow_role_changes_and_deletes(
+    client: TestClient, admin_auth_headers, user_auth_headers, users_in_db
+):
+    user_id = users_in_db[1]["id"]
+    client.put(f"/users/{user_id}", json={"role": "admin"}, headers=user_auth_headers)
+    stats = client.get("/users/stats", headers=admin_auth_headers).json()
+    assert stats["by_role"] == {"admin": 2}
+
+    client.delete(f"/users/{user_id}", headers=admin_auth_headers)
+    stats = client.get("/users/stats", headers=admin_auth_headers).json()
+    assert stats["total"] == 1
+    assert stats["by_role"] == {"admin": 1}
+    assert stats["created_last_days"]["total"] == 1
+
+
+def test_user_stats_as_common_user_fails(client: TestClient, user_auth_headers):
+    response = client.get("/users/stats", headers=user_auth_headers)
+    assert response.status_code == 403
+
+
+def test_reconcile_user_counters_fixes_drift(
+    client: TestClient, admin_auth_headers, users_in_db
+):
+    # Escritas fora da aplicação não passam pelos contadores
+    with TestingSessionLocal() as db:
+        db.add(User(nome="Direto", email="direto@example.com", hashed_password="x"))
+        db.execute(
+            update(UserCounter).where(UserCounter.name == "role:admin").values(value=5)
+        )
+        db.commit()
+    assert client.get("/users/count", headers=admin_auth_headers).json() == 2
+
+    async def reconcile():
+        async with TestingAsyncSessionLocal() as db:
+            return await UserStatsService(db).reconcile()
+
+    assert asyncio.run(reconcile()) == 4
+    stats = client.get("/users/stats", headers=admin_auth_headers).json()
+    assert stats["total"] == 3
+    assert stats["by_role"] == {"admin": 1, "user": 2}
+    assert stats["created_last_days"]["total"] == 3
+    assert asyncio.run(reconcile()) == 0
+
+
+def test_legacy_users_are_not_counted_as_signups(
+    client: TestClient, admin_auth_headers, users_in_db
+):
+    # Usuário anterior à coluna created_at, como os preenchidos pela migração
+    with TestingSessionLocal() as db:
+        legacy = User(
+            nome="Antigo",
+            email="antigo@example.com",
+            hashed_password="x",
+            created_at=LEGACY_CREATED_AT,
+        )
+        db.add(legacy)
+        db.commit()
+        legacy_id = legacy.id
+
+    async def reconcile():
+        async with TestingAsyncSessionLocal() as db:
+            return await UserStatsService(db).reconcile()
+
+    # Só o total e a role mudam; nenhum cadastro em 1970-01-01
+    assert asyncio.run(reconcile()) == 2
+    stats = client.get("/users/stats?days=3", headers=admin_auth_headers).json()
+    assert stats["total"] == 3
+    assert stats["created_last_days"]["total"] == 2
+
+    response = client.get(
+        "/users", params={"created_after": "1900-01-01"}, headers=admin_auth_headers
+    )
+    assert legacy_id not in [user["id"] for user in response.json()]
+
+    client.delete(f"/users/{legacy_id}", headers=admin_auth_headers)
+    with TestingSessionLocal() as db:
+        names = db.scalars(select(UserCounter.name)).all()
+    assert not any(name.startswith("signups:1970") for name in names)
+    assert asyncio.run(reconcile()) == 0
+
+
+def test_reconcile_groups_signups_by_utc_day_on_postgres():
+    created_day = user_stats_module._created_day("postgresql")
+    sql = str(created_day.compile(dialect=postgresql.dialect()))
+    assert sql.startswith("date(timezone(")
+    assert "users.created_at" in sql
+
+
+def test_get_user_is_cached_and_invalidated_on_update(
+    client: TestClient, admin_auth_headers, user_auth_headers, users_in_db
+):
+    user_id = users_in_db[1]["id"]
+    client.get(f"/users/{user_id}", headers=admin_auth_headers)
+    before = user_cache.stats()
+    response = client.get(f"/users/{user_id}", headers=admin_auth_headers)
+    assert response.json()["nome"] == "Common User"
+    assert user_cache.stats()["l1_hits"] == before["l1_hits"] + 1
+
+    client.put(
+        f"/users/{user_id}", json={"nome": "Novo Nome"}, headers=user_auth_headers
+    )
+    response = client.get(f"/users/{user_id}", headers=admin_auth_headers)
+    assert response.json()["nome"] == "Novo Nome"
+
+    client.delete(f"/users/{user_id}", headers=admin_auth_headers)
+    response = client.get(f"/users/{user_id}", headers=admin_auth_headers)
+    assert response.status_code == 404
+
+
+def test_user_cache_falls_back_to_l2_and_coalesces_misses():
+    cache = UserCache(InMemoryCacheBackend(), l1_ttl=60, l2_ttl=60)
+    loads = 0
+
+    async def loader():
+        nonlocal loads
+        loads += 1
+        await asyncio.sleep(0.01)
+        return {"id": 1, "nome": "Ana"}
+
+    async def run():
+        results = await asyncio.gather(
+            *(cache.get_or_load(1, loader) for _ in range(10))
+        )
+        assert all(result == {"id": 1, "nome": "Ana"} for result in results)
+
+        # Outro worker: L1 vazio, mas o L2 já tem o registro
+        cache.l1.clear()
+        assert await cache.get_or_load(1, loader) == {"id": 1, "nome": "Ana"}
+
+        await cache.invalidate(1)
+        await cache.get_or_load(1, loader)
+
+    asyncio.run(run())
+    stats = cache.stats()
+    assert loads == 2
+    assert stats["coalesced"] == 9
+    assert stats["l2_hits"] == 1
+    assert stats["misses"] == 2
+
+
+def test_user_cache_waiters_survive_cancelled_load():
+    cache = UserCache(l1_ttl=60)
+    loads = 0
+
+    async def loader():
+        nonlocal loads
+        loads += 1
+        await asyncio.sleep(0.05)
+        return {"id": 1, "nome": "Ana"}
+
+    async def run():
+        first = asyncio.create_task(cache.get_or_load(1, loader))
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.create_task(cache.get_or_load(1, loader)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await asyncio.gather(*waiters)
+
+    results = asyncio.run(run())
+    assert results == [{"id": 1, "nome": "Ana"}] * 3
+    # Um dos que esperavam assumiu a carga e os outros esperaram por ele
+    assert loads == 2
+
+
+def test_user_cache_skips_values_loaded_before_invalidation():
+    cache = UserCache(l1_ttl=60)
+
+    async def run():
+        async def stale_loader():
+            # A escrita invalida o cache enquanto a leitura antiga está em curso
+            await cache.invalidate(1)
+            return {"id": 1, "nome": "Antigo"}
+
+        await cache.get_or_load(1, stale_loader)
+        assert cache.l1.get(1) is None
+
+    asyncio.run(run())
+
+
+def test_user_cache_other_worker_cannot_fill_l2_after_invalidation():
+    # Dois workers compartilhando o mesmo L2
+    l2 = InMemoryCacheBackend()
+    worker_a = UserCache(l2, l1_ttl=60, l2_ttl=60)
+    worker_b = UserCache(l2, l1_ttl=60, l2_ttl=60)
+
+    async def run():
+        read_done = asyncio.Event()
+        write_done = asyncio.Event()
+
+        async def stale_loader():
+            read_done.set()
+            await write_done.wait()
+            return {"id": 1, "nome": "Antigo", "version": 1}
+
+        load = asyncio.create_task(worker_a.get_or_load(1, stale_loader))
+        await read_done.wait()
+        await worker_b.invalidate(1)
+        write_done.set()
+        await load
+
+        assert await worker_b.get(1) is None
+
+        async def fresh_loader():
+            return {"id": 1, "nome": "Novo", "version": 2}
+
+        assert (await worker_b.get_or_load(1, fresh_loader))["nome"] == "Novo"
+
+    asyncio.run(run())
+
+
+def test_user_cache_l2_fill_never_replaces_newer_version():
+    async def run():
+        l2 = InMemoryCacheBackend()
+        await l2.fill("1", json.dumps({"id": 1, "version": 3}), 3, 60)
+        await l2.fill("1", json.dumps({"id": 1, "version": 2}), 2, 60)
+        assert json.loads(await l2.get("1"))["version"] == 3
+
+        await l2.fill("1", json.dumps({"id": 1, "version": 4}), 4, 60)
+        assert json.loads(await l2.get("1"))["version"] == 4
+
+    asyncio.run(run())
+
+
+def test_user_cache_invalidation_only_cancels_fills_of_that_user():
+    cache = UserCache(l1_ttl=60)
+
+    async def run():
+        async def loader():
+            await cache.invalidate(2)
+            return {"id": 1, "nome": "Atual"}
+
+        await cache.get_or_load(1, loader)
+        assert cache.l1.get(1) == {"id": 1, "nome": "Atual"}
+
+    asyncio.run(run())
+
+
+def test_get_user_conditional_get(client: TestClient, admin_auth_headers, users_in_db):
+    user_id = users_in_db[1]["id"]
+    response = client.get(f"/users/{user_id}")
+    etag = response.headers["ETag"]
+
+    response = client.get(f"/users/{user_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+    response = client.get(f"/users/{user_id}", headers={"If-None-Match": f"W/{etag}"})
+    assert response.status_code == 304
+
+    response = client.get(f"/users/{user_id}", headers={"If-None-Match": '"outra"'})
+    assert response.status_code == 200
+
+    response = client.get("/users/9999", headers={"If-None-Match": etag})
+    assert response.status_code == 404
+
+
+def test_update_user_changes_etag(client: TestClient, user_auth_headers, users_in_db):
+    user_id = users_in_db[1]["id"]
+    etag = client.get(f"/users/{user_id}").headers["ETag"]
+
+    response = client.put(
+        f"/users/{user_id}", json={"nome": "Outro Nome"}, headers=user_auth_headers
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+    response = client.get(f"/users/{user_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["nome"] == "Outro Nome"
+
+
+def test_update_user_if_match(client: TestClient, user_auth_headers, users_in_db):
+    user_id = users_in_db[1]["id"]
+    etag = client.get(f"/users/{user_id}").headers["ETag"]
+
+    response = client.put(
+        f"/users/{user_id}",
+        json={"nome": "Primeira"},
+        headers={**user_auth_headers, "If-Match": etag},
+    )
+    assert response.status_code == 200
+
+    # A mesma ETag agora está desatualizada
+    response = client.put(
+        f"/users/{user_id}",
+        json={"nome": "Segunda"},
+        headers={**user_auth_headers, "If-Match": etag},
+    )
+    assert response.status_code == 412
+    assert client.get(f"/users/{user_id}").json()["nome"] == "Primeira"
+
+
+def test_get_users_conditional_get(
+    client: TestClient, admin_auth_headers, user_auth_headers, users_in_db
+):
+    response = client.get("/users", headers=admin_auth_headers)
+    etag = response.headers["ETag"]
+
+    response = client.get(
+        "/users", headers={**admin_auth_headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+
+    user_id = users_in_db[1]["id"]
+    client.put(f"/users/{user_id}", json={"nome": "Mudou"}, headers=user_auth_headers)
+    response = client.get(
+        "/users", headers={**admin_auth_headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def test_concurrent_update_raises_version_conflict(client: TestClient, users_in_db):
+    user_id = users_in_db[1]["id"]
+
+    async def run():
+        async with TestingAsyncSessionLocal() as first:
+            async with TestingAsyncSessionLocal() as second:
+                stale = await second.get(User, user_id)
+                await UserService(first).update_user(
+                    user_id, UserUpdate(nome="Primeira")
+                )
+                # O UPDATE filtra pela versão lida, que já não existe
+                stale.nome = "Segunda"
+                with pytest.raises(StaleDataError):
+                    await second.commit()
+
+    asyncio.run(run())
+
+
+def test_bulk_create_users(client: TestClient, admin_auth_headers, users_in_db):
+    payload = [
+        {"nome": "Ana", "email": "ana@example.com", "password": "secret"},
+        {"nome": "Repetido", "email": "admin@example.com", "password": "secret"},
+        {"nome": "Sem email", "password": "secret"},
+        {"nome": "Bruno", "email": "bruno@example.com", "password": "secret"},
+        {"nome": "Ana 2", "email": "ana@example.com", "password": "secret"},
+        {
+            "nome": "Carla",
+            "email": "carla@example.com",
+            "password": "secret",
+            "role": "admin",
+        },
+    ]
+    response = client.post("/users/bulk", json=payload, headers=admin_auth_headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["succeeded"] == 3
+    assert body["failed"] == 3
+    statuses = [(r["index"], r["status"]) for r in body["results"]]
+    assert statuses == [
+        (0, "created"),
+        (1, "error"),
+        (2, "error"),
+        (3, "created"),
+        (4, "error"),
+        (5, "created"),
+    ]
+    assert body["results"][1]["detail"] == "Email já está em uso"
+    assert body["results"][2]["detail"].startswith("email:")
+    assert body["results"][4]["detail"] == "Email repetido no lote"
+
+    # Os usuários criados conseguem logar e entram nos contadores
+    response = client.post(
+        "/login", json={"email": "carla@example.com", "password": "secret"}
+    )
+    assert response.status_code == 200
+    stats = client.get("/users/stats", headers=admin_auth_headers).json()
+    assert stats["total"] == 5
+    assert stats["by_role"] == {"admin": 2, "user": 3}
+
+
+def test_bulk_create_users_ndjson(client: TestClient, admin_auth_headers):
+    lines = [
+        json.dumps({"nome": f"User {i}", "email": f"u{i}@example.com", "password": "x"})
+        for i in range(5)
+    ]
+    response = client.post(
+        "/users/bulk",
+        content="\n".join(lines) + "\n",
+        headers={**admin_auth_headers, "Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    assert response.json()["succeeded"] == 5
+    assert client.get("/users/count", headers=admin_auth_headers).json() == 7
+
+
+def test_bulk_create_users_rejects_bad_bodies(client: TestClient, admin_auth_headers):
+    response = client.post("/users/bulk", content="{", headers=admin_auth_headers)
+    assert response.status_code == 400
+    response = client.post(
+        "/users/bulk", json={"nome": "x"}, headers=admin_auth_headers
+    )
+    assert response.status_code == 400
+    response = client.post("/users/bulk", json=[{}] * 1001, headers=admin_auth_headers)
+    assert response.status_code == 413
+
+
+def test_bulk_create_users_rejects_oversized_bodies_early(
+    client: TestClient, admin_auth_headers
+):
+    # O limite de itens é atingido antes da última linha, que está incompleta
+    lines = [json.dumps({"nome": f"U{i}", "email": f"u{i}@x.com"}) for i in range(1001)]
+    response = client.post(
+        "/users/bulk",
+        content="\n".join(lines) + '\n{"nome": "incomple',
+        headers={**admin_auth_headers, "Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 413
+
+    response = client.post(
+        "/users/bulk",
+        json=[{"nome": "x" * (3 * 1024 * 1024)}],
+        headers=admin_auth_headers,
+    )
+    assert response.status_code == 413
+    assert "bytes" in response.json()["detail"]
+
+
+def test_bulk_create_users_stays_within_hashing_pool_capacity(
+    client: TestClient, admin_auth_headers, monkeypatch
+):
+    # Sem fila, mais hashes simultâneos que processos seriam recusados
+    monkeypatch.setattr(password_hasher, "pool_size", 2)
+    monkeypatch.setattr(password_hasher, "queue_depth", 0)
+    users = [
+        {"nome": f"User {i}", "email": f"u{i}@example.com", "password": "x"}
+        for i in range(6)
+    ]
+    response = client.post("/users/bulk", json=users, headers=admin_auth_headers)
+    assert response.status_code == 200
+    assert response.json()["succeeded"] == 6
+
+
+def test_bulk_create_users_as_common_user_fails(client: TestClient, user_auth_headers):
+    response = client.post("/users/bulk", json=[], headers=user_auth_headers)
+    assert response.status_code == 403
+
+
+def test_bulk_create_users_retries_after_concurrent_insert(
+    monkeypatch, client: TestClient, users_in_db
+):
+    original = UserService._existing_emails
+    calls = 0
+
+    async def stale_first_check(self, emails):
+        # Simula um cadastro concorrente entre a verificação e o INSERT
+        nonlocal calls
+        calls += 1
+        return set() if calls == 1 else await original(self, emails)
+
+    monkeypatch.setattr(UserService, "_existing_emails", stale_first_check)
+    items = [
+        UserCreate(nome="Novo", email="novo@example.com", password="secret"),
+        UserCreate(nome="Admin", email="admin@example.com", password="secret"),
+    ]
+
+    async def run():
+        async with TestingAsyncSessionLocal() as db:
+            return await UserService(db).bulk_create_users(items)
+
+    results = asyncio.run(run())
+    assert [r["status"] for r in results] == ["created", "error"]
+    assert calls == 2
+
+
+def test_bulk_update_users_role(client: TestClient, admin_auth_headers, users_in_db):
+    admin_id, user_id = users_in_db[0]["id"], users_in_db[1]["id"]
+    etag = client.get(f"/users/{user_id}").headers["ETag"]
+
+    response = client.patch(
+        "/users/bulk",
+        json={"ids": [user_id, admin_id, 999, user_id], "role": "admin"},
+        headers=admin_auth_headers,
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert [r["status"] for r in body["results"]] == [
+        "updated",
+        "unchanged",
+        "error",
+        "error",
+    ]
+    assert body["results"][2]["detail"] == "Usuário não encontrado"
+    assert body["results"][3]["detail"] == "Id repetido no lote"
+    assert (body["succeeded"], body["failed"]) == (2, 2)
+
+    # A versão muda, o cache é invalidado e os contadores acompanham
+    response = client.get(f"/users/{user_id}")
+    assert response.json()["role"] == "admin"
+    assert response.headers["ETag"] != etag
+    stats = client.get("/users/stats", headers=admin_auth_headers).json()
+    assert stats["by_role"] == {"admin": 2}
+
+
+def test_bulk_delete_users(client: TestClient, admin_auth_headers, users_in_db):
+    user_id = users_in_db[1]["id"]
+    created = client.post(
+        "/users/bulk",
+        json=[
+            {"nome": f"Morador {i}", "email": f"m{i}@example.com", "password": "x"}
+            for i in range(3)
+        ],
+        headers=admin_auth_headers,
+    ).json()
+    ids = [user_id] + [r["id"] for r in created["results"]] + [999]
+
+    response = client.request(
+        "DELETE", "/users/bulk", json={"ids": ids}, headers=admin_auth_headers
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert [r["status"] for r in body["results"]] == ["deleted"] * 4 + ["error"]
+    assert body["succeeded"] == 4
+
+    assert client.get(f"/users/{user_id}").status_code == 404
+    stats = client.get("/users/stats", headers=admin_auth_headers).json()
+    assert stats["total"] == 1
+    assert stats["by_role"] == {"admin": 1}
+
+
+def test_bulk_update_and_delete_validation(
+    client: TestClient, admin_auth_headers, user_auth_headers
+):
+    response = client.patch(
+        "/users/bulk", json={"ids": [1], "role": "root"}, headers=admin_auth_headers
+    )
+    assert response.status_code == 422
+    response = client.request(
+        "DELETE", "/users/bulk", json={"ids": []}, headers=admin_auth_headers
+    )
+    assert response.status_code == 422
+    response = client.request(
+        "DELETE",
+        "/users/bulk",
+        json={"ids": list(range(1001))},
+        headers=admin_auth_headers,
+    )
+    assert response.status_code == 413
+    response = client.request(
+        "DELETE", "/users/bulk", json={"ids": [1]}, headers=user_auth_headers
+    )
+    assert response.status_code == 403
+
+
+def test_get_users_sparse_fields(
+    client: TestClient, admin_auth_headers, many_users, captured_statements
+):
+    users = fetch_all_pages(
+        client, admin_auth_headers, limit=3, sort="nome", fields="nome, id"
+    )
+    assert len(users) == 7
+    assert all(set(user) == {"id", "nome"} for user in users)
+    assert [user["nome"] for user in users] == sorted(user["nome"] for user in users)
+
+    # Só as colunas pedidas (mais id, versão e chave de ordenação) são lidas
+    page_query = next(q for q in captured_statements if "ORDER BY users.nome" in q)
+    assert "users.email" not in page_query
+    assert "users.role" not in page_query
+    assert "hashed_password" not in page_query
+
+
+def test_get_users_sparse_fields_change_etag(client: TestClient, admin_auth_headers):
+    full = client.get("/users", headers=admin_auth_headers)
+    narrow = client.get("/users?fields=id", headers=admin_auth_headers)
+    assert narrow.json() == [{"id": user["id"]} for user in full.json()]
+    assert narrow.headers["ETag"] != full.headers["ETag"]
+
+
+def test_sparse_fields_reject_unknown_fields(client: TestClient, admin_auth_headers):
+    for fields in ("id,hashed_password", "password", "version"):
+        response = client.get(f"/users?fields={fields}", headers=admin_auth_headers)
+        assert response.status_code == 400
+        assert response.json()["detail"].startswith("Campos inválidos")
+    response = client.get(
+        "/users/search?query=user&fields=senha", headers=admin_auth_headers
+    )
+    assert response.status_code == 400
+
+
+def test_search_users_sparse_fields(
+    client: TestClient, admin_auth_headers, many_users, captured_statements
+):
+    response = client.get(
+        "/users/search?query=example&fields=email", headers=admin_auth_headers
+    )
+    assert response.status_code == 200
+    results = response.json()
+    assert len(results) == 7
+    assert all(list(user) == ["email"] for user in results)
+    search_query = next(q for q in captured_statements if "users_fts" in q)
+    assert "users.nome" not in search_query.split("FROM")[0]
+
+
+def test_create_user_is_a_single_insert(
+    client: TestClient, users_in_db, captured_statements
+):
+    response = client.post(
+        "/users",
+        json={"nome": "Novo", "email": "novo@example.com", "password": "secret"},
+    )
+    assert response.status_code == 201
+    assert response.json()["id"] == 3
+    # INSERT ... RETURNING do usuário e um único upsert dos contadores
+    assert len(captured_statements) == 2
+    assert captured_statements[0].startswith("INSERT INTO users")
+    assert "RETURNING" in captured_statements[0]
+    assert captured_statements[1].startswith("INSERT INTO user_counters")
+
+    captured_statements.clear()
+    response = client.post(
+        "/users",
+        json={"nome": "Outro", "email": "novo@example.com", "password": "secret"},
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Email já está em uso"
+    assert len(captured_statements) == 1
+
+
+def test_create_user_concurrent_signups_same_email(client: TestClient):
+    user_data = UserCreate(nome="Corrida", email="corrida@example.com", password="x")
+
+    async def signup():
+        async with TestingAsyncSessionLocal() as db:
+            try:
+                return (await UserService(db).create_user(user_data)).id
+            except ValueError as e:
+                return str(e)
+
+    async def run():
+        return await asyncio.gather(*(signup() for _ in range(4)))
+
+    results = asyncio.run(run())
+    assert results.count("Email já está em uso") == 3
+    assert sum(isinstance(result, int) for result in results) == 1
+    with TestingSessionLocal() as db:
+        total = db.query(UserCounter).filter_by(name="total").one()
+        assert total.value == 1
+
+
+def test_update_user_is_a_single_update(
+    client: TestClient, user_auth_headers, users_in_db, captured_statements
+):
+    user_id = users_in_db[1]["id"]
+    etag = client.get(f"/users/{user_id}").headers["ETag"]
+
+    captured_statements.clear()
+    response = client.put(
+        f"/users/{user_id}",
+        json={"nome": "Renomeado", "email": "novo@example.com"},
+        headers={**user_auth_headers, "If-Match": etag},
+    )
+    assert response.status_code == 200
+    assert response.json()["email"] == "novo@example.com"
+    assert len(captured_statements) == 1
+    assert captured_statements[0].startswith("UPDATE users")
+    assert "RETURNING" in captured_statements[0]
+
+    # A troca de role lê a role atual para ajustar os contadores
+    captured_statements.clear()
+    response = client.put(
+        f"/users/{user_id}", json={"role": "admin"}, headers=user_auth_headers
+    )
+    assert response.status_code == 200
+    assert len(captured_statements) == 3
+
+
+def test_update_user_duplicate_email_fails(
+    client: TestClient, user_auth_headers, users_in_db
+):
+    user_id = users_in_db[1]["id"]
+    response = client.put(
+        f"/users/{user_id}",
+        json={"email": users_in_db[0]["email"]},
+        headers=user_auth_headers,
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Email já está em uso"
+    assert client.get(f"/users/{user_id}").json()["email"] == "user@example.com"
+
+
+def test_delete_user_is_a_single_delete(
+    client: TestClient, admin_auth_headers, users_in_db, captured_statements
+):
+    user_id = users_in_db[1]["id"]
+    response = client.delete(f"/users/{user_id}", headers=admin_auth_headers)
+    assert response.status_code == 200
+    # DELETE ... RETURNING e o upsert dos contadores
+    assert len(captured_statements) == 2
+    assert captured_statements[0].startswith("DELETE FROM users")
+    assert "RETURNING" in captured_statements[0]
+
+    captured_statements.clear()
+    response = client.delete(f"/users/{user_id}", headers=admin_auth_headers)
+    assert response.status_code == 404
+    assert len(captured_statements) == 1
+
+
+def create_replica(path) -> str:
+    """Cria um banco SQLite com um único usuário, identificado pelo arquivo."""
+    url = f"sqlite:///{path}"
+    replica_engine = create_engine(url)
+    Base.metadata.create_all(bind=replica_engine)
+    with Session(replica_engine) as session:
+        session.add(
+            User(
+                nome=f"Réplica {path.stem}",
+                email=f"{path.stem}@replica.example.com",
+                hashed_password="x",
+            )
+        )
+        session.commit()
+    replica_engine.dispose()
+    return url
+
+
+@pytest.fixture
+def use_replicas(client: TestClient, monkeypatch, tmp_path):
+    """Configura as réplicas de leitura com as URLs dadas."""
+    replica_sets = []
+
+    def configure(*urls):
+        replicas = database.ReplicaSet(list(urls))
+        replica_sets.append(replicas)
+        monkeypatch.setattr(database, "replica_set", replicas)
+        return replicas
+
+    yield configure
+    for replicas in replica_sets:
+        client.portal.call(replicas.dispose)
+
+
+def listed_names(client: TestClient, headers: dict) -> list:
+    response = client.get("/users/", params={"fields": "nome"}, headers=headers)
+    assert response.status_code == 200
+    return [user["nome"] for user in response.json()]
+
+
+def test_reads_are_spread_across_replicas(
+    client: TestClient, admin_auth_headers, use_replicas, tmp_path
+):
+    replicas = use_replicas(
+        create_replica(tmp_path / "a.db"), create_replica(tmp_path / "b.db")
+    )
+
+    served = [listed_names(client, admin_auth_headers) for _ in range(4)]
+    assert sorted(map(tuple, served)) == [
+        ("Réplica a",),
+        ("Réplica a",),
+        ("Réplica b",),
+        ("Réplica b",),
+    ]
+    assert served[0] != served[1]
+    assert [replica["reads"] for replica in replicas.stats()["replicas"]] == [2, 2]
+
+    # Com o cabeçalho, a leitura vai para o primário
+    response = client.get(
+        "/users/count",
+        headers={**admin_auth_headers, database.READ_CONSISTENCY_HEADER: "strong"},
+    )
+    assert response.json() == 2
+
+
+def test_reads_after_a_write_use_the_primary(
+    client: TestClient,
+    admin_auth_headers,
+    user_auth_headers,
+    users_in_db,
+    use_replicas,
+    tmp_path,
+):
+    replicas = use_replicas(create_replica(tmp_path / "a.db"))
+    user_id = users_in_db[1]["id"]
+
+    response = client.put(
+        f"/users/{user_id}", json={"nome": "Renomeado"}, headers=user_auth_headers
+    )
+    assert response.status_code == 200
+    # Quem escreveu lê a própria escrita; os demais clientes leem da réplica
+    response = client.get(f"/users/{user_id}", headers=user_auth_headers)
+    assert response.json()["nome"] == "Renomeado"
+    assert listed_names(client, admin_auth_headers) == ["Réplica a"]
+
+    strong = {**admin_auth_headers, database.READ_CONSISTENCY_HEADER: "strong"}
+    assert listed_names(client, strong) == ["Admin User", "Renomeado"]
+    assert replicas.stats()["primary_reads"] == 2
+    assert replicas.stats()["recent_writers"] == 1
+
+
+def test_replica_reads_do_not_fill_the_user_cache(
+    client: TestClient,
+    admin_auth_headers,
+    user_auth_headers,
+    users_in_db,
+    use_replicas,
+    tmp_path,
+):
+    user_id = users_in_db[1]["id"]
+    # Réplica atrasada: ainda tem o usuário com o nome anterior
+    url = f"sqlite:///{tmp_path / 'lagging.db'}"
+    replica_engine = create_engine(url)
+    Base.metadata.create_all(bind=replica_engine)
+    with Session(replica_engine) as session:
+        session.add(
+            User(
+                id=user_id,
+                nome="Common User",
+                email="user@example.com",
+                hashed_password="x",
+            )
+        )
+        session.commit()
+    replica_engine.dispose()
+    use_replicas(url)
+
+    response = client.put(
+        f"/users/{user_id}", json={"nome": "Renomeado"}, headers=user_auth_headers
+    )
+    assert response.status_code == 200
+    # Outro cliente lê da réplica e recebe a linha antiga...
+    response = client.get(f"/users/{user_id}", headers=admin_auth_headers)
+    assert response.json()["nome"] == "Common User"
+    # ...sem que ela chegue ao cache usado por quem lê do primário
+    response = client.get(f"/users/{user_id}", headers=user_auth_headers)
+    assert response.json()["nome"] == "Renomeado"
+
+    # Depois de preenchido pelo primário, o cache também atende a réplica
+    response = client.get(f"/users/{user_id}", headers=admin_auth_headers)
+    assert response.json()["nome"] == "Renomeado"
+
+
+def test_reads_fail_over_to_the_next_replica(
+    client: TestClient, admin_auth_headers, use_replicas, tmp_path
+):
+    # O diretório não existe, então o SQLite não consegue abrir o arquivo
+    unavailable = f"sqlite:///{tmp_path / 'offline' / 'replica.db'}"
+    replicas = use_replicas(unavailable, create_replica(tmp_path / "a.db"))
+
+    for _ in range(3):
+        assert listed_names(client, admin_auth_headers) == ["Réplica a"]
+    stats = replicas.stats()["replicas"]
+    assert stats[0]["available"] is False
+    assert stats[0]["failures"] == 1
+    assert stats[1]["reads"] == 3
+
+    # Sem nenhuma réplica disponível, as leituras voltam para o primário
+    replicas = use_replicas(unavailable)
+    assert listed_names(client, admin_auth_headers) == ["Admin User", "Common User"]
+    assert client.get("/health").json()["status"] == "healthy"
+    assert replicas.stats()["primary_reads"] == 2